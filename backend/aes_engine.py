@@ -0,0 +1,344 @@
+# INTEGER AES ENGINE
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from backend.aes_tables import (SBOX, INV_SBOX, RCON, TE0, TE1, TE2, TE3, TD0, TD1, TD2, TD3,
+                                SBOX_NP, INV_SBOX_NP, TE_NP, TD_NP)
+
+# Number of blocks processed per vectorized pass (keeps the temporaries cache-resident)
+BATCH_BLOCKS = 1 << 14
+
+"""
+AES-128 engine that keeps the state and the round keys as integers.
+
+The `Encryption` class in aes.py stores every byte as an 8-bit binary string and parses it
+on each step. This engine works on 32-bit column words and precomputed T-tables instead,
+so a block costs a few hundred table lookups.
+
+Byte layout:
+- Raw `bytes` keys and blocks follow the FIPS-197 byte order (byte i is row i % 4, column i // 4).
+- 4x4 matrices follow the `Encryption` layout (each column is a word), either as
+  8-bit binary strings or as integers. Strings are only parsed and formatted at this boundary.
+- Batches are (N, 16) uint8 arrays of FIPS-197 ordered blocks or (N, 4, 4) uint8 arrays of
+  matrices in the `Encryption` layout (e.g. the output of `dna_utils.encode_blocks`).
+
+An engine is the cipher context for one key: the key is expanded once in the constructor and
+never modified afterwards, so one instance can be shared across blocks, sequences and threads.
+Use `get_context` to reuse the instance for a key that has been seen before.
+"""
+class AESEngine:
+    def __init__(self, key):
+        self.key = _to_block_bytes(key) # Key in FIPS-197 byte order
+
+        # Expand the key once into 44 encryption words and 44 equivalent-inverse-cipher words
+        self.round_words = _expand_key(self.key)
+        self.inv_round_words = _invert_key_schedule(self.round_words)
+
+        # Round keys as (11, 4) uint32 arrays for the batched API
+        self.round_words_np = np.array(self.round_words, dtype=np.uint32).reshape(11, 4)
+        self.inv_round_words_np = np.array(self.inv_round_words, dtype=np.uint32).reshape(11, 4)
+        self.round_words_np.setflags(write=False)
+        self.inv_round_words_np.setflags(write=False)
+
+    def round_key_matrices(self):
+        """
+        Return the 11 round keys as 4x4 uint8 matrices in the `Encryption` layout
+        """
+        words = self.round_words_np
+        shifts = np.array([24, 16, 8, 0], dtype=np.uint32)
+        # matrix[r, c] is byte r of word c
+        return ((words[:, np.newaxis, :] >> shifts[np.newaxis, :, np.newaxis]) & 0xFF).astype(np.uint8)
+
+    def encrypt_block(self, block):
+        """
+        Encrypt one 16-byte block given in FIPS-197 byte order
+        """
+        rk = self.round_words
+        s0, s1, s2, s3 = _block_to_words(block)
+        s0 ^= rk[0]
+        s1 ^= rk[1]
+        s2 ^= rk[2]
+        s3 ^= rk[3]
+
+        # 9 full rounds: SubBytes + ShiftRows + MixColumns through the T-tables, then AddRoundKey
+        for i in range(4, 40, 4):
+            t0 = TE0[s0 >> 24] ^ TE1[(s1 >> 16) & 0xFF] ^ TE2[(s2 >> 8) & 0xFF] ^ TE3[s3 & 0xFF] ^ rk[i]
+            t1 = TE0[s1 >> 24] ^ TE1[(s2 >> 16) & 0xFF] ^ TE2[(s3 >> 8) & 0xFF] ^ TE3[s0 & 0xFF] ^ rk[i + 1]
+            t2 = TE0[s2 >> 24] ^ TE1[(s3 >> 16) & 0xFF] ^ TE2[(s0 >> 8) & 0xFF] ^ TE3[s1 & 0xFF] ^ rk[i + 2]
+            t3 = TE0[s3 >> 24] ^ TE1[(s0 >> 16) & 0xFF] ^ TE2[(s1 >> 8) & 0xFF] ^ TE3[s2 & 0xFF] ^ rk[i + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+
+        # Last round (no MixColumns)
+        return _words_to_block((
+            _sub_shift(SBOX, s0, s1, s2, s3) ^ rk[40],
+            _sub_shift(SBOX, s1, s2, s3, s0) ^ rk[41],
+            _sub_shift(SBOX, s2, s3, s0, s1) ^ rk[42],
+            _sub_shift(SBOX, s3, s0, s1, s2) ^ rk[43],
+        ))
+
+    def decrypt_block(self, block):
+        """
+        Decrypt one 16-byte block given in FIPS-197 byte order (equivalent inverse cipher)
+        """
+        dk = self.inv_round_words
+        s0, s1, s2, s3 = _block_to_words(block)
+        s0 ^= dk[0]
+        s1 ^= dk[1]
+        s2 ^= dk[2]
+        s3 ^= dk[3]
+
+        # 9 full inverse rounds: InvSubBytes + InvShiftRows + InvMixColumns, then AddRoundKey
+        for i in range(4, 40, 4):
+            t0 = TD0[s0 >> 24] ^ TD1[(s3 >> 16) & 0xFF] ^ TD2[(s2 >> 8) & 0xFF] ^ TD3[s1 & 0xFF] ^ dk[i]
+            t1 = TD0[s1 >> 24] ^ TD1[(s0 >> 16) & 0xFF] ^ TD2[(s3 >> 8) & 0xFF] ^ TD3[s2 & 0xFF] ^ dk[i + 1]
+            t2 = TD0[s2 >> 24] ^ TD1[(s1 >> 16) & 0xFF] ^ TD2[(s0 >> 8) & 0xFF] ^ TD3[s3 & 0xFF] ^ dk[i + 2]
+            t3 = TD0[s3 >> 24] ^ TD1[(s2 >> 16) & 0xFF] ^ TD2[(s1 >> 8) & 0xFF] ^ TD3[s0 & 0xFF] ^ dk[i + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+
+        # Last round (no InvMixColumns)
+        return _words_to_block((
+            _sub_shift(INV_SBOX, s0, s3, s2, s1) ^ dk[40],
+            _sub_shift(INV_SBOX, s1, s0, s3, s2) ^ dk[41],
+            _sub_shift(INV_SBOX, s2, s1, s0, s3) ^ dk[42],
+            _sub_shift(INV_SBOX, s3, s2, s1, s0) ^ dk[43],
+        ))
+
+    def encrypt(self, state):
+        """
+        Encrypt a 4x4 state matrix in the `Encryption` layout.
+        Binary-string matrices come back as binary strings, integer matrices as uint8.
+        """
+        return _from_block_bytes(self.encrypt_block(_to_block_bytes(state)), state)
+
+    def decrypt(self, state):
+        """
+        Decrypt a 4x4 state matrix in the `Encryption` layout.
+        """
+        return _from_block_bytes(self.decrypt_block(_to_block_bytes(state)), state)
+
+    def encrypt_blocks(self, blocks):
+        """
+        Encrypt N blocks at once. Every round runs across all blocks with numpy gathers and XORs.
+        Returns an array with the same shape as `blocks`.
+        """
+        return _run_blocks(blocks, self._encrypt_words)
+
+    def decrypt_blocks(self, blocks):
+        """
+        Decrypt N blocks at once (inverse of `encrypt_blocks`).
+        """
+        return _run_blocks(blocks, self._decrypt_words)
+
+    def _encrypt_words(self, words):
+        # words: (n, 4) uint32 column words
+        rk = self.round_words_np
+        s0, s1, s2, s3 = (words ^ rk[0]).T
+        for round_num in range(1, 10):
+            t0 = TE_NP[0, s0 >> 24] ^ TE_NP[1, (s1 >> 16) & 0xFF] ^ TE_NP[2, (s2 >> 8) & 0xFF] ^ TE_NP[3, s3 & 0xFF]
+            t1 = TE_NP[0, s1 >> 24] ^ TE_NP[1, (s2 >> 16) & 0xFF] ^ TE_NP[2, (s3 >> 8) & 0xFF] ^ TE_NP[3, s0 & 0xFF]
+            t2 = TE_NP[0, s2 >> 24] ^ TE_NP[1, (s3 >> 16) & 0xFF] ^ TE_NP[2, (s0 >> 8) & 0xFF] ^ TE_NP[3, s1 & 0xFF]
+            t3 = TE_NP[0, s3 >> 24] ^ TE_NP[1, (s0 >> 16) & 0xFF] ^ TE_NP[2, (s1 >> 8) & 0xFF] ^ TE_NP[3, s2 & 0xFF]
+            key = rk[round_num]
+            s0, s1, s2, s3 = t0 ^ key[0], t1 ^ key[1], t2 ^ key[2], t3 ^ key[3]
+
+        return np.stack([
+            _sub_shift_np(SBOX_NP, s0, s1, s2, s3),
+            _sub_shift_np(SBOX_NP, s1, s2, s3, s0),
+            _sub_shift_np(SBOX_NP, s2, s3, s0, s1),
+            _sub_shift_np(SBOX_NP, s3, s0, s1, s2),
+        ], axis=1) ^ rk[10]
+
+    def _decrypt_words(self, words):
+        dk = self.inv_round_words_np
+        s0, s1, s2, s3 = (words ^ dk[0]).T
+        for round_num in range(1, 10):
+            t0 = TD_NP[0, s0 >> 24] ^ TD_NP[1, (s3 >> 16) & 0xFF] ^ TD_NP[2, (s2 >> 8) & 0xFF] ^ TD_NP[3, s1 & 0xFF]
+            t1 = TD_NP[0, s1 >> 24] ^ TD_NP[1, (s0 >> 16) & 0xFF] ^ TD_NP[2, (s3 >> 8) & 0xFF] ^ TD_NP[3, s2 & 0xFF]
+            t2 = TD_NP[0, s2 >> 24] ^ TD_NP[1, (s1 >> 16) & 0xFF] ^ TD_NP[2, (s0 >> 8) & 0xFF] ^ TD_NP[3, s3 & 0xFF]
+            t3 = TD_NP[0, s3 >> 24] ^ TD_NP[1, (s2 >> 16) & 0xFF] ^ TD_NP[2, (s1 >> 8) & 0xFF] ^ TD_NP[3, s0 & 0xFF]
+            key = dk[round_num]
+            s0, s1, s2, s3 = t0 ^ key[0], t1 ^ key[1], t2 ^ key[2], t3 ^ key[3]
+
+        return np.stack([
+            _sub_shift_np(INV_SBOX_NP, s0, s3, s2, s1),
+            _sub_shift_np(INV_SBOX_NP, s1, s0, s3, s2),
+            _sub_shift_np(INV_SBOX_NP, s2, s1, s0, s3),
+            _sub_shift_np(INV_SBOX_NP, s3, s2, s1, s0),
+        ], axis=1) ^ dk[10]
+
+
+class ContextCache:
+    """
+    Bounded LRU cache of expanded AES keys, keyed by the 16 key bytes.
+    Safe to share between threads; hit and miss counts are kept for monitoring.
+    `factory` builds the context of a key (another cipher backend, see ciphers.py).
+    """
+    def __init__(self, maxsize=128, factory=AESEngine):
+        self.maxsize = maxsize
+        self.factory = factory
+        self.hits = 0
+        self.misses = 0
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the context (`AESEngine`) for `key` (bytes or 4x4 matrix), expanding it only on a miss
+        """
+        key_bytes = _to_block_bytes(key)
+        with self._lock:
+            context = self._contexts.get(key_bytes)
+            if context is not None:
+                self._contexts.move_to_end(key_bytes) # Mark as most recently used
+                self.hits += 1
+                return context
+            self.misses += 1
+
+        # Expand outside the lock so other keys are not blocked
+        context = self.factory(key_bytes)
+        with self._lock:
+            context = self._contexts.setdefault(key_bytes, context)
+            self._contexts.move_to_end(key_bytes)
+            while len(self._contexts) > self.maxsize:
+                self._contexts.popitem(last=False) # Evict the least recently used key
+        return context
+
+    def stats(self):
+        """
+        Return the cache counters as a dictionary
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._contexts), 'maxsize': self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._contexts.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Process-wide cache used by `get_context`
+context_cache = ContextCache()
+
+
+def get_context(key):
+    """
+    Return the shared, already-expanded `AESEngine` for `key`
+    """
+    return context_cache.get(key)
+
+
+def _run_blocks(blocks, transform):
+    """
+    Convert a batch of blocks to column words, apply `transform` slice by slice and convert back
+    """
+    blocks = np.asarray(blocks, dtype=np.uint8)
+    if blocks.ndim == 3 and blocks.shape[1:] == (4, 4):
+        flat = blocks.transpose(0, 2, 1).reshape(-1, 16) # Matrix columns -> FIPS-197 byte order
+    elif blocks.ndim == 2 and blocks.shape[1] == 16:
+        flat = np.ascontiguousarray(blocks)
+    else:
+        raise ValueError(f"expected an (N, 16) or (N, 4, 4) array of blocks, got shape {blocks.shape}")
+
+    words = flat.view('>u4').astype(np.uint32)
+    out = np.empty_like(words)
+    for start in range(0, len(words), BATCH_BLOCKS):
+        out[start:start + BATCH_BLOCKS] = transform(words[start:start + BATCH_BLOCKS])
+
+    result = out.astype('>u4').view(np.uint8).reshape(-1, 16)
+    if blocks.ndim == 3:
+        return np.ascontiguousarray(result.reshape(-1, 4, 4).transpose(0, 2, 1))
+    return result
+
+
+def _sub_shift_np(box, w0, w1, w2, w3):
+    # Vectorized `_sub_shift` over arrays of words
+    return ((box[w0 >> 24] << 24) | (box[(w1 >> 16) & 0xFF] << 16) |
+            (box[(w2 >> 8) & 0xFF] << 8) | box[w3 & 0xFF])
+
+
+def _expand_key(key):
+    """
+    AES-128 key expansion on 32-bit words
+        - RotWord + SubWord + Rcon on every 4th word
+        - XOR with the word four positions back
+    """
+    words = list(_block_to_words(key))
+    for i in range(4, 44):
+        temp = words[i - 1]
+        if i % 4 == 0:
+            temp = ((temp << 8) | (temp >> 24)) & 0xFFFFFFFF # RotWord
+            temp = _sub_word(temp) ^ (RCON[i // 4 - 1] << 24) # SubWord + Rcon
+        words.append(words[i - 4] ^ temp)
+    return tuple(words)
+
+
+def _invert_key_schedule(words):
+    """
+    Build the decryption key schedule for the equivalent inverse cipher:
+    round keys in reverse order with InvMixColumns applied to the 9 middle round keys
+    """
+    inv_words = []
+    for round_num in range(10, -1, -1):
+        for word in words[4 * round_num:4 * round_num + 4]:
+            if 0 < round_num < 10:
+                # TD tables apply InvSubBytes first, so undo it with the S-box
+                word = (TD0[SBOX[word >> 24]] ^ TD1[SBOX[(word >> 16) & 0xFF]] ^
+                        TD2[SBOX[(word >> 8) & 0xFF]] ^ TD3[SBOX[word & 0xFF]])
+            inv_words.append(word)
+    return tuple(inv_words)
+
+
+def _sub_word(word):
+    return ((SBOX[word >> 24] << 24) | (SBOX[(word >> 16) & 0xFF] << 16) |
+            (SBOX[(word >> 8) & 0xFF] << 8) | SBOX[word & 0xFF])
+
+
+def _sub_shift(box, w0, w1, w2, w3):
+    # Byte substitution of one output column, taking row i from word wi (ShiftRows)
+    return ((box[w0 >> 24] << 24) | (box[(w1 >> 16) & 0xFF] << 16) |
+            (box[(w2 >> 8) & 0xFF] << 8) | box[w3 & 0xFF])
+
+
+def _block_to_words(block):
+    return tuple(int.from_bytes(block[i:i + 4], 'big') for i in range(0, 16, 4))
+
+
+def _words_to_block(words):
+    return b''.join(word.to_bytes(4, 'big') for word in words)
+
+
+def _to_block_bytes(value):
+    """
+    Convert a key or block to 16 bytes in FIPS-197 order.
+    Accepts bytes-like objects or 4x4 matrices (binary strings or integers) in the `Encryption` layout.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        block = bytes(value)
+        if len(block) != 16:
+            raise ValueError(f"AES-128 expects 16 bytes, got {len(block)}")
+        return block
+
+    matrix = np.asarray(value)
+    if matrix.shape != (4, 4):
+        raise ValueError(f"AES-128 expects a 4x4 matrix, got shape {matrix.shape}")
+    if matrix.dtype.kind in ('U', 'S', 'O'):
+        cells = [[int(cell, 2) for cell in row] for row in matrix]
+    else:
+        cells = matrix.astype(np.uint8).tolist()
+    # Column-major walk: each column of the matrix is one word
+    return bytes(cells[row][col] for col in range(4) for row in range(4))
+
+
+def _from_block_bytes(block, like):
+    """
+    Convert 16 FIPS-197 ordered bytes back to a 4x4 matrix of the same kind as `like`
+    """
+    matrix = np.frombuffer(block, dtype=np.uint8).reshape(4, 4).T
+    if np.asarray(like).dtype.kind in ('U', 'S', 'O'):
+        return np.array([[format(cell, '08b') for cell in row] for row in matrix.tolist()])
+    return matrix.copy()
@@ -0,0 +1,141 @@
+# AES LOOKUP TABLES
+
+import threading
+from types import MappingProxyType
+
+import numpy as np
+
+"""
+Precomputed tables shared by the AES implementations.
+
+All tables are derived from the GF(2^8) field used by AES (reduction polynomial 0x11b):
+- SBOX / INV_SBOX: SubBytes and its inverse
+- MUL2 ... MUL14: multiplication by the MixColumns / InvMixColumns constants, and MUL mapping
+  each constant (1 included) to its table
+- RCON: round constants for the key schedule
+- TE0-TE3 / TD0-TD3: combined SubBytes + ShiftRows + MixColumns tables (T-tables)
+  on 32-bit column words, where the byte in row 0 is the most significant byte
+- SBOX_BITS / INV_SBOX_BITS / RCON_BITS / MIX / INV_MIX: the same data in the 16x16 and
+  4x4 layouts of the reference `Encryption` class (8-bit binary strings)
+
+Importing the module computes nothing. The tables are built together on first attribute
+access (`aes_tables.SBOX` or `from backend.aes_tables import SBOX`), once per process, and are
+immutable: tuples, and numpy arrays with the writeable flag cleared.
+"""
+
+# Round constants (first byte of each Rcon word) for AES-128
+RCON = (0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80, 0x1B, 0x36)
+
+# Names provided by `build_tables`
+TABLE_NAMES = ('SBOX', 'INV_SBOX', 'MUL2', 'MUL3', 'MUL9', 'MUL11', 'MUL13', 'MUL14', 'MUL',
+               'TE0', 'TE1', 'TE2', 'TE3', 'TD0', 'TD1', 'TD2', 'TD3',
+               'SBOX_NP', 'INV_SBOX_NP', 'TE_NP', 'TD_NP',
+               'SBOX_BITS', 'INV_SBOX_BITS', 'RCON_BITS', 'MIX', 'INV_MIX')
+
+_build_lock = threading.Lock()
+
+
+def gf_multiply(a, b):
+    """
+    Multiply two bytes in GF(2^8) (Russian Peasant Multiplication with reduction by 0x11b)
+    """
+    result = 0
+    while b:
+        if b & 1:
+            result ^= a
+        a = ((a << 1) ^ 0x1B) & 0xFF if a & 0x80 else a << 1
+        b >>= 1
+    return result
+
+
+def _build_sbox():
+    """
+    Build the S-box from the multiplicative inverse followed by the AES affine transformation
+    """
+    # Exponent / logarithm tables with generator 3
+    exp = [0] * 255
+    log = [0] * 256
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x = gf_multiply(x, 3)
+
+    sbox = [0] * 256
+    for value in range(256):
+        inv = 0 if value == 0 else exp[(255 - log[value]) % 255]
+        s = inv
+        for shift in range(1, 5):
+            s ^= ((inv << shift) | (inv >> (8 - shift))) & 0xFF
+        sbox[value] = s ^ 0x63
+
+    inv_sbox = [0] * 256
+    for value, substituted in enumerate(sbox):
+        inv_sbox[substituted] = value
+    return tuple(sbox), tuple(inv_sbox)
+
+
+def _rotr(word, bits):
+    return ((word >> bits) | (word << (32 - bits))) & 0xFFFFFFFF
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+def _bits(values, shape):
+    # Object array of 8-bit binary strings (the `Encryption` byte representation)
+    array = np.empty(len(values), dtype=object)
+    array[:] = [format(value, '08b') for value in values]
+    return _read_only(array.reshape(shape))
+
+
+def build_tables():
+    """
+    Compute every table in TABLE_NAMES and return them as a dictionary
+    """
+    sbox, inv_sbox = _build_sbox()
+
+    # Multiplication tables for the MixColumns (2, 3) and InvMixColumns (9, 11, 13, 14) constants
+    mul = {c: tuple(gf_multiply(x, c) for x in range(256)) for c in (2, 3, 9, 11, 13, 14)}
+
+    # Encryption T-tables: TE0[x] is the column (2·S[x], S[x], S[x], 3·S[x])
+    te0 = tuple((mul[2][s] << 24) | (s << 16) | (s << 8) | mul[3][s] for s in sbox)
+    # Decryption T-tables: TD0[x] is the column (14·Si[x], 9·Si[x], 13·Si[x], 11·Si[x])
+    td0 = tuple((mul[14][s] << 24) | (mul[9][s] << 16) | (mul[13][s] << 8) | mul[11][s] for s in inv_sbox)
+    te = (te0,) + tuple(tuple(_rotr(word, bits) for word in te0) for bits in (8, 16, 24))
+    td = (td0,) + tuple(tuple(_rotr(word, bits) for word in td0) for bits in (8, 16, 24))
+
+    tables = {
+        'SBOX': sbox, 'INV_SBOX': inv_sbox,
+        **{f'MUL{c}': table for c, table in mul.items()},
+        'MUL': MappingProxyType({1: tuple(range(256)), **mul}),
+        **{f'TE{i}': table for i, table in enumerate(te)},
+        **{f'TD{i}': table for i, table in enumerate(td)},
+
+        # numpy copies of the tables for vectorized gathers across many blocks
+        'SBOX_NP': _read_only(np.array(sbox, dtype=np.uint32)),
+        'INV_SBOX_NP': _read_only(np.array(inv_sbox, dtype=np.uint32)),
+        'TE_NP': _read_only(np.array(te, dtype=np.uint32)),
+        'TD_NP': _read_only(np.array(td, dtype=np.uint32)),
+
+        # Reference-class layouts: S-boxes indexed [high nibble, low nibble], Rcon words as rows
+        # (with the 11th constant 0x6c) and the MixColumns / InvMixColumns matrices
+        'SBOX_BITS': _bits(sbox, (16, 16)),
+        'INV_SBOX_BITS': _bits(inv_sbox, (16, 16)),
+        'RCON_BITS': _bits([byte for rc in RCON + (0x6C,) for byte in (rc, 0, 0, 0)], (11, 4)),
+        'MIX': _read_only(np.array([np.roll([2, 3, 1, 1], row) for row in range(4)])),
+        'INV_MIX': _read_only(np.array([np.roll([14, 11, 13, 9], row) for row in range(4)])),
+    }
+    return tables
+
+
+def __getattr__(name):
+    # Build all tables on first access and keep them as module globals from then on
+    if name not in TABLE_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _build_lock:
+        if name not in globals():
+            globals().update(build_tables())
+    return globals()[name]
@@ -0,0 +1,343 @@
+# AES CIPHER BACKENDS
+
+import ctypes
+import ctypes.util
+import os
+import threading
+import time
+
+import numpy as np
+
+from backend.aes_engine import AESEngine, ContextCache
+
+"""
+Registry of interchangeable AES-128 block cipher backends and the dispatch between them.
+
+A backend is a loader registered with `@register(name)`. The loader returns a context factory
+(key bytes -> context) or raises OSError when the backend cannot run on this machine. A context
+encrypts and decrypts (N, 16) uint8 arrays of FIPS-197 ordered blocks with `encrypt_blocks` /
+`decrypt_blocks`, which is all CTR mode (modes.py) needs; a context may also provide
+`ctr_process` to run CTR mode natively:
+- 'reference': the `Encryption` class of aes.py, one binary-string block at a time (slow)
+- 'numpy': the vectorized T-table `AESEngine` of aes_engine.py
+- 'libcrypto': AES-128-ECB of the system OpenSSL libcrypto through ctypes (AES-NI when the CPU
+  has it); DNAVAULT_LIBCRYPTO can point to the shared library
+
+The first `get_context` call selects the backend once per process. DNAVAULT_CIPHER names the
+backend to use; otherwise every available backend that passes `check` is timed on a short run
+of blocks and the fastest one wins. Every backend is checked before use against the FIPS-197
+and SP 800-38A known-answer vectors and against the reference backend on random keys and
+blocks, so a broken library is rejected rather than silently producing wrong ciphertext.
+`selection()` reports the decision.
+"""
+
+ENV_BACKEND = 'DNAVAULT_CIPHER'
+ENV_LIBCRYPTO = 'DNAVAULT_LIBCRYPTO'
+
+BACKENDS = {} # name -> loader() returning a context factory
+
+# (key, plaintext, ciphertext): FIPS-197 appendix C.1 and SP 800-38A F.1.1 (ECB-AES128)
+KNOWN_ANSWERS = [
+    ('000102030405060708090a0b0c0d0e0f', '00112233445566778899aabbccddeeff', '69c4e0d86a7b0430d8cdb78070b4c55a'),
+    ('2b7e151628aed2a6abf7158809cf4f3c', '6bc1bee22e409f96e93d7e117393172a', '3ad77bb40d7a3660a89ecaf32466ef97'),
+    ('2b7e151628aed2a6abf7158809cf4f3c', 'ae2d8a571e03ac9c9eb76fac45af8e51', 'f5d3d58503b9699de785895a96fdbaaf'),
+    ('2b7e151628aed2a6abf7158809cf4f3c', '30c81c46a35ce411e5fbc1191a0a52ef', '43b1cd7f598ece23881b00e3ed030688'),
+    ('2b7e151628aed2a6abf7158809cf4f3c', 'f69f2445df4f9b17ad2b417be66c3710', '7b0c785e27e8ad3f8223207104725dd4'),
+]
+CROSS_CHECK_KEYS = 2 # Random keys compared with the reference backend
+CROSS_CHECK_BLOCKS = 8 # Random blocks per key
+TIMING_SECONDS = 0.005 # Minimum timed run per backend during selection
+TIMING_MAX_BLOCKS = 1 << 14
+
+_BITS = np.array([format(value, '08b') for value in range(256)]) # byte -> 8-bit binary string
+
+
+def register(name):
+    """
+    Register a backend loader: loader() -> factory(key) -> context
+    """
+    def add(loader):
+        BACKENDS[name] = loader
+        return loader
+    return add
+
+
+class ReferenceContext:
+    """
+    The `Encryption` class behind the context interface. Round keys are expanded once; every
+    block is converted to a matrix of 8-bit binary strings and back.
+    """
+    def __init__(self, key):
+        from backend import aes
+        self.key = bytes(key)
+        key_matrix = _BITS[np.frombuffer(self.key, dtype=np.uint8).reshape(4, 4).T]
+        self.cipher = aes.Encryption(key_matrix)
+        self.cipher.round_key = key_matrix
+        self.cipher.list_of_round_keys = [key_matrix]
+        for i in range(10):
+            self.cipher.key_expansion(counter=i)
+        self._lock = threading.Lock() # `Encryption` keeps per-call state on the instance
+
+    def encrypt_blocks(self, blocks):
+        def encrypt(state):
+            self.cipher.plaintext = state
+            return self.cipher.encrypt()
+        return self._run(blocks, encrypt)
+
+    def decrypt_blocks(self, blocks):
+        return self._run(blocks, self.cipher.decrypt)
+
+    def _run(self, blocks, transform):
+        blocks = np.asarray(blocks, dtype=np.uint8).reshape(-1, 16)
+        out = np.empty_like(blocks)
+        with self._lock:
+            for i, block in enumerate(blocks):
+                state = transform(_BITS[block.reshape(4, 4).T])
+                out[i] = np.array([int(cell, 2) for cell in state.T.reshape(-1)], dtype=np.uint8)
+        return out
+
+
+class LibcryptoContext:
+    """
+    AES-128-ECB through the EVP interface of OpenSSL's libcrypto. One encryption and one
+    decryption EVP context are initialized per key and reused under a lock. `ctr_process` runs
+    AES-128-CTR in libcrypto instead of building counter blocks in numpy.
+    """
+    MAX_UPDATE = 1 << 24 # Bytes per EVP update call (the length argument is a C int)
+
+    def __init__(self, lib, key):
+        self.lib = lib
+        self.key = bytes(key)
+        if len(self.key) != 16:
+            raise ValueError(f"AES-128 expects 16 bytes, got {len(self.key)}")
+        self._lock = threading.Lock()
+        self._contexts = []
+        self._encrypt = self._new_context(lib.EVP_EncryptInit_ex)
+        self._decrypt = self._new_context(lib.EVP_DecryptInit_ex)
+
+    def _new_context(self, init):
+        context = self.lib.EVP_CIPHER_CTX_new()
+        if not context:
+            raise MemoryError("EVP_CIPHER_CTX_new failed")
+        self._contexts.append(context)
+        if init(context, self.lib.EVP_aes_128_ecb(), None, self.key, None) != 1:
+            raise OSError("EVP cipher initialization failed")
+        self.lib.EVP_CIPHER_CTX_set_padding(context, 0)
+        return context
+
+    def encrypt_blocks(self, blocks):
+        return self._run(blocks, self._encrypt, self.lib.EVP_EncryptUpdate)
+
+    def decrypt_blocks(self, blocks):
+        return self._run(blocks, self._decrypt, self.lib.EVP_DecryptUpdate)
+
+    def ctr_process(self, counter, skip, data):
+        """
+        XOR `data` (a uint8 array) with the CTR keystream that starts `skip` bytes into the
+        block of the 16-byte `counter`. The counter is incremented as a 128-bit integer, which
+        matches modes.py as long as its 64-bit block index does not wrap.
+        """
+        context = self.lib.EVP_CIPHER_CTX_new()
+        if not context:
+            raise MemoryError("EVP_CIPHER_CTX_new failed")
+        try:
+            if self.lib.EVP_EncryptInit_ex(context, self.lib.EVP_aes_128_ctr(), None, self.key, counter) != 1:
+                raise OSError("EVP cipher initialization failed")
+            if skip:
+                self._update(context, self.lib.EVP_EncryptUpdate, np.zeros(skip, dtype=np.uint8))
+            return self._update(context, self.lib.EVP_EncryptUpdate, np.ascontiguousarray(data, dtype=np.uint8))
+        finally:
+            self.lib.EVP_CIPHER_CTX_free(context)
+
+    def _run(self, blocks, context, update):
+        blocks = np.ascontiguousarray(blocks, dtype=np.uint8).reshape(-1, 16)
+        with self._lock:
+            return self._update(context, update, blocks)
+
+    def _update(self, context, update, data):
+        out = np.empty_like(data)
+        written = ctypes.c_int()
+        for start in range(0, data.nbytes, self.MAX_UPDATE):
+            size = min(self.MAX_UPDATE, data.nbytes - start)
+            if update(context, out.ctypes.data + start, ctypes.byref(written),
+                      data.ctypes.data + start, size) != 1 or written.value != size:
+                raise OSError("EVP cipher update failed")
+        return out
+
+    def __del__(self):
+        for context in getattr(self, '_contexts', ()):
+            self.lib.EVP_CIPHER_CTX_free(context)
+
+
+@register('reference')
+def _load_reference():
+    return ReferenceContext
+
+
+@register('numpy')
+def _load_numpy():
+    return AESEngine
+
+
+@register('libcrypto')
+def _load_libcrypto():
+    lib = _open_libcrypto()
+    return lambda key: LibcryptoContext(lib, key)
+
+
+def _open_libcrypto():
+    # Load libcrypto and declare the EVP functions used by LibcryptoContext
+    path = os.environ.get(ENV_LIBCRYPTO) or ctypes.util.find_library('crypto')
+    if not path:
+        raise OSError("libcrypto not found")
+    lib = ctypes.CDLL(path)
+    pointer, integer = ctypes.c_void_p, ctypes.c_int
+    lib.EVP_CIPHER_CTX_new.restype = pointer
+    lib.EVP_CIPHER_CTX_new.argtypes = []
+    lib.EVP_CIPHER_CTX_free.argtypes = [pointer]
+    lib.EVP_CIPHER_CTX_set_padding.argtypes = [pointer, integer]
+    for cipher in (lib.EVP_aes_128_ecb, lib.EVP_aes_128_ctr):
+        cipher.restype = pointer
+        cipher.argtypes = []
+    for init in (lib.EVP_EncryptInit_ex, lib.EVP_DecryptInit_ex):
+        init.restype = integer
+        init.argtypes = [pointer, pointer, pointer, ctypes.c_char_p, ctypes.c_char_p]
+    for update in (lib.EVP_EncryptUpdate, lib.EVP_DecryptUpdate):
+        update.restype = integer
+        update.argtypes = [pointer, pointer, ctypes.POINTER(integer), pointer, integer]
+    return lib
+
+
+def check(factory, reference=None):
+    """
+    Return None if the contexts made by `factory` reproduce the known-answer vectors, agree with
+    their own block cipher in native CTR mode and, given a `reference` factory, match its output
+    on random keys and blocks; otherwise a description of the failure
+    """
+    for key, plaintext, ciphertext in KNOWN_ANSWERS:
+        context = factory(bytes.fromhex(key))
+        block = np.frombuffer(bytes.fromhex(plaintext), dtype=np.uint8).reshape(1, 16)
+        if context.encrypt_blocks(block).tobytes().hex() != ciphertext:
+            return f"known-answer encryption mismatch for key {key}"
+        if context.decrypt_blocks(np.frombuffer(bytes.fromhex(ciphertext), dtype=np.uint8).reshape(1, 16)).tobytes().hex() != plaintext:
+            return f"known-answer decryption mismatch for key {key}"
+    context = factory(bytes(16))
+    if hasattr(context, 'ctr_process'):
+        # Native CTR must match the keystream of the block cipher, across a counter byte carry
+        counters = np.zeros((4, 16), dtype=np.uint8)
+        counters[:, 8:] = (np.arange(4, dtype=np.uint64) + np.uint64(0xFE)).astype('>u8').view(np.uint8).reshape(4, 8)
+        data = np.arange(61, dtype=np.uint8)
+        expected = data ^ context.encrypt_blocks(counters).reshape(-1)[3:64]
+        if not np.array_equal(context.ctr_process(counters[0].tobytes(), 3, data), expected):
+            return "native CTR mode differs from the block cipher"
+    if reference is not None:
+        rng = np.random.default_rng(0)
+        for _ in range(CROSS_CHECK_KEYS):
+            key = rng.integers(0, 256, 16, dtype=np.uint8).tobytes()
+            blocks = rng.integers(0, 256, (CROSS_CHECK_BLOCKS, 16), dtype=np.uint8)
+            if not np.array_equal(factory(key).encrypt_blocks(blocks), reference(key).encrypt_blocks(blocks)):
+                return f"differs from the reference backend for key {key.hex()}"
+    return None
+
+
+def measure(factory):
+    """
+    Blocks per second of one context encrypting a batch, doubling the batch until the run
+    takes at least TIMING_SECONDS
+    """
+    context = factory(bytes(16))
+    count = 16
+    while True:
+        blocks = np.zeros((count, 16), dtype=np.uint8)
+        context.encrypt_blocks(blocks[:1]) # Warm-up (lazy tables)
+        started = time.perf_counter()
+        context.encrypt_blocks(blocks)
+        elapsed = time.perf_counter() - started
+        if elapsed >= TIMING_SECONDS or count >= TIMING_MAX_BLOCKS:
+            return count / max(elapsed, 1e-9)
+        count *= 2
+
+
+def select(name=None):
+    """
+    Choose the backend used by `get_context`: `name`, else the DNAVAULT_CIPHER override, else
+    the fastest available backend that passes `check`. Returns the selection report.
+    """
+    global _selection
+    name = name or os.environ.get(ENV_BACKEND) or None
+    if name is not None and name not in BACKENDS:
+        raise ValueError(f"unknown cipher backend {name!r} (choose from {', '.join(BACKENDS)})")
+
+    report = {'backend': None, 'reason': None, 'blocks_per_s': {}, 'rejected': {}}
+    factories = {}
+    reference = BACKENDS['reference']()
+    for candidate in ([name] if name else BACKENDS):
+        try:
+            factory = BACKENDS[candidate]()
+        except OSError as error:
+            report['rejected'][candidate] = f"unavailable: {error}"
+            continue
+        failure = check(factory, None if candidate == 'reference' else reference)
+        if failure:
+            report['rejected'][candidate] = f"failed self-test: {failure}"
+            continue
+        factories[candidate] = factory
+        if not name:
+            report['blocks_per_s'][candidate] = measure(factory)
+
+    if name:
+        if name not in factories:
+            raise RuntimeError(f"cipher backend {name!r} cannot be used: {report['rejected'][name]}")
+        report['backend'], report['reason'] = name, 'configured'
+    else:
+        report['backend'] = max(report['blocks_per_s'], key=report['blocks_per_s'].get)
+        report['reason'] = 'fastest'
+    with _lock:
+        _selection = (report, ContextCache(factory=factories[report['backend']]))
+    return report
+
+
+def selection():
+    """
+    The active selection report (selecting a backend on first use): backend name, reason
+    ('configured' or 'fastest'), measured blocks/s and rejected backends with the cause
+    """
+    return _selected()[0]
+
+
+def describe():
+    """
+    One-line summary of the selection report
+    """
+    report = selection()
+    line = f"{report['backend']} ({report['reason']})"
+    if report['blocks_per_s']:
+        line += '; ' + ', '.join(f"{name} {rate:,.0f} blocks/s" for name, rate in report['blocks_per_s'].items())
+    if report['rejected']:
+        line += '; ' + ', '.join(f"{name} {reason}" for name, reason in report['rejected'].items())
+    return line
+
+
+def get_context(key):
+    """
+    Return the shared cipher context for `key` from the selected backend
+    """
+    return _selected()[1].get(key)
+
+
+# (selection report, context cache of the selected backend), set on first use
+_selection = None
+_lock = threading.Lock()
+
+
+def _selected():
+    if _selection is None:
+        select()
+    return _selection
+
+
+"""
+Check and time every backend, then report the automatic choice
+"""
+if __name__ == "__main__":
+    print(f"Selected: {describe()}")
@@ -0,0 +1,699 @@
+# BINARY CIPHERTEXT CONTAINER
+
+import hmac
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from backend import compression
+from backend import instrument
+from backend import integrity
+from backend.sidetable import SideTable, SIDE_SECTION, POINTER
+from backend.dna_utils import UNPACK_ASCII, UNPACK_CODES, dna_utils, pack_codes
+from backend.modes import CTRMode
+
+"""
+Compact binary container for encrypted DNA records (replaces the text encrypted_output.txt).
+
+File layout (all integers little-endian):
+
+    preamble   16 bytes   magic b'DNAV', format version (u16), 10 reserved bytes
+    payload    ciphertext of every record, back to back
+    header     sections: tag (4 bytes), length (u64), data
+    trailer    16 bytes   header offset (u64), header length (u32), magic b'DNAV'
+
+The header is written after the payload, once every record is known, so records can be
+streamed straight to disk. `update_header` appends a new header and trailer instead of
+rewriting the old ones, so the ciphertext never moves and an interrupted update leaves the
+previous header intact; the payload ends where b'PLEN' says, not at the header.
+
+Header sections:
+    b'MODE'   cipher mode (u8) followed by the CTR nonce
+    b'KEMC'   Kyber ciphertext needed to recover the AES key
+    b'PLEN'   payload length in bytes (u64)
+    b'RECS'   record table: offset and size in the packed stream, and length (bases) per record, u64 each
+    b'NAME'   record names (UTF-8, newline separated)
+    b'BTCH'   optional batch table: records per batch and the length of every record (see below)
+    b'MACS'   integrity: chunk size, Merkle root, HMAC tag of every payload chunk and of the index
+              (see integrity.py)
+    b'WRAP'   optional key envelope: the data key wrapped for each recipient (see envelope.py)
+    b'CMPR'   optional compression: codec, block size and stored size of every block (see compression.py)
+    b'SIDE'   optional pointer to the encrypted side table of non-ACGT bases (see sidetable.py)
+
+Every section except b'MACS' and b'WRAP' (the only one `update_header` rewrites) belongs to
+the index and is authenticated by the index tag in b'MACS' (`encode_index`).
+
+Records are packed DNA (4 bases per byte, see `dna_utils.pack`) concatenated into one packed
+stream, which is encrypted with AES-CTR at the same offsets, so each record can be decrypted on
+its own. Without compression the payload is the encrypted packed stream itself.
+
+RECS and NAME form the persistent index: base i of record r is in packed byte
+offset[r] + i // 4, and CTR mode can start decrypting at any byte, so `read_region` and
+`LazySequence` decrypt only the bytes covering the requested bases.
+
+With compression (format version 2) the payload holds the compressed blocks of every record in
+order, each encrypted at the packed offset of its first byte; a region read decrypts and
+decompresses only the blocks covering the requested bases.
+
+Batch containers hold many short records (reads) back to back at base granularity: each RECS
+row is then a batch, packed as one stream and padded only at its end, and b'BTCH' lists how
+many records every batch holds and their lengths, in the narrowest unsigned integer type that
+fits (`encode_batches`). A record starts where the previous record of its batch ends.
+
+IUPAC codes ('N' gaps) and soft-masked lowercase bases are packed as 'A' and listed in a side
+table (format version 3), which is encrypted as the last part of the payload, after all
+records, so the chunk MACs authenticate it too. Region reads patch it back into the bases.
+"""
+
+MAGIC = b'DNAV'
+VERSION = 3 # 2: compressed payloads (b'CMPR'), 3: side table (b'SIDE'); plain containers are written as 1
+PREAMBLE = struct.Struct('<4sH10x')
+TRAILER = struct.Struct('<QI4s')
+SECTION = struct.Struct('<4sQ')
+
+MODE_CTR = 1
+
+RECORD_DTYPE = np.dtype([('offset', '<u8'), ('size', '<u8'), ('length', '<u8')])
+
+BATCH_SECTION = b'BTCH'
+BATCH = struct.Struct('<BQ') # byte width of the record lengths, number of batches
+
+PAYLOAD_SECTION = b'PLEN'
+PAYLOAD = struct.Struct('<Q') # payload length
+
+# Sections covered by the index tag, in the order they are authenticated
+INDEX_SECTIONS = (b'MODE', b'KEMC', PAYLOAD_SECTION, b'RECS', b'NAME', BATCH_SECTION, b'CMPR', SIDE_SECTION)
+
+
+def encode_header(sections):
+    """
+    Serialize a {tag: bytes} dictionary of header sections
+    """
+    return b''.join(SECTION.pack(tag, len(data)) + bytes(data) for tag, data in sections.items())
+
+
+def decode_header(buffer):
+    """
+    Parse header sections into a {tag: memoryview} dictionary (no copies)
+    """
+    sections = {}
+    position = 0
+    while position < len(buffer):
+        tag, length = SECTION.unpack_from(buffer, position)
+        position += SECTION.size
+        sections[tag] = buffer[position:position + length]
+        position += length
+    return sections
+
+
+def encode_index(sections):
+    """
+    Serialize the index sections present in `sections` for the index tag
+    """
+    return encode_header({tag: sections[tag] for tag in INDEX_SECTIONS if tag in sections})
+
+
+def encode_batches(counts, lengths):
+    """
+    Serialize a batch table: records per batch (u64) and record lengths (1, 2, 4 or 8 bytes each)
+    """
+    lengths = np.asarray(lengths, dtype=np.uint64)
+    width = next(width for width in (1, 2, 4, 8) if not len(lengths) or int(lengths.max()) < 1 << (8 * width))
+    return (BATCH.pack(width, len(counts)) + np.asarray(counts, dtype='<u8').tobytes()
+            + lengths.astype(f'<u{width}').tobytes())
+
+
+def decode_batches(data):
+    """
+    Parse a b'BTCH' section: (records per batch, record lengths) as int64 arrays
+    """
+    width, batches = BATCH.unpack_from(data, 0)
+    counts = np.frombuffer(data, '<u8', batches, BATCH.size)
+    lengths = np.frombuffer(data, f'<u{width}', int(counts.sum()), BATCH.size + counts.nbytes)
+    return counts.astype(np.int64), lengths.astype(np.int64)
+
+
+def encrypt_blocks(ctr, blocks, offset, block_bytes):
+    """
+    Encrypt the compressed blocks of consecutive packed data starting at packed `offset`
+    (see `compression.compress_blocks`). Returns the ciphertext of all blocks and their entries.
+    """
+    ciphertext = b''.join(ctr.process(data, offset + i * block_bytes).tobytes()
+                          for i, (data, _) in enumerate(blocks))
+    return ciphertext, [entry for _, entry in blocks]
+
+
+def update_header(path, updates):
+    """
+    Replace header sections of an existing container: `updates` maps tags to new data (None
+    removes the section). The new header is appended after the current trailer and made
+    durable before the new trailer is written last, so a crash at any point leaves the old
+    header readable (truncate back to the old trailer to recover). The payload is never read
+    or moved, so this costs the same for any container size; readers already open keep
+    seeing the old header.
+    """
+    with open(path, 'r+b') as file:
+        end = file.seek(0, 2)
+        file.seek(end - TRAILER.size)
+        header_offset, header_length, magic = TRAILER.unpack(file.read(TRAILER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a DNAVault container")
+        file.seek(header_offset)
+        sections = decode_header(memoryview(file.read(header_length)))
+        # Older containers end their payload at the first header; record that before appending
+        sections.setdefault(PAYLOAD_SECTION, PAYLOAD.pack(header_offset - PREAMBLE.size))
+        for tag, data in updates.items():
+            if data is None:
+                sections.pop(tag, None)
+            else:
+                sections[tag] = data
+        header = encode_header(sections)
+        file.seek(end)
+        file.write(header)
+        file.flush()
+        os.fsync(file.fileno())
+        file.write(TRAILER.pack(end, len(header), MAGIC))
+        file.flush()
+        os.fsync(file.fileno())
+
+
+class ContainerWriter:
+    """
+    Stream records into a container file, encrypting them with AES-CTR on the way.
+    `sections` adds extra header sections (e.g. the b'WRAP' key envelope).
+    `codec` ('zlib', 'bz2', 'lzma') compresses the packed data in blocks of `block_bytes` first.
+    Runs of non-ACGT bases go to `side` (see `dna_utils.pack_with_side_table`).
+    """
+    def __init__(self, path, key, kem_ciphertext=b'', nonce=None, sections=None,
+                 codec='none', block_bytes=compression.BLOCK_BYTES):
+        self.path = path
+        self.ctr = CTRMode(key, nonce)
+        self.kem_ciphertext = bytes(kem_ciphertext)
+        self.sections = dict(sections or {})
+        self.tagger = integrity.ChunkTagger(integrity.derive_mac_key(key))
+        self.codec = compression.codec_id(codec)
+        self.block_bytes = block_bytes
+        self.blocks = [] # Block table entries (compressed containers)
+        self.pending = bytearray() # Packed bytes of the current record not compressed yet
+        self.side = SideTable()
+        self.records = [] # (offset, size, length) of every record (or batch) written so far
+        self.names = []
+        self.batches = [] # Records per batch (batch containers)
+        self.batch_lengths = [] # Length of every record in a batch
+        self.offset = 0 # Current position in the packed (CTR) stream
+        self.record_start = None # Packed offset of the record being written
+
+        self.file = open(path, 'wb')
+        # Compressed containers are version 2; `close` raises this to 3 if it writes a side table
+        self.file.write(PREAMBLE.pack(MAGIC, 2 if self.codec else 1))
+
+    def begin_record(self, name='', offset=None):
+        """
+        Start a new record; its data is added with `write_chunk` and closed with `end_record`.
+        `offset` lets a caller that encrypts elsewhere (see `write_encrypted`) register the
+        record's payload position before the ciphertext arrives.
+        """
+        if self.batches:
+            raise RuntimeError("a batch container holds only batches")
+        if self.record_start is not None:
+            raise RuntimeError("previous record was not ended")
+        self.record_start = self.offset if offset is None else offset
+        self.names.append(name)
+
+    def begin_batch(self, offset=None):
+        """
+        Start a batch of records stored back to back at base granularity; register its records
+        with `add_to_batch`, add their packed bases with `write_chunk` (or `write_encrypted`)
+        and close it with `end_batch`. A container holds either batches or single records.
+        """
+        if self.records and not self.batches:
+            raise RuntimeError("a container with single records cannot hold batches")
+        if self.record_start is not None:
+            raise RuntimeError("previous record was not ended")
+        self.record_start = self.offset if offset is None else offset
+        self.batches.append(0)
+        self.batch_bases = 0
+
+    def add_to_batch(self, name, length):
+        """
+        Register the next record of the open batch and return its index
+        """
+        self.names.append(name)
+        self.batch_lengths.append(length)
+        self.batches[-1] += 1
+        self.batch_bases += length
+        return len(self.names) - 1
+
+    def end_batch(self, end=None):
+        """
+        Close the open batch and return its index. A batch without records is dropped (None):
+        it holds no bytes, and readers locate records from the first record of every batch.
+        """
+        if not self.batches[-1]:
+            self.batches.pop()
+            self.record_start = None
+            return None
+        return self.end_record(self.batch_bases, end)
+
+    def write_batch(self, reads):
+        """
+        Pack and encrypt (name, bases) records as one batch. IUPAC codes and lowercase bases
+        go to the side table. Returns the batch index.
+        """
+        self.begin_batch()
+        bases = []
+        for name, sequence in reads:
+            self.add_to_batch(name, len(sequence))
+            bases.append(sequence.encode('ascii') if isinstance(sequence, str) else bytes(sequence))
+        packed, exceptions, lowercase = dna_utils().pack_with_side_table(b''.join(bases))
+        self.write_chunk(packed)
+        self.side.add(len(self.records), 0, exceptions, lowercase)
+        return self.end_batch()
+
+    def write_chunk(self, packed):
+        """
+        Encrypt and append packed bases to the current record
+        """
+        if self.codec:
+            # Compress whole blocks as they fill up; the rest waits for more data or end_record
+            self.pending += np.ascontiguousarray(packed, dtype=np.uint8).tobytes()
+            full = len(self.pending) - len(self.pending) % self.block_bytes
+            if full:
+                self._write_blocks(self.pending[:full])
+                del self.pending[:full]
+            return
+        with instrument.stage('encrypt'):
+            chunk = self.ctr.process(packed, self.offset)
+        self.write_encrypted(chunk)
+
+    def _write_blocks(self, packed):
+        with instrument.stage('compress'):
+            blocks = compression.compress_blocks(self.codec, packed, self.block_bytes)
+        with instrument.stage('encrypt'):
+            ciphertext, entries = encrypt_blocks(self.ctr, blocks, self.offset, self.block_bytes)
+        self.write_encrypted(ciphertext, entries, len(packed))
+
+    def write_encrypted(self, ciphertext, blocks=(), packed_size=None):
+        """
+        Append ciphertext that was already encrypted with `self.ctr` at the current offset.
+        Compressed data comes with its block table entries and the packed size it holds.
+        """
+        with instrument.stage('write'):
+            self.file.write(ciphertext)
+        with instrument.stage('mac'):
+            self.tagger.update(ciphertext)
+        self.blocks.extend(blocks)
+        self.offset += len(ciphertext) if packed_size is None else packed_size
+
+    def end_record(self, length, end=None):
+        """
+        Close the current record of `length` bases and return its index
+        """
+        if self.pending:
+            self._write_blocks(self.pending)
+            self.pending.clear()
+        end = self.offset if end is None else end
+        self.records.append((self.record_start, end - self.record_start, length))
+        self.record_start = None
+        return len(self.records) - 1
+
+    def write_record(self, packed, length, name=''):
+        """
+        Encrypt and append one record of `length` bases.
+        `packed` is a packed byte buffer or an iterable of packed chunks (for records that do
+        not fit in memory). Returns the record index.
+        """
+        if isinstance(packed, (bytes, bytearray, memoryview, np.ndarray)):
+            packed = [packed]
+
+        self.begin_record(name)
+        for chunk in packed:
+            self.write_chunk(chunk)
+        return self.end_record(length)
+
+    def close(self):
+        """
+        Write the header and trailer and close the file
+        """
+        if self.file.closed:
+            return
+        side = {}
+        if len(self.side):
+            # Encrypt the side table after the last record and mark the file as version 3
+            data = self.side.encode()
+            side[SIDE_SECTION] = POINTER.pack(self.offset, self.file.tell() - PREAMBLE.size, len(data))
+            with instrument.stage('encrypt'):
+                ciphertext = self.ctr.process(data, self.offset)
+            self.write_encrypted(ciphertext)
+            self.file.seek(0)
+            self.file.write(PREAMBLE.pack(MAGIC, 3))
+            self.file.seek(0, 2)
+        with instrument.stage('header'):
+            records = np.array(self.records, dtype=RECORD_DTYPE)
+            header_offset = self.file.tell()
+            sections = {
+                b'MODE': bytes([MODE_CTR]) + self.ctr.nonce,
+                b'KEMC': self.kem_ciphertext,
+                PAYLOAD_SECTION: PAYLOAD.pack(header_offset - PREAMBLE.size),
+                b'RECS': records.tobytes(),
+                b'NAME': '\n'.join(self.names).encode('utf-8'),
+                **({BATCH_SECTION: encode_batches(self.batches, self.batch_lengths)} if self.batches else {}),
+                b'MACS': b'',
+                **({b'CMPR': compression.encode_table(self.codec, self.block_bytes, self.blocks)} if self.codec else {}),
+                **side,
+                **self.sections,
+            }
+            index = integrity.index_tag(self.tagger.mac_key, encode_index(sections))
+            sections[b'MACS'] = integrity.encode_tree(self.tagger.chunk_size, self.tagger.finish(), index)
+            header = encode_header(sections)
+            self.file.write(header)
+            self.file.write(TRAILER.pack(header_offset, len(header), MAGIC))
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ContainerReader:
+    """
+    Memory-mapped reader. Record ciphertext is exposed as zero-copy memoryview slices; drop
+    them before `close`, otherwise the map stays open until the last slice is released.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+        magic, version = PREAMBLE.unpack_from(self.view, 0)
+        header_offset, header_length, end_magic = TRAILER.unpack_from(self.view, len(self.view) - TRAILER.size)
+        if magic != MAGIC or end_magic != MAGIC:
+            raise ValueError(f"{path} is not a DNAVault container")
+        if version > VERSION:
+            raise ValueError(f"unsupported container version {version}")
+        self.version = version
+
+        self.sections = decode_header(self.view[header_offset:header_offset + header_length])
+        mode = self.sections[b'MODE']
+        self.mode = mode[0]
+        if self.mode != MODE_CTR:
+            raise ValueError(f"unsupported cipher mode {self.mode}")
+        self.nonce = bytes(mode[1:])
+        self.kem_ciphertext = bytes(self.sections.get(b'KEMC', b''))
+        # Stored streams (RECS rows); in a batch container every stream holds many records
+        self.streams = self.records = np.frombuffer(self.sections[b'RECS'], dtype=RECORD_DTYPE)
+        self.record_stream = self.record_shift = None # Stream and first base of each batched record
+        if BATCH_SECTION in self.sections:
+            counts, lengths = decode_batches(self.sections[BATCH_SECTION])
+            self.record_stream = np.repeat(np.arange(len(counts)), counts)
+            starts = np.cumsum(lengths) - lengths
+            # Start of the first record of every batch (empty batches have none and stay at 0)
+            batch_starts = np.zeros(len(counts), dtype=np.int64)
+            batch_starts[counts > 0] = starts[(np.cumsum(counts) - counts)[counts > 0]]
+            self.record_shift = starts - batch_starts[self.record_stream]
+            # Byte range of every record in the packed stream (neighbours may share a byte)
+            self.records = np.zeros(len(lengths), dtype=RECORD_DTYPE)
+            self.records['offset'] = self.streams['offset'][self.record_stream] + self.record_shift // 4
+            self.records['size'] = (self.record_shift % 4 + lengths + 3) // 4
+            self.records['length'] = lengths
+        names = bytes(self.sections.get(b'NAME', b'')).decode('utf-8')
+        self.names = names.split('\n') if len(self.records) else []
+        payload_end = header_offset
+        if PAYLOAD_SECTION in self.sections:
+            payload_end = PREAMBLE.size + PAYLOAD.unpack(self.sections[PAYLOAD_SECTION])[0]
+        self.payload = self.view[PREAMBLE.size:payload_end]
+        self._by_name = None # Record name -> index, built on the first lookup by name
+
+        self.codec = 0
+        if b'CMPR' in self.sections:
+            self.codec, self.block_bytes, self.block_entries = compression.decode_table(self.sections[b'CMPR'])
+            # Payload offset of every block, and index of the first block of every stream
+            sizes = self.block_entries & compression.SIZE_MASK
+            self.block_offsets = np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+            counts = compression.block_count(self.streams['size'].astype(np.int64), self.block_bytes)
+            self.first_block = np.concatenate(([0], np.cumsum(counts)))
+
+        self.side_pointer = POINTER.unpack(self.sections[SIDE_SECTION]) if SIDE_SECTION in self.sections else None
+        self._side = None # (key, decrypted SideTable), loaded on the first read that needs it
+        self._index_checked = None # (key, whether the index tag matched)
+
+    def __len__(self):
+        return len(self.records)
+
+    def record_id(self, record):
+        """
+        Index of a record given by index, by full name (the whole FASTA header line) or by
+        record ID (its first word). KeyError for an unknown name.
+        """
+        if isinstance(record, str):
+            if self._by_name is None:
+                # Full names win over IDs; the first record with an ID keeps it
+                by_id = {}
+                for index, name in enumerate(self.names):
+                    by_id.setdefault(name.split(maxsplit=1)[0] if name.strip() else name, index)
+                self._by_name = {**by_id, **{name: index for index, name in reversed(list(enumerate(self.names)))}}
+            if record not in self._by_name:
+                raise KeyError(f"unknown record {record!r}")
+            return self._by_name[record]
+        index = int(record)
+        if not -len(self.records) <= index < len(self.records):
+            raise IndexError(f"record {index} out of range")
+        return index % len(self.records)
+
+    def _locate(self, index, start, end):
+        # Stream holding a record, and the record's base range clamped to its length, in the
+        # base coordinates of that stream
+        start, end, _ = slice(start, end).indices(int(self.records[index]['length']))
+        end = max(start, end)
+        if self.record_stream is None:
+            return index, start, end
+        shift = int(self.record_shift[index])
+        return int(self.record_stream[index]), start + shift, end + shift
+
+    def read_region(self, record, start, end, key, verify=False):
+        """
+        Decrypt bases [start, end) of a record (index or name) and return them as ASCII bytes.
+        Only the packed bytes covering the range are read and decrypted.
+        With `verify`, the chunks covering the range (and the side table) are authenticated
+        first (ValueError if not).
+        """
+        stream, first_base, end_base = self._locate(self.record_id(record), start, end)
+        if end_base <= first_base:
+            return b''
+        if verify and not (self._verify_proofs(self._prove_bases(stream, first_base, end_base), key)
+                           and self._verify_side(key)):
+            raise ValueError(f"integrity check failed for record {record!r} [{start}, {end})")
+        first, last = first_base // 4, (end_base + 3) // 4
+        packed = self._read_packed(stream, first, last, key)
+        bases = UNPACK_ASCII[packed].view(np.uint8)[first_base - 4 * first:end_base - 4 * first]
+        side = self.side_table(key)
+        if side is not None:
+            side.restore(stream, first_base, bases)
+        return bases.tobytes()
+
+    def side_table(self, key):
+        """
+        Decrypted side table of non-ACGT bases (None when every base is A/C/G/T)
+        """
+        if self.side_pointer is None:
+            return None
+        if self._side is None or self._side[0] != key:
+            ctr_offset, payload_offset, size = self.side_pointer
+            data = CTRMode(key, self.nonce).process(self.payload[payload_offset:payload_offset + size], ctr_offset)
+            self._side = (key, SideTable.decode(data.tobytes()))
+        return self._side[1]
+
+    def _verify_side(self, key):
+        if self.side_pointer is None:
+            return True
+        _, payload_offset, size = self.side_pointer
+        return self._verify_proofs(self._prove_payload(payload_offset, payload_offset + size), key)
+
+    def _payload_range(self, stream, first, last):
+        # Payload bytes holding packed bytes [first, last) of a stream (whole blocks if compressed)
+        offset = int(self.streams[stream]['offset'])
+        if not self.codec:
+            return offset + first, offset + last
+        base = int(self.first_block[stream])
+        return (int(self.block_offsets[base + first // self.block_bytes]),
+                int(self.block_offsets[base + (last - 1) // self.block_bytes + 1]))
+
+    def _read_packed(self, stream, first, last, key):
+        # Decrypt (and decompress) packed bytes [first, last) of a stream into a uint8 array
+        offset = int(self.streams[stream]['offset'])
+        ctr = CTRMode(key, self.nonce)
+        if not self.codec:
+            return ctr.process(self.payload[offset + first:offset + last], offset + first)
+        size, block_bytes = int(self.streams[stream]['size']), self.block_bytes
+        blocks = []
+        for block in range(first // block_bytes, (last - 1) // block_bytes + 1):
+            position = int(self.first_block[stream]) + block
+            data = self.payload[int(self.block_offsets[position]):int(self.block_offsets[position + 1])]
+            start = block * block_bytes
+            blocks.append(compression.decompress_block(self.codec, ctr.process(data, offset + start),
+                                                       int(self.block_entries[position]),
+                                                       min(block_bytes, size - start)))
+        skip = first - first // block_bytes * block_bytes
+        return np.frombuffer(b''.join(blocks), dtype=np.uint8)[skip:skip + last - first]
+
+    def _tree(self):
+        if b'MACS' not in self.sections:
+            raise ValueError(f"{self.path} has no integrity tags")
+        return integrity.decode_tree(self.sections[b'MACS'])
+
+    def verify(self, key, workers=None):
+        """
+        Authenticate the whole payload on `workers` threads (default: all cores).
+        Returns the indices of corrupted chunks; an empty list means the payload is intact.
+        """
+        chunk_size, root, tags, _ = self._tree()
+        if not self._verify_index(key):
+            raise ValueError("container index does not match its integrity tag")
+        mac_key = integrity.derive_mac_key(key)
+        return integrity.verify_payload(mac_key, self.payload, chunk_size, tags, root, workers)
+
+    def _verify_index(self, key):
+        # Check the index tag over the index sections (record table, names, block table...);
+        # the outcome is kept per key so region reads do not rehash the whole index
+        if self._index_checked is None or self._index_checked[0] != key:
+            stored = self._tree()[3]
+            fresh = integrity.index_tag(integrity.derive_mac_key(key), encode_index(self.sections))
+            self._index_checked = (key, stored is not None and hmac.compare_digest(stored, fresh))
+        return self._index_checked[1]
+
+    def prove_region(self, record, start, end):
+        """
+        Merkle proof for bases [start, end) of a record: (root, leaf count, [(chunk, tag, proof)])
+        with one log-size proof per chunk covering the range
+        """
+        return self._prove_bases(*self._locate(self.record_id(record), start, end))
+
+    def _prove_bases(self, stream, start, end):
+        # Merkle proofs of the chunks covering bases [start, end) of a stream
+        if end <= start:
+            return self._prove_payload(0, 0)
+        return self._prove_payload(*self._payload_range(stream, start // 4, (end + 3) // 4))
+
+    def _prove_payload(self, first, last):
+        # Merkle proofs of the chunks covering payload bytes [first, last)
+        chunk_size, root, tags, _ = self._tree()
+        levels = integrity.merkle_levels(tags)
+        chunks = range(first // chunk_size, (last - 1) // chunk_size + 1) if last > first else range(0)
+        return root, len(tags), [(chunk, tags[chunk], integrity.merkle_proof(tags, chunk, levels)) for chunk in chunks]
+
+    def verify_region(self, record, start, end, key, root=None):
+        """
+        Authenticate only the chunks covering bases [start, end) of a record against the Merkle
+        root (the stored one, or a `root` obtained from a trusted source), after checking the
+        index tag
+        """
+        return self._verify_proofs(self.prove_region(record, start, end), key, root)
+
+    def _verify_proofs(self, region_proof, key, root=None):
+        # The proofs are only meaningful if the index that located the chunks is authentic
+        if not self._verify_index(key):
+            return False
+        chunk_size = self._tree()[0]
+        stored_root, count, proofs = region_proof
+        root = stored_root if root is None else root
+        mac_key = integrity.derive_mac_key(key)
+        fresh = integrity.compute_tags(mac_key, self.payload, chunk_size, [chunk for chunk, _, _ in proofs], workers=1)
+        return all(integrity.verify_proof(tag, chunk, count, proof, root)
+                   for tag, (chunk, _, proof) in zip(fresh, proofs))
+
+    def sequence(self, record, key):
+        """
+        Lazy, sliceable view of one record (see `LazySequence`)
+        """
+        return LazySequence(self, record, key)
+
+    def record_ciphertext(self, index):
+        """
+        Return the ciphertext of one record as a memoryview into the mapped file.
+        The view is only valid while the reader is open; copy it with bytes() to keep it.
+        """
+        stream, start, end = self._locate(index, 0, None)
+        if end <= start:
+            return self.payload[0:0]
+        first, last = self._payload_range(stream, start // 4, (end + 3) // 4)
+        return self.payload[first:last]
+
+    def decrypt_record(self, index, key):
+        """
+        Decrypt one record and return its packed bases as a uint8 array
+        (non-ACGT bases read as 'A' here; `read_region` applies the side table)
+        """
+        stream, start, end = self._locate(index, 0, None)
+        if end <= start:
+            return np.zeros(0, dtype=np.uint8)
+        first = start // 4
+        packed = self._read_packed(stream, first, (end + 3) // 4, key)
+        if start % 4: # Batched records do not always start on a byte boundary
+            packed = pack_codes(UNPACK_CODES[packed].view(np.uint8)[start - 4 * first:end - 4 * first])
+        return packed
+
+    def close(self):
+        # Release exported slices before closing the map
+        self.records = self.streams = None
+        self.sections = None
+        self.block_entries = None
+        self._side = None
+        self.payload.release()
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError: # A record_ciphertext slice is still alive; the map is closed with it
+            pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LazySequence:
+    """
+    Read-only view of one encrypted record. Nothing is decrypted up front: indexing and slicing
+    decrypt just the bases they cover, so seq[start:end] costs O(end - start).
+    Items and slices are returned as ASCII bytes (seq[i] is a one-base bytes object).
+    """
+    def __init__(self, reader, record, key):
+        self.reader = reader
+        self.key = key
+        self.record = reader.record_id(record)
+        self.name = reader.names[self.record]
+        self.length = int(reader.records[self.record]['length'])
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            positions = range(*item.indices(self.length))
+            if not positions:
+                return b''
+            if positions.step == 1:
+                return self.reader.read_region(self.record, positions.start, positions.stop, self.key)
+            low, high = min(positions), max(positions) + 1
+            region = np.frombuffer(self.reader.read_region(self.record, low, high, self.key), dtype=np.uint8)
+            return region[np.asarray(positions) - low].tobytes()
+
+        position = int(item)
+        if position < 0:
+            position += self.length
+        if not 0 <= position < self.length:
+            raise IndexError("sequence index out of range")
+        return self.reader.read_region(self.record, position, position + 1, self.key)
+
+    def __bytes__(self):
+        return self[:]
+
+    def __repr__(self):
+        return f"LazySequence(name={self.name!r}, length={self.length})"
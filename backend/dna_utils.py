@@ -1,5 +1,7 @@
 # DNA UTILITIES FOR ENCODING AND DECODING DNA SEQUENCES
 
+import numpy as np
+
 """
 This class provides utilities to:
 - Read DNA sequences from files.
@@ -13,7 +15,94 @@ A -> 00
 G -> 01
 C -> 10
 T -> 11
+
+The packed codec (`pack` / `unpack`) stores 4 bases per byte, first base in the two most
+significant bits, using 256-entry translation tables and numpy bit operations.
+The string-based helpers below are thin wrappers over the same tables.
+
+Real assemblies also contain IUPAC ambiguity codes (long 'N' gaps above all) and soft-masked
+lowercase runs. `pack_with_side_table` keeps the dense 2-bit stream for them too (an exception
+is packed as 'A') and returns the exceptions as run-length tables: runs of one IUPAC code and
+runs of lowercase bases. `restore_runs` puts them back into unpacked ASCII bases.
 """
+
+# ASCII byte -> 2-bit code, INVALID_CODE for anything that is not A/G/C/T
+INVALID_CODE = 0xFF
+ENCODE_TABLE = np.full(256, INVALID_CODE, dtype=np.uint8)
+for _code, _base in enumerate(b'AGCT'):
+    ENCODE_TABLE[_base] = _code
+
+# 2-bit code -> ASCII byte
+DECODE_TABLE = np.frombuffer(b'AGCT', dtype=np.uint8)
+
+# 2-bit code -> its two binary digits as ASCII ('0'/'1')
+BITS_TABLE = np.frombuffer(b'00011011', dtype=np.uint8).reshape(4, 2)
+
+# Bit positions of the 4 bases inside a packed byte
+PACK_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+# Packed byte -> its 4 codes / 4 ASCII bases, stored as one uint32 so unpacking is a single gather
+UNPACK_CODES = ((np.arange(256)[:, np.newaxis] >> PACK_SHIFTS) & 0b11).astype(np.uint8).view(np.uint32).reshape(256)
+UNPACK_ASCII = DECODE_TABLE[UNPACK_CODES.view(np.uint8)].view(np.uint32).reshape(256)
+
+# ASCII byte -> its uppercase form (letters only)
+UPPER_TABLE = np.frombuffer(bytes(range(256)).upper(), dtype=np.uint8)
+
+# IUPAC ambiguity codes and the gap symbol, stored in the side table instead of the 2-bit stream
+IUPAC_CODES = b'NRYSWKMBDHV-'
+IUPAC_TABLE = np.zeros(256, dtype=bool)
+IUPAC_TABLE[np.frombuffer(IUPAC_CODES, dtype=np.uint8)] = True
+
+# Side table runs relative to the scanned sequence: runs of one IUPAC code, and lowercase runs
+EXCEPTION_RUN_DTYPE = np.dtype([('start', '<u8'), ('length', '<u8'), ('base', 'u1')])
+MASK_RUN_DTYPE = np.dtype([('start', '<u8'), ('length', '<u8')])
+
+for _table in (ENCODE_TABLE, DECODE_TABLE, UNPACK_CODES, UNPACK_ASCII, UPPER_TABLE, IUPAC_TABLE):
+    _table.setflags(write=False)
+
+
+def find_runs(mask):
+    """
+    Start positions and lengths of the runs of True in a boolean array
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).view(np.int8)))
+    return edges[::2], edges[1::2] - edges[::2]
+
+
+def pack_codes(codes):
+    """
+    Pack a uint8 array of 2-bit codes, 4 per byte (the last byte filled with 'A' (00))
+    """
+    remainder = len(codes) % 4
+    if remainder:
+        codes = np.concatenate([codes, np.zeros(4 - remainder, dtype=np.uint8)])
+    quads = codes.reshape(-1, 4)
+    return (quads[:, 0] << 6) | (quads[:, 1] << 4) | (quads[:, 2] << 2) | quads[:, 3]
+
+
+def restore_runs(bases, start, exceptions, lowercase):
+    """
+    Write side table runs into `bases`, a writable uint8 array of ASCII bases holding the
+    sequence positions [start, start + len(bases)). Runs may extend beyond that window.
+    """
+    end = start + len(bases)
+    for runs, lower in ((exceptions, False), (lowercase, True)):
+        if not len(runs):
+            continue
+        first = np.clip(runs['start'].astype(np.int64), start, end) - start
+        last = np.clip((runs['start'] + runs['length']).astype(np.int64), start, end) - start
+        # Runs do not overlap, so a running sum of +id / -id marks every position with its run id
+        ids = np.arange(1, len(runs) + 1)
+        marks = np.zeros(len(bases) + 1, dtype=np.int64)
+        np.add.at(marks, first, ids)
+        np.add.at(marks, last, -ids)
+        run_of = np.cumsum(marks[:-1])
+        inside = run_of > 0
+        if lower:
+            bases[inside] |= 0x20 # ASCII letters: lowercase = uppercase | 0x20
+        else:
+            bases[inside] = runs['base'][run_of[inside] - 1]
+
 class dna_utils:
     def __init__(self):
         # Mapping from DNA bases to 2-bit binary
@@ -59,12 +148,80 @@ class dna_utils:
         Convert a DNA sequence to a binary string.
         Each base is mapped to a 2-bit binary representation.
         """
-        binaryForm = ""
-        for base in dna_sequence:
-                binaryForm += self.convert[base] # Append the binary value for each base
-        
-        return binaryForm
+        return BITS_TABLE[self.to_codes(dna_sequence)].tobytes().decode('ascii')
     
+    def to_codes(self, dna_sequence):
+        """
+        Translate a DNA sequence (str, bytes, memoryview or uint8 array) into a uint8 array
+        of 2-bit base codes through the 256-entry table. Raises KeyError on an unknown base.
+        """
+        if isinstance(dna_sequence, str):
+            dna_sequence = dna_sequence.encode('ascii')
+        buffer = np.frombuffer(dna_sequence, dtype=np.uint8)
+        codes = ENCODE_TABLE[buffer]
+        invalid = np.flatnonzero(codes == INVALID_CODE)
+        if len(invalid):
+            raise KeyError(chr(buffer[invalid[0]]))
+        return codes
+
+    def pack(self, dna_sequence):
+        """
+        Pack a DNA sequence into a uint8 array with 4 bases per byte.
+        The last byte is filled with 'A' (00) when the length is not a multiple of 4.
+        """
+        return pack_codes(self.to_codes(dna_sequence))
+
+    def pack_with_side_table(self, dna_sequence):
+        """
+        Pack a sequence that may contain IUPAC codes and lowercase bases.
+        Returns (packed, exception runs, lowercase runs); exceptions are packed as 'A', so the
+        packed stream keeps one 2-bit code per base. Raises KeyError on other characters.
+        """
+        if isinstance(dna_sequence, str):
+            dna_sequence = dna_sequence.encode('ascii')
+        buffer = np.frombuffer(dna_sequence, dtype=np.uint8)
+        codes = ENCODE_TABLE[buffer]
+        exceptions = np.zeros(0, dtype=EXCEPTION_RUN_DTYPE)
+        lowercase = np.zeros(0, dtype=MASK_RUN_DTYPE)
+        if (codes == INVALID_CODE).any(): # Plain uppercase ACGT skips the side table scan
+            upper = UPPER_TABLE[buffer]
+            codes = ENCODE_TABLE[upper]
+            special = np.flatnonzero(codes == INVALID_CODE)
+            values = upper[special]
+            unknown = np.flatnonzero(~IUPAC_TABLE[values])
+            if len(unknown):
+                raise KeyError(chr(buffer[special[unknown[0]]]))
+            codes[special] = 0
+
+            if len(special):
+                # A run of one code ends where the positions jump or the code changes
+                breaks = np.flatnonzero((np.diff(special) != 1) | (np.diff(values) != 0)) + 1
+                firsts = np.concatenate(([0], breaks)).astype(np.int64)
+                exceptions = np.zeros(len(firsts), dtype=EXCEPTION_RUN_DTYPE)
+                exceptions['start'] = special[firsts]
+                exceptions['length'] = np.diff(np.append(firsts, len(special)))
+                exceptions['base'] = values[firsts]
+
+            starts, lengths = find_runs(buffer != upper)
+            lowercase = np.zeros(len(starts), dtype=MASK_RUN_DTYPE)
+            lowercase['start'], lowercase['length'] = starts, lengths
+        return pack_codes(codes), exceptions, lowercase
+
+    def unpack_codes(self, packed, length=None):
+        """
+        Expand packed bytes back into one 2-bit code per base (optionally truncated to `length`)
+        """
+        packed = np.frombuffer(packed, dtype=np.uint8) if not isinstance(packed, np.ndarray) else packed
+        codes = UNPACK_CODES[packed].view(np.uint8)
+        return codes if length is None else codes[:length]
+
+    def unpack(self, packed, length):
+        """
+        Unpack `length` bases from packed bytes into an ASCII bytes object
+        """
+        packed = np.frombuffer(packed, dtype=np.uint8) if not isinstance(packed, np.ndarray) else packed
+        return UNPACK_ASCII[packed].view(np.uint8)[:length].tobytes()
+
     def binary_to_matrices(self, binaryForm):
         """
         Break binary string into a list of 4x4 matrices.
@@ -97,52 +254,57 @@ class dna_utils:
 
         Process:
         1. Pad the sequence to make it a multiple of 16.
-        2. Convert the padded sequence to binary.
-        3. Break the binary string into 4x4 matrices.
+        2. Pack the padded sequence to 2-bit codes.
+        3. Lay the codes out as 4x4 matrices of 2-bit binary strings.
         """
         paddedForm = self.padding(dna_sequence) # Pad Sequence
-        binaryForm = self.dna_to_binary(paddedForm) # Convert to binary
-        matrices = self.binary_to_matrices(binaryForm) # Break into matrices
-        
-        return matrices
+        codes = self.unpack_codes(self.pack(paddedForm)) # Pack and expand to one code per base
+        return np.array(['00', '01', '10', '11'])[codes].reshape(-1, 4, 4).tolist() # Codes to matrices
     
+    def encode_blocks(self, dna_sequence):
+        """
+        Encode a DNA sequence into an (N, 4, 4) uint8 array of 2-bit base codes.
+        Same block layout as `encode`, ready for `AESEngine.encrypt_blocks`.
+        """
+        paddedForm = self.padding(dna_sequence) # Pad Sequence
+        return self.to_codes(paddedForm).reshape(-1, 4, 4)
+
+    def decode_blocks(self, blocks, original_length):
+        """
+        Decode an (N, 4, 4) array of 2-bit base codes back to the original DNA sequence.
+        """
+        codes = np.asarray(blocks, dtype=np.uint8).reshape(-1)[:original_length] # Removing padding bases
+        return DECODE_TABLE[codes].tobytes().decode('ascii')
+
     def matrices_to_binary(self, matrices):
         """
         Convert 4x4 matrices back to a single binary string.
         Flattens all matrices row-by-row, cell-by-cell.
         """
-        binaryForm = ""
-        for matrix in matrices:
-            for row in matrix:
-                for cell in row:
-                    binaryForm += cell # Concatenate 2-bit cells back to a single string
-        return binaryForm
+        return ''.join(cell for matrix in matrices for row in matrix for cell in row)
     
     def binary_to_dna(self, binaryForm):
         """
         Convert a binary string back to a DNA sequence.
         Every 2 bits correspond to one DNA base.
         """
-        dna_sequence = ""
-        for i in range(0, len(binaryForm), 2):
-            binary_pair = binaryForm[i:i+2]
-            if binary_pair in self.retain:
-                dna_sequence += self.retain[binary_pair] # Convert each 2-bit to its base
-        return dna_sequence
+        bits = np.frombuffer(binaryForm.encode('ascii'), dtype=np.uint8) - ord('0')
+        pairs = bits[:len(bits) // 2 * 2].reshape(-1, 2) # A trailing single bit is not a base
+        return DECODE_TABLE[(pairs[:, 0] << 1) | pairs[:, 1]].tobytes().decode('ascii')
     
     def decode(self, matrices, original_length):
         """
         Decode 4x4 matrices back to the original DNA sequence.
 
         Process:
-        1. Convert matrices to binary.
-        2. Convert binary to DNA sequence.
+        1. Convert matrices to 2-bit codes.
+        2. Convert codes to DNA sequence.
         3. Truncate to original DNA length (before padding).
         """
-        binaryForm = self.matrices_to_binary(matrices) # Matrix to binary
-        dna_sequence = self.binary_to_dna(binaryForm) # Binary to DNA
-        dna = dna_sequence[:original_length] # Removing padding bases
-        return dna
+        cells = np.array(matrices, dtype='U2').reshape(-1)
+        digits = cells.view(np.uint32).reshape(-1, 2) - ord('0') # Both binary digits of each cell
+        codes = ((digits[:, 0] << 1) | digits[:, 1]).astype(np.uint8)
+        return DECODE_TABLE[codes[:original_length]].tobytes().decode('ascii') # Removing padding bases
     
     def print_matrices(self, matrices):
         """
@@ -0,0 +1,207 @@
+# ENVELOPE ENCRYPTION WITH MULTI-RECIPIENT KEY WRAPPING
+
+import hashlib
+import hmac
+import os
+import struct
+from collections import namedtuple
+
+from backend.aes_engine import AESEngine
+from backend.container import update_header, ContainerReader
+from backend.kyber import ModuleKyber, public_key_fingerprint
+
+"""
+Envelope encryption for containers.
+
+A random data-encryption key (DEK) encrypts the payload once. For every recipient the DEK is
+wrapped (RFC 3394 AES key wrap) under a key-encryption key (KEK) derived from a fresh Kyber
+encapsulation to that recipient's public key. The wrapped keys live in the container header
+(section b'WRAP'), so granting access, revoking an entry or rotating the KEKs rewrites a few
+hundred bytes of header and never touches the encrypted DNA.
+
+Revoking an entry only removes that recipient's wrapped key: anyone who already unwrapped the
+DEK can still read the payload until it is re-encrypted under a new DEK.
+"""
+
+DEK_BYTES = 16 # AES-128 data key
+KEK_INFO = b'DNAVault KEK v1'
+WRAP_SECTION = b'WRAP'
+WRAP_IV = b'\xa6' * 8 # RFC 3394 default initial value
+
+# One wrapped copy of the DEK: Kyber parameter set, fingerprint of the recipient's public key,
+# KEM ciphertext and the DEK wrapped under the derived KEK
+Recipient = namedtuple('Recipient', ['params', 'fingerprint', 'kem_ciphertext', 'wrapped_key'])
+
+_COUNT = struct.Struct('<H')
+_ENTRY = struct.Struct('<B32sHH') # params length, fingerprint, KEM ciphertext length, wrapped key length
+
+
+def new_data_key():
+    """
+    Fresh random data-encryption key
+    """
+    return os.urandom(DEK_BYTES)
+
+
+def derive_kek(shared_key):
+    """
+    Key-encryption key from a Kyber shared secret (domain-separated SHA-256, truncated to AES-128)
+    """
+    return hashlib.sha256(KEK_INFO + shared_key).digest()[:16]
+
+
+def wrap_key(kek, key):
+    """
+    RFC 3394 AES key wrap of `key` (a multiple of 8 bytes) under `kek`
+    """
+    if len(key) % 8 or len(key) < 16:
+        raise ValueError("wrapped keys must be a multiple of 8 bytes, at least 16")
+    engine = AESEngine(kek)
+    a = WRAP_IV
+    r = [key[i:i + 8] for i in range(0, len(key), 8)]
+    n = len(r)
+    for j in range(6):
+        for i in range(n):
+            b = engine.encrypt_block(a + r[i])
+            t = n * j + i + 1
+            a = (int.from_bytes(b[:8], 'big') ^ t).to_bytes(8, 'big')
+            r[i] = b[8:]
+    return a + b''.join(r)
+
+
+def unwrap_key(kek, wrapped):
+    """
+    Inverse of `wrap_key`; raises ValueError if the integrity check fails (wrong KEK or tampering)
+    """
+    if len(wrapped) % 8 or len(wrapped) < 24:
+        raise ValueError("invalid wrapped key length")
+    engine = AESEngine(kek)
+    a = wrapped[:8]
+    r = [wrapped[i:i + 8] for i in range(8, len(wrapped), 8)]
+    n = len(r)
+    for j in range(5, -1, -1):
+        for i in range(n - 1, -1, -1):
+            t = n * j + i + 1
+            b = engine.decrypt_block((int.from_bytes(a, 'big') ^ t).to_bytes(8, 'big') + r[i])
+            a, r[i] = b[:8], b[8:]
+    if not hmac.compare_digest(a, WRAP_IV):
+        raise ValueError("key unwrap failed: wrong key-encryption key or corrupted entry")
+    return b''.join(r)
+
+
+def add_recipient(dek, public_key, params='kyber768'):
+    """
+    Wrap `dek` for the holder of `public_key` (encoded bytes or (t_hat, seed)).
+    Returns a Recipient entry.
+    """
+    kyber = ModuleKyber(params)
+    recipient = kyber.recipient(public_key)
+    kem_ciphertext, shared_key, _ = kyber.encapsulate(recipient)
+    return Recipient(params, recipient.fingerprint, kem_ciphertext, wrap_key(derive_kek(shared_key), dek))
+
+
+def recover_key(recipients, public_key, secret, params='kyber768'):
+    """
+    Unwrap the DEK from the entry addressed to `public_key`, using the matching Kyber `secret`
+    """
+    kyber = ModuleKyber(params)
+    pk_bytes = bytes(public_key) if isinstance(public_key, (bytes, bytearray, memoryview)) \
+        else kyber.encode_public_key(public_key)
+    fingerprint = public_key_fingerprint(pk_bytes, params)
+    for entry in recipients:
+        if entry.fingerprint == fingerprint:
+            shared_key = kyber.decapsulate(entry.kem_ciphertext, secret)
+            return unwrap_key(derive_kek(shared_key), entry.wrapped_key)
+    raise KeyError("no wrapped key for this public key")
+
+
+def encode_recipients(recipients):
+    """
+    Serialize Recipient entries for the b'WRAP' header section
+    """
+    parts = [_COUNT.pack(len(recipients))]
+    for entry in recipients:
+        params = entry.params.encode('ascii')
+        parts.append(_ENTRY.pack(len(params), entry.fingerprint, len(entry.kem_ciphertext), len(entry.wrapped_key)))
+        parts += [params, entry.kem_ciphertext, entry.wrapped_key]
+    return b''.join(parts)
+
+
+def decode_recipients(data):
+    """
+    Parse a b'WRAP' header section into a list of Recipient entries
+    """
+    data = bytes(data)
+    (count,) = _COUNT.unpack_from(data, 0)
+    position = _COUNT.size
+    recipients = []
+    for _ in range(count):
+        params_length, fingerprint, kem_length, wrapped_length = _ENTRY.unpack_from(data, position)
+        position += _ENTRY.size
+        params = data[position:position + params_length].decode('ascii')
+        position += params_length
+        kem_ciphertext = data[position:position + kem_length]
+        position += kem_length
+        wrapped_key = data[position:position + wrapped_length]
+        position += wrapped_length
+        recipients.append(Recipient(params, fingerprint, kem_ciphertext, wrapped_key))
+    return recipients
+
+
+def read_recipients(path):
+    """
+    Recipient entries stored in a container (empty if it has no envelope)
+    """
+    with ContainerReader(path) as reader:
+        # No references to the mapped header may outlive the reader
+        return decode_recipients(reader.sections[WRAP_SECTION]) if WRAP_SECTION in reader.sections else []
+
+
+def grant(path, dek, public_key, params='kyber768'):
+    """
+    Give another recipient access to a container: wrap the DEK for them and rewrite the header
+    """
+    recipients = read_recipients(path)
+    recipients.append(add_recipient(dek, public_key, params))
+    update_header(path, {WRAP_SECTION: encode_recipients(recipients)})
+    return recipients
+
+
+def revoke(path, fingerprint):
+    """
+    Remove the wrapped key of the recipient with this public-key fingerprint
+    """
+    recipients = [entry for entry in read_recipients(path) if entry.fingerprint != fingerprint]
+    update_header(path, {WRAP_SECTION: encode_recipients(recipients)})
+    return recipients
+
+
+def rotate(path, dek, public_keys):
+    """
+    Replace every KEK: re-wrap the DEK under fresh encapsulations to `public_keys`, a list of
+    (public key, params) pairs. The payload stays encrypted under the same DEK.
+    """
+    recipients = [add_recipient(dek, public_key, params) for public_key, params in public_keys]
+    update_header(path, {WRAP_SECTION: encode_recipients(recipients)})
+    return recipients
+
+
+"""
+TEST KEY WRAP
+"""
+if __name__ == "__main__":
+    # RFC 3394 section 4.1: 128-bit key data with a 128-bit KEK
+    kek = bytes.fromhex('000102030405060708090A0B0C0D0E0F')
+    key = bytes.fromhex('00112233445566778899AABBCCDDEEFF')
+    wrapped = wrap_key(kek, key)
+    assert wrapped.hex().upper() == '1FA68B0A8112B447AEF34BD8FB5A7B829D3E862371D2CFE5'
+    assert unwrap_key(kek, wrapped) == key
+    print("RFC 3394 test vector: ok")
+
+    dek = new_data_key()
+    kyber = ModuleKyber()
+    keys = [kyber.keygen() for _ in range(3)]
+    recipients = [add_recipient(dek, kyber.encode_public_key(pk)) for pk, _ in keys]
+    recipients = decode_recipients(encode_recipients(recipients))
+    assert all(recover_key(recipients, pk, s) == dek for pk, s in keys)
+    print(f"{len(recipients)} recipients, {len(encode_recipients(recipients))} header bytes, all recover the DEK")
@@ -0,0 +1,234 @@
+# PIPELINE INSTRUMENTATION
+
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+"""
+Stage timers, counters and optional profiling for the encryption pipeline.
+
+Code reports through the module-level helpers:
+
+    with instrument.stage('encrypt'):
+        ...
+    instrument.count('bytes', len(ciphertext))
+    instrument.add_time('pack', seconds) # time measured elsewhere (e.g. in a worker process)
+
+They go to the active `Instrumentation` (see `enable`). While instrumentation is disabled,
+`stage` hands back one shared no-op context manager and `count` / `add_time` return at once,
+so the hooks can stay in production code.
+
+At the end of a run `summary()` gives a JSON-ready dictionary. `prometheus_text()` renders the
+same numbers in the Prometheus text exposition format, which can be written to a file (node
+exporter textfile collector) or served by `serve_prometheus`.
+"""
+
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    # Context manager adding the elapsed time of one stage execution
+    __slots__ = ('owner', 'name', 'started')
+
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.owner.add_time(self.name, time.perf_counter() - self.started)
+
+
+class Instrumentation:
+    """
+    Accumulates stage timings (seconds and calls) and counters. Thread safe.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {} # name -> [seconds, calls]
+        self.counters = {}
+        self.memory_peak = None
+        self.profile_text = None
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds, calls=1):
+        with self._lock:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """
+        Stages, counters, wall time and (when captured) memory peak and profile as a dictionary
+        """
+        with self._lock:
+            summary = {
+                'wall_seconds': time.perf_counter() - self.started,
+                'stages': {name: {'seconds': seconds, 'calls': calls}
+                           for name, (seconds, calls) in self.stages.items()},
+                'counters': dict(self.counters),
+            }
+        if self.memory_peak is not None:
+            summary['memory_peak_bytes'] = self.memory_peak
+        if self.profile_text is not None:
+            summary['profile'] = self.profile_text
+        return summary
+
+    def prometheus_text(self, prefix='dnavault'):
+        """
+        Render the metrics in the Prometheus text exposition format
+        """
+        summary = self.summary()
+        lines = [f"# TYPE {prefix}_stage_seconds_total counter"]
+        lines += [f'{prefix}_stage_seconds_total{{stage="{name}"}} {stage["seconds"]:.6f}'
+                  for name, stage in summary['stages'].items()]
+        lines.append(f"# TYPE {prefix}_stage_calls_total counter")
+        lines += [f'{prefix}_stage_calls_total{{stage="{name}"}} {stage["calls"]}'
+                  for name, stage in summary['stages'].items()]
+        for name, value in summary['counters'].items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        lines.append(f"# TYPE {prefix}_wall_seconds gauge")
+        lines.append(f"{prefix}_wall_seconds {summary['wall_seconds']:.6f}")
+        if 'memory_peak_bytes' in summary:
+            lines.append(f"# TYPE {prefix}_memory_peak_bytes gauge")
+            lines.append(f"{prefix}_memory_peak_bytes {summary['memory_peak_bytes']}")
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def write_prometheus(self, path):
+        with open(path, 'w') as file:
+            file.write(self.prometheus_text())
+
+
+# The active instrumentation, None while disabled
+_active = None
+
+
+def enable():
+    """
+    Start collecting metrics in a fresh Instrumentation and return it
+    """
+    global _active
+    _active = Instrumentation()
+    return _active
+
+
+def disable():
+    global _active
+    _active = None
+
+
+def active():
+    return _active
+
+
+def stage(name):
+    """
+    Context manager timing one stage (a shared no-op while disabled)
+    """
+    return _NULL_STAGE if _active is None else _active.stage(name)
+
+
+def add_time(name, seconds, calls=1):
+    if _active is not None:
+        _active.add_time(name, seconds, calls)
+
+
+def count(name, value=1):
+    if _active is not None:
+        _active.count(name, value)
+
+
+def timed_iter(iterable, name):
+    """
+    Iterate `iterable`, charging the time spent producing each item to stage `name`
+    (the iterable itself while disabled)
+    """
+    if _active is None:
+        return iterable
+    return _timed_iter(_active, iter(iterable), name)
+
+
+def _timed_iter(owner, iterator, name):
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            owner.add_time(name, time.perf_counter() - started)
+            return
+        owner.add_time(name, time.perf_counter() - started)
+        yield item
+
+
+@contextmanager
+def profiling(cpu=False, memory=False, top=25):
+    """
+    Optionally capture a cProfile report (`cpu`) and the tracemalloc peak (`memory`) of the
+    enclosed code into the active instrumentation
+    """
+    owner = _active
+    profiler = cProfile.Profile() if cpu else None
+    if memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(top)
+            if owner is not None:
+                owner.profile_text = report.getvalue()
+        if memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            if owner is not None:
+                owner.memory_peak = peak
+
+
+def serve_prometheus(port, host='127.0.0.1'):
+    """
+    Stub /metrics endpoint for the active instrumentation, served from a daemon thread.
+    Returns the server; call `shutdown()` on it to stop.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics' or _active is None:
+                self.send_error(404)
+                return
+            body = _active.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,198 @@
+# CHUNK AUTHENTICATION AND MERKLE TREES
+
+import hashlib
+import hmac
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Integrity protection for the container payload (encrypt-then-MAC).
+
+The ciphertext stream is cut into fixed chunks of MAC_CHUNK bytes and every chunk gets an
+HMAC-SHA256 tag over (chunk index || ciphertext), keyed with a MAC key derived from the data
+key. The tags are the leaves of a Merkle tree; the header stores the chunk size, the root and
+all leaves (32 bytes per 256 KiB, about 0.01% of the payload).
+
+- Whole-file verification recomputes every tag. HMAC releases the GIL, so chunks are checked
+  on a thread pool straight from the memory-mapped file.
+- A region is verified by recomputing only the tags of the chunks it covers, and each tag is
+  checked against the root with a proof of log2(chunks) sibling hashes. A reader who trusts
+  only the root can therefore check a locus without the rest of the header.
+
+Inner tree nodes are SHA-256(0x01 || left || right). A node without a sibling is carried up
+unchanged.
+
+The container index (record table, names, block table...) is authenticated too: one more
+HMAC-SHA256 tag over the serialized index sections is stored after the leaves, and both whole
+and region verification check it, so a rewritten index cannot point reads at other bytes.
+"""
+
+MAC_CHUNK = 1 << 18 # Ciphertext bytes per tag
+MAC_INFO = b'DNAVault MAC v1'
+INDEX_INFO = b'DNAVault index v1'
+TAG_SIZE = 32
+TREE = struct.Struct('<IQ32s') # chunk size, leaf count, root
+
+
+def derive_mac_key(key):
+    """
+    MAC key from the data key (domain-separated SHA-256)
+    """
+    return hashlib.sha256(MAC_INFO + bytes(key)).digest()
+
+
+def chunk_tag(mac_key, index, data):
+    """
+    HMAC-SHA256 tag of one ciphertext chunk
+    """
+    tag = hmac.new(mac_key, index.to_bytes(8, 'little'), hashlib.sha256)
+    tag.update(data)
+    return tag.digest()
+
+
+def index_tag(mac_key, index):
+    """
+    HMAC-SHA256 tag of the serialized index sections
+    """
+    return hmac.new(mac_key, INDEX_INFO + bytes(index), hashlib.sha256).digest()
+
+
+class ChunkTagger:
+    """
+    Compute chunk tags incrementally over a stream written in pieces of any size
+    """
+    def __init__(self, mac_key, chunk_size=MAC_CHUNK):
+        self.mac_key = mac_key
+        self.chunk_size = chunk_size
+        self.tags = []
+        self._current = None # HMAC of the chunk being filled
+        self._filled = 0
+
+    def update(self, data):
+        data = memoryview(data).cast('B')
+        while len(data):
+            if self._current is None:
+                self._current = hmac.new(self.mac_key, len(self.tags).to_bytes(8, 'little'), hashlib.sha256)
+            take = min(len(data), self.chunk_size - self._filled)
+            self._current.update(data[:take])
+            self._filled += take
+            data = data[take:]
+            if self._filled == self.chunk_size:
+                self._close_chunk()
+
+    def _close_chunk(self):
+        self.tags.append(self._current.digest())
+        self._current = None
+        self._filled = 0
+
+    def finish(self):
+        """
+        Close the last partial chunk and return all tags
+        """
+        if self._filled:
+            self._close_chunk()
+        return self.tags
+
+
+def _parent(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def merkle_levels(leaves):
+    """
+    Every level of the tree, from the leaves up to the root
+    """
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_parent(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1]) # Carried up without a sibling
+        levels.append(parents)
+    return levels
+
+
+def merkle_root(leaves):
+    """
+    Root of the tree over `leaves` (32 zero bytes for an empty tree)
+    """
+    return merkle_levels(leaves)[-1][0] if leaves else bytes(TAG_SIZE)
+
+
+def merkle_proof(leaves, index, levels=None):
+    """
+    Sibling hashes from leaf `index` up to the root
+    """
+    proof = []
+    for level in (levels or merkle_levels(leaves))[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(level[sibling])
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf, index, count, proof, root):
+    """
+    Check that `leaf` is leaf `index` of a tree with `count` leaves and the given root
+    """
+    node = leaf
+    proof = iter(proof)
+    while count > 1:
+        if index ^ 1 < count:
+            sibling = next(proof, None)
+            if sibling is None:
+                return False
+            node = _parent(sibling, node) if index & 1 else _parent(node, sibling)
+        index //= 2
+        count = (count + 1) // 2
+    return next(proof, None) is None and hmac.compare_digest(node, root)
+
+
+def encode_tree(chunk_size, tags, index):
+    """
+    Serialize the chunk size, root, leaves and index tag for the b'MACS' header section
+    """
+    return TREE.pack(chunk_size, len(tags), merkle_root(tags)) + b''.join(tags) + index
+
+
+def decode_tree(data):
+    """
+    Parse a b'MACS' section into (chunk size, root, list of tags, index tag or None)
+    """
+    chunk_size, count, root = TREE.unpack_from(data, 0)
+    end = TREE.size + count * TAG_SIZE
+    tags = bytes(data[TREE.size:end])
+    index = bytes(data[end:end + TAG_SIZE])
+    return (chunk_size, root, [tags[i:i + TAG_SIZE] for i in range(0, len(tags), TAG_SIZE)],
+            index if len(index) == TAG_SIZE else None)
+
+
+def compute_tags(mac_key, payload, chunk_size, indices, workers=None):
+    """
+    Recompute the tags of the chunks `indices` of `payload`, in parallel threads
+    """
+    workers = workers or os.cpu_count()
+
+    def tag(index):
+        return chunk_tag(mac_key, index, payload[index * chunk_size:(index + 1) * chunk_size])
+
+    if workers <= 1 or len(indices) <= 1:
+        return [tag(index) for index in indices]
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(tag, indices))
+
+
+def verify_payload(mac_key, payload, chunk_size, tags, root, workers=None):
+    """
+    Verify a whole payload. Returns the indices of corrupted chunks (empty when intact);
+    raises ValueError if the stored tags do not match the root or the payload length.
+    """
+    if merkle_root(tags) != root:
+        raise ValueError("integrity tags do not match the Merkle root")
+    if len(tags) != (len(payload) + chunk_size - 1) // chunk_size:
+        raise ValueError("payload length does not match the integrity tags")
+    computed = compute_tags(mac_key, payload, chunk_size, range(len(tags)), workers)
+    return [index for index, (stored, fresh) in enumerate(zip(tags, computed))
+            if not hmac.compare_digest(stored, fresh)]
@@ -3,25 +3,53 @@
 # - keygen(): Generates public and secret keys.
 # - encapsulate(): Generates a shared secret and ciphertext using public key.
 # - decapsulate(): Recovers the shared secret from ciphertext using private key.
+# - keygen_batch() / encapsulate_batch() / decapsulate_batch(): the same operations for B sessions
+#   at once on (B, n) arrays.
+#
+# class ModuleKyber:
+# Module-lattice variant with the Kyber-512/768/1024 ranks (k = 2, 3, 4). The public matrix A is
+# expanded from a 32-byte seed with SHAKE-128, so the public key is just (t, seed).
+# Public keys and ciphertexts travel as compact byte strings (see kyber_codec).
+#
+# class RecipientKey / RecipientCache:
+# A public key converted to NTT form once, and a bounded LRU + TTL cache of them keyed by the
+# public-key fingerprint, so repeated encapsulations to the same recipient skip the setup.
+#
+# ModuleKyber.decapsulate is CCA-secure through the Fujisaki-Okamoto transform: the encryption
+# coins are derived from (m, H(pk)), the decapsulator re-encrypts the decoded message and
+# compares, and a mismatching ciphertext gets the implicit-rejection key H(z || ct).
+#
+# All randomness comes from a per-instance seeded SHAKE-256 stream (see sampler): pass `seed` to
+# reproduce every key, noise vector and message.
 
 import numpy as np
 import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+from backend import ntt
+from backend import kyber_codec
+from backend.sampler import Sampler, uniform_candidates
 
 class Kyber:
-   def __init__(self, n = 256, q = 3329, sigma = 0.15, clamp = 4):
+   def __init__(self, n = 256, q = 3329, eta = 2, seed = None):
       self.n = n  #polynomial degree
       self.q = q  #modulus, we use a prime number for modular arithmetic and 3329 is chosen as it fits in 12 bits
-      self.sigma = sigma  #standard deviation for noise
-      self.clamp = clamp  #max noise value to limit extreme error which could cause decryption failure
+      self.eta = eta  #noise coefficients lie in [-eta, eta], small enough to avoid decryption failures
+      self.sampler = Sampler(seed)  #seeded SHAKE-256 stream behind every random value
      
    # Generates a random polynomial with coefficients in range [0, q-1]
-   def randomPoly(self):
+   def randomPoly(self, count = None):
       """
       picks values between n and q and then calulates a polynomial using a(x) = a₀ + a₁·x + a₂·x² + ... + aₙ₋₁·xⁿ⁻¹ mod q
       for eg-  np.random.randint(0, 17, 4)  might return: [6, 3, 13, 10]
       then  the polynomial is calculated as a(x) = 6 + 3·x + 13·x² + 10·x³ mod 17
+      With `count`, returns a (count, n) array of independent polynomials.
       """
-      return np.random.randint(0, self.q, self.n) 
+      return self.sampler.uniform(self._shape(count), self.q)
 
    def flatten_key_matrix(matrix):  
     """
@@ -34,40 +62,56 @@ class Kyber:
     return bytes(flat)  # 16 bytes for AES-128
 
 
-   # Generates a random array of integers from -clamp to clamp which is centered around 0. 
-   # This is used to create the error noise polynomial(e) in the formula pk = A·s + e
-   def noisePoly(self):
+   # Generates a random array of integers from -eta to eta which is centered around 0. 
+   # This is used to create the secret (s) and error noise polynomial (e) in the formula pk = A·s + e
+   def noisePoly(self, count = None, eta = None):
       """
-      Generates a polynomial with small integer coefficients sampled from
-      a discrete Gaussian distribution centered at 0.
-      Coefficients are clamped to [-clamp, clamp].
+      Generates a polynomial with small integer coefficients sampled from the
+      centered binomial distribution CBD(eta): the difference of two sums of eta random bits.
+      With `count`, returns a (count, n) array of independent polynomials.
       """
-      noise = np.random.normal(0, self.sigma, self.n)
-      return np.clip(np.round(noise), -self.clamp, self.clamp).astype(int)
+      return self.sampler.cbd(eta or self.eta, self._shape(count))
+
+   # Shape of one polynomial, or of a batch of `count` polynomials
+   def _shape(self, count):
+      return self.n if count is None else (count, self.n)
 
    # Adds two polynomials
    def polyAdd(self, a, b):
       return (a + b) % self.q
 
-   # Multiplies 2 polynomials using the convolve method and then limits it to a max degree of n(256).
-   # This gives a good trade off between efficiency and calculation time
+   # Multiplies 2 polynomials in the ring Z_q[x]/(x^n + 1).
+   # A single product is fastest as a negacyclic convolution (one np.convolve call); batches of
+   # shape (B, n), broadcast against each other, go through the number-theoretic transform in
+   # O(n log n) for the Kyber parameters (n = 256, q = 3329), which amortizes its numpy overhead.
    def polyMul(self, a , b):
-      result = np.convolve(a, b)[:self.n]
-      return result % self.q
+      if np.ndim(a) == 1 and np.ndim(b) == 1:
+         return ntt.negacyclic_convolve(a, b, self.q)
+      if self.n == ntt.N and self.q == ntt.Q:
+         return ntt.poly_mul(a, b)
+      return self.polyMulConvolve(a, b)
+
+   # O(n^2) reference multiplication with reduction modulo x^n + 1 (x^n = -1)
+   def polyMulConvolve(self, a, b):
+      a, b = np.broadcast_arrays(np.asarray(a), np.asarray(b))
+      if a.ndim == 1:
+         return ntt.negacyclic_convolve(a, b, self.q)
+      return np.array([ntt.negacyclic_convolve(x, y, self.q) for x, y in zip(a, b)])
    
    #encodes 256 bits message into a polynomial
    def encodeMessage(self, m):
       #encodes 256 bits message into a polynomial
       bit_array = np.unpackbits(np.frombuffer(m, dtype=np.uint8)).astype(np.int32)
-      high = int(self.q * 3 / 4)  # safer encoding for 1
+      high = (self.q + 1) // 2  # 1 sits at q/2, as far as possible from 0 in both directions
       return (bit_array * high).astype(np.int32)
 
 
    
    # Decodes a polynomial back into a 256 bits message
    def decodeMessage(self, poly):
-    threshold = self.q // 2  # 1664
-    bits = (poly > threshold).astype(np.uint8)
+    # A coefficient is a 1 when it is closer to q/2 than to 0 (mod q), so noise of either
+    # sign up to q/4 is tolerated
+    bits = (np.abs(np.asarray(poly) % self.q - self.q // 2) < self.q // 4).astype(np.uint8)
     return np.packbits(bits).tobytes()
  
    # Generates a public key that is shared and is used in encapsulation.
@@ -82,7 +126,7 @@ class Kyber:
        - pk = A * s + e (mod q) is the public key
       """
       A = self.randomPoly() #Public Matrix A
-      s = self.randomPoly() #Secret polynomial
+      s = self.noisePoly() #Secret polynomial (small, so decapsulation noise stays below q/4)
       e = self.noisePoly() #error polynomial or noise
       pk = self.polyAdd(self.polyMul(A,s), e) #pk = A * s + e (mod q)
       return A,s,pk #return values
@@ -97,10 +141,10 @@ class Kyber:
        - v = pk * r + e2 (mod q)
        - The shared AES key is derived by hashing (u || v || m)
       """
-      r = self.randomPoly() # fresh secret for this session
+      r = self.noisePoly() # fresh small secret for this session
       e1 = self.noisePoly() # error for u
       e2 = self.noisePoly() # error for v
-      m = np.random.bytes(32)  #256 bit random message for AES key derivation (needed to derive a unique key for each session)
+      m = self.sampler.random_bytes(32)  #256 bit random message for AES key derivation (needed to derive a unique key for each session)
       m_encoded = self.encodeMessage(m)
       
       u = self.polyAdd(self.polyMul(A, r), e1)  # u = A·r + e1 
@@ -129,7 +173,418 @@ class Kyber:
       combined = u.astype(np.uint16).tobytes() + v.astype(np.uint16).tobytes() + m_recovered
       shared_key = hashlib.sha256(combined).digest()
       return shared_key
-   
-   
 
+   # ===================== BATCHED SESSIONS =====================
+   # Every batch method handles B independent sessions with one set of vectorized polynomial
+   # operations; only the SHA-256 key derivation runs per session.
+
+   def keygen_batch(self, B):
+      """
+      Generate B key pairs at once. Returns (A, s, pk), each of shape (B, n).
+      """
+      A = self.randomPoly(B)
+      s = self.noisePoly(B)
+      e = self.noisePoly(B)
+      pk = self.polyAdd(self.polyMul(A, s), e)
+      return A, s, pk
+
+   def encapsulate_batch(self, pks, A):
+      """
+      Encapsulate to B public keys (B, n). A is (B, n) or a single (n,) polynomial shared by all.
+      Returns ((u, v), shared_keys, m) where u and v are (B, n), shared_keys is a list of
+      B 32-byte keys and m is a (B, 32) uint8 array of messages.
+      """
+      pks = np.asarray(pks)
+      B = len(pks)
+      r = self.noisePoly(B)
+      e1 = self.noisePoly(B)
+      e2 = self.noisePoly(B)
+      m = np.frombuffer(self.sampler.random_bytes(32 * B), dtype=np.uint8).reshape(B, 32)
+      m_encoded = self.encodeMessages(m)
+
+      u = self.polyAdd(self.polyMul(A, r), e1)
+      v = self.polyAdd(self.polyAdd(self.polyMul(pks, r), m_encoded), e2)
+      return (u, v), self._derive_keys(u, v, m), m
+
+   def decapsulate_batch(self, us, vs, s):
+      """
+      Decapsulate B ciphertexts. `s` is one secret (n,) or one secret per session (B, n).
+      Returns a list of B shared keys.
+      """
+      us, vs = np.asarray(us), np.asarray(vs)
+      v_prime = self.polyMul(us, s)
+      m_recovered = self.decodeMessages((vs - v_prime) % self.q)
+      return self._derive_keys(us, vs, m_recovered)
+
+   def encodeMessages(self, m):
+      # Vectorized encodeMessage for a (B, 32) uint8 array of messages
+      bits = np.unpackbits(np.asarray(m, dtype=np.uint8), axis=-1).astype(np.int32)
+      return bits * ((self.q + 1) // 2)
+
+   def decodeMessages(self, polys):
+      # Vectorized decodeMessage, returning a (B, 32) uint8 array
+      bits = np.abs(np.asarray(polys) % self.q - self.q // 2) < self.q // 4
+      return np.packbits(bits.astype(np.uint8), axis=-1)
+
+   def _derive_keys(self, u, v, m):
+      # SHA-256(u || v || m) per session, same serialization as encapsulate/decapsulate
+      u_bytes = memoryview(np.ascontiguousarray(u.astype(np.uint16))).cast('B')
+      v_bytes = memoryview(np.ascontiguousarray(v.astype(np.uint16))).cast('B')
+      m_bytes = memoryview(np.ascontiguousarray(m, dtype=np.uint8)).cast('B')
+      row, m_row = 2 * self.n, m.shape[-1]
+      sha256 = hashlib.sha256
+      keys = []
+      for i in range(len(u)):
+         digest = sha256(u_bytes[i * row:(i + 1) * row])
+         digest.update(v_bytes[i * row:(i + 1) * row])
+         digest.update(m_bytes[i * m_row:(i + 1) * m_row])
+         keys.append(digest.digest())
+      return keys
+
+
+# Module rank, CBD widths (eta1 for s, e, r; eta2 for e1, e2) and ciphertext compression bits
+# (d_u for u, d_v for v) of the standard parameter sets
+KYBER_PARAMS = {
+   'kyber512': {'k': 2, 'eta1': 3, 'eta2': 2, 'du': 10, 'dv': 4},
+   'kyber768': {'k': 3, 'eta1': 2, 'eta2': 2, 'du': 10, 'dv': 4},
+   'kyber1024': {'k': 4, 'eta1': 2, 'eta2': 2, 'du': 11, 'dv': 5},
+}
+
+SEED_BYTES = 32
+
+
+@lru_cache(maxsize=64)
+def expand_matrix(seed, k):
+   """
+   Expand a 32-byte seed into the k x k public matrix, directly in the NTT domain.
+   Entry (i, j) is rejection-sampled from SHAKE-128(seed || j || i): every 3 bytes give two
+   12-bit candidates and candidates >= q are dropped.
+   The result is cached per seed (read-only), so encapsulations to the same key share it.
+   """
+   matrix = np.empty((k, k, ntt.N), dtype=np.int64)
+   for i in range(k):
+      for j in range(k):
+         xof = hashlib.shake_128(seed + bytes([j, i]))
+         length = 672 # 448 candidates; more than 256 survive except with negligible probability
+         while True:
+            candidates = uniform_candidates(xof.digest(length))
+            accepted = candidates[candidates < ntt.Q]
+            if len(accepted) >= ntt.N:
+               break
+            length *= 2
+         matrix[i, j] = accepted[:ntt.N]
+   matrix.setflags(write=False)
+   return matrix
+
+
+def public_key_fingerprint(pk_bytes, params):
+   # SHA-256 over the parameter set and the encoded public key
+   return hashlib.sha256(params.encode() + b'\0' + bytes(pk_bytes)).digest()
+
+
+# Module-Kyber secret key: the secret vector s, the encoded public key (needed for the
+# re-encryption check) and the implicit-rejection secret z
+SecretKey = namedtuple('SecretKey', ['s', 'pk_bytes', 'z'])
+
+
+class RecipientKey:
+   """
+   A recipient's Module-Kyber public key prepared for repeated encapsulation: t and the transposed
+   matrix A^T are kept in the NTT domain, so an encapsulation only samples its noise and does
+   pointwise products. `pk` is the encoded public key or a (t_hat, seed) pair.
+   """
+   def __init__(self, pk, params = 'kyber768'):
+      k = KYBER_PARAMS[params]['k']
+      if isinstance(pk, (bytes, bytearray, memoryview)):
+         pk_bytes = bytes(pk)
+         expected = k * ntt.N * 12 // 8 + SEED_BYTES
+         if len(pk_bytes) != expected:
+            raise ValueError(f"{params} public keys are {expected} bytes, got {len(pk_bytes)}")
+         t_hat, seed = kyber_codec.decode_public_key(pk_bytes, k)
+      else:
+         t_hat, seed = pk
+         pk_bytes = kyber_codec.encode_public_key(t_hat, seed)
+
+      self.params = params
+      self.k = k
+      self.seed = seed
+      self.pk_bytes = pk_bytes
+      self.fingerprint = public_key_fingerprint(pk_bytes, params)
+      self.t_hat = np.ascontiguousarray(np.asarray(t_hat, dtype=np.int64) % ntt.Q)
+      self.A_hat_T = np.ascontiguousarray(expand_matrix(seed, k).transpose(1, 0, 2))
+      for table in (self.t_hat, self.A_hat_T):
+         table.setflags(write=False)
+
+   @property
+   def nbytes(self):
+      # Memory held by the precomputed NTT-domain arrays and the encoded key
+      return self.t_hat.nbytes + self.A_hat_T.nbytes + len(self.pk_bytes)
+
+
+class RecipientCache:
+   """
+   Bounded cache of RecipientKey objects keyed by public-key fingerprint.
+   Entries are evicted least recently used beyond `maxsize` and expire `ttl` seconds after they
+   were prepared. Safe to share between threads; hit/miss counts and memory use are exposed.
+   """
+   def __init__(self, maxsize = 64, ttl = 3600.0, clock = time.monotonic):
+      self.maxsize = maxsize
+      self.ttl = ttl
+      self.clock = clock
+      self.hits = 0
+      self.misses = 0
+      self.expirations = 0
+      self._entries = OrderedDict() # fingerprint -> (RecipientKey, expiry time)
+      self._lock = threading.Lock()
+
+   def get(self, pk, params = 'kyber768'):
+      """
+      Return the prepared RecipientKey for `pk`, building it only on a miss or after expiry
+      """
+      if isinstance(pk, (bytes, bytearray, memoryview)):
+         pk_bytes = bytes(pk)
+      else:
+         pk_bytes = kyber_codec.encode_public_key(*pk)
+      fingerprint = public_key_fingerprint(pk_bytes, params)
+      with self._lock:
+         entry = self._entries.get(fingerprint)
+         if entry is not None:
+            if entry[1] > self.clock():
+               self._entries.move_to_end(fingerprint) # Mark as most recently used
+               self.hits += 1
+               return entry[0]
+            del self._entries[fingerprint]
+            self.expirations += 1
+         self.misses += 1
+
+      # Prepare outside the lock so other recipients are not blocked
+      recipient = RecipientKey(pk_bytes, params)
+      with self._lock:
+         self._entries[fingerprint] = (recipient, self.clock() + self.ttl)
+         self._entries.move_to_end(fingerprint)
+         while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False) # Evict the least recently used recipient
+      return recipient
+
+   def stats(self):
+      """
+      Return the cache counters, hit rate and memory footprint (bytes) as a dictionary
+      """
+      with self._lock:
+         lookups = self.hits + self.misses
+         return {'hits': self.hits, 'misses': self.misses, 'expirations': self.expirations,
+                 'hit_rate': self.hits / lookups if lookups else 0.0,
+                 'size': len(self._entries), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                 'bytes': sum(recipient.nbytes for recipient, _ in self._entries.values())}
+
+   def clear(self):
+      with self._lock:
+         self._entries.clear()
+         self.hits = 0
+         self.misses = 0
+         self.expirations = 0
+
+
+# Process-wide cache used by ModuleKyber.encapsulate
+recipient_cache = RecipientCache()
+
+
+class ModuleKyber(Kyber):
+   """
+   Module-Kyber: polynomials become length-k vectors of polynomials and A a k x k matrix.
+   Only the seed of A is public, so keys and transfers no longer carry A itself.
+   Vectors are kept as (k, n) arrays; A and t are stored in the NTT domain.
+   On the wire, public keys pack t at 12 bits per coefficient and ciphertexts are compressed
+   to d_u / d_v bits per coefficient.
+   """
+   def __init__(self, params = 'kyber768', **kwargs):
+      super().__init__(**kwargs)
+      if (self.n, self.q) != (ntt.N, ntt.Q):
+         raise ValueError("ModuleKyber requires n = 256 and q = 3329")
+      self.params = params
+      self.k = KYBER_PARAMS[params]['k']
+      self.eta1 = KYBER_PARAMS[params]['eta1']
+      self.eta = KYBER_PARAMS[params]['eta2']
+      self.du = KYBER_PARAMS[params]['du']
+      self.dv = KYBER_PARAMS[params]['dv']
+      self.public_key_bytes = self.k * self.n * 12 // 8 + SEED_BYTES
+      self.ciphertext_bytes = (self.k * self.du + self.dv) * self.n // 8
+
+   def encode_public_key(self, pk):
+      # (t_hat, seed) -> bytes
+      t_hat, seed = pk
+      return kyber_codec.encode_public_key(t_hat, seed)
+
+   def decode_public_key(self, data):
+      # bytes -> (t_hat, seed)
+      if len(data) != self.public_key_bytes:
+         raise ValueError(f"{self.params} public keys are {self.public_key_bytes} bytes, got {len(data)}")
+      return kyber_codec.decode_public_key(data, self.k, self.n)
+
+   def encode_ciphertext(self, u, v):
+      # Compressed (u, v) -> bytes; decoding gives back u and v up to the rounding of Compress_q
+      return kyber_codec.encode_ciphertext(u, v, self.du, self.dv)
+
+   def decode_ciphertext(self, data):
+      # bytes -> (u, v)
+      if len(data) != self.ciphertext_bytes:
+         raise ValueError(f"{self.params} ciphertexts are {self.ciphertext_bytes} bytes, got {len(data)}")
+      return kyber_codec.decode_ciphertext(data, self.k, self.du, self.dv, self.n)
+
+   def recipient(self, pk):
+      # Prepared RecipientKey for `pk`, shared through the process-wide cache
+      if isinstance(pk, RecipientKey):
+         if pk.params != self.params:
+            raise ValueError(f"recipient key is {pk.params}, expected {self.params}")
+         return pk
+      return recipient_cache.get(pk, self.params)
+
+   def keygen(self):
+      """
+      Key Generation:
+       - seed expands to the public matrix A
+       - s, e are small secret / noise vectors
+       - t = A·s + e (mod q), kept in the NTT domain
+      Returns the public key (t_hat, seed) and the SecretKey (s, encoded public key, z).
+      """
+      seed = self.sampler.random_bytes(SEED_BYTES)
+      A_hat = expand_matrix(seed, self.k)
+      s = self.noisePoly(self.k, self.eta1) #Secret vector
+      e = self.noisePoly(self.k, self.eta1) #error vector
+      t_hat = (ntt.basemul(A_hat, ntt.ntt(s)).sum(axis=1) + ntt.ntt(e)) % self.q
+      z = self.sampler.random_bytes(32) # implicit-rejection secret
+      return (t_hat, seed), SecretKey(s, kyber_codec.encode_public_key(t_hat, seed), z)
+
+   def _encrypt(self, recipient, m, coins):
+      # Deterministic CPA encryption of m: r, e1 and e2 all come from the 32-byte coins
+      sampler = Sampler(coins)
+      r_hat = ntt.ntt(sampler.cbd(self.eta1, (self.k, self.n)))
+      e1 = sampler.cbd(self.eta, (self.k, self.n))
+      e2 = sampler.cbd(self.eta, self.n)
+
+      u = self.polyAdd(ntt.intt(ntt.basemul(recipient.A_hat_T, r_hat).sum(axis=1) % self.q), e1)
+      v = ntt.intt(ntt.basemul(recipient.t_hat, r_hat).sum(axis=0) % self.q)
+      v = self.polyAdd(self.polyAdd(v, self.encodeMessage(m)), e2)
+      return self.encode_ciphertext(u, v)
+
+   @staticmethod
+   def _coins(m, recipient):
+      # Encryption coins bound to the message and the recipient's public key
+      return hashlib.sha256(b'DNAVault KEM coins\0' + m + recipient.fingerprint).digest()
+
+   def encapsulate(self, pk):
+      """
+      Encapsulation to a public key (t_hat, seed), its encoded bytes or a RecipientKey:
+       - coins = H(m || H(pk)) seed the noise r, e1, e2
+       - u = A^T·r + e1 (mod q)
+       - v = t^T·r + e2 + encode(m) (mod q)
+       - The ciphertext is the compressed encoding of (u, v)
+       - The shared AES key is derived by hashing (ciphertext || m)
+      Returns (ciphertext bytes, shared key, m).
+      """
+      recipient = self.recipient(pk)
+      m = self.sampler.random_bytes(32)
+      ciphertext = self._encrypt(recipient, m, self._coins(m, recipient))
+      shared_key = hashlib.sha256(ciphertext + m).digest()
+      return ciphertext, shared_key, m
+
+   def decapsulate(self, ciphertext, secret):
+      """
+      Decapsulation with the SecretKey from keygen:
+       - decompress (u, v), m' = decode(v - s^T·u)
+       - re-encrypt m' with its derived coins; if that reproduces the ciphertext the key is the
+         same hash as encapsulation, otherwise the implicit-rejection key H(z || ciphertext)
+      A forged ciphertext therefore yields an unrelated key instead of leaking information on s.
+      """
+      ciphertext = bytes(ciphertext)
+      u, v = self.decode_ciphertext(ciphertext)
+      su = ntt.intt(ntt.basemul(ntt.ntt(secret.s), ntt.ntt(u)).sum(axis=0) % self.q)
+      m_recovered = self.decodeMessage((v - su) % self.q)
+
+      recipient = self.recipient(secret.pk_bytes)
+      expected = self._encrypt(recipient, m_recovered, self._coins(m_recovered, recipient))
+      accepted = hashlib.sha256(ciphertext + m_recovered).digest()
+      rejected = hashlib.sha256(b'DNAVault KEM reject\0' + secret.z + ciphertext).digest()
+      return accepted if hmac.compare_digest(expected, ciphertext) else rejected
+
+
+"""
+BENCHMARK NTT MULTIPLICATION AGAINST THE CONVOLUTION
+"""
+if __name__ == "__main__":
+   kyber = Kyber()
+   a, b = kyber.randomPoly(), kyber.randomPoly()
+   assert np.array_equal(ntt.poly_mul(a, b), kyber.polyMulConvolve(a, b)) # Same product in the ring
+
+   for name, multiply in (("NTT", ntt.poly_mul), ("convolve", kyber.polyMulConvolve)):
+      rounds = 2000
+      start = time.perf_counter()
+      for _ in range(rounds):
+         multiply(a, b)
+      elapsed = (time.perf_counter() - start) / rounds
+      print(f"{name:>8}: {elapsed * 1e6:8.1f} us per multiplication")
+
+   # The NTT transforms a whole batch of polynomials with the same numpy calls
+   batch_a, batch_b = kyber.randomPoly(256), kyber.randomPoly(256)
+   start = time.perf_counter()
+   ntt.poly_mul(batch_a, batch_b)
+   elapsed = (time.perf_counter() - start) / len(batch_a)
+   print(f"NTT x256: {elapsed * 1e6:8.1f} us per multiplication")
+
+   # Batched sessions against one-at-a-time sessions
+   for B in (1, 16, 256):
+      start = time.perf_counter()
+      A, s, pk = kyber.keygen_batch(B)
+      (u, v), shared_keys, m = kyber.encapsulate_batch(pk, A)
+      recovered = kyber.decapsulate_batch(u, v, s)
+      elapsed = time.perf_counter() - start
+      print(f"batch {B:3d}: {B / elapsed:8.1f} sessions/s, "
+            f"shared keys match: {sum(a == b for a, b in zip(recovered, shared_keys))}/{B}")
+
+   # Round trip through the KEM with the NTT multiplication
+   A, s, pk = kyber.keygen()
+   (u, v), shared_key, m = kyber.encapsulate(pk, A)
+   print(f"Shared keys match: {kyber.decapsulate(u, v, s) == shared_key}")
+
+   # Module-Kyber: the public key carries a 32-byte seed instead of A, and keys and ciphertexts
+   # are bit-packed (sizes compared with 16 bits per coefficient)
+   for params in KYBER_PARAMS:
+      module_kyber = ModuleKyber(params)
+      pk, s = module_kyber.keygen()
+      pk_bytes = module_kyber.encode_public_key(pk)
+      decoded_t, decoded_seed = module_kyber.decode_public_key(pk_bytes)
+      assert np.array_equal(decoded_t, pk[0]) and decoded_seed == pk[1] # Lossless
+      matches = 0
+      for _ in range(100):
+         ciphertext, shared_key, m = module_kyber.encapsulate(pk_bytes)
+         matches += module_kyber.decapsulate(ciphertext, s) == shared_key
+      k = module_kyber.k
+      forged = module_kyber.decapsulate(bytes(module_kyber.ciphertext_bytes), s) # Implicit rejection
+      assert forged == module_kyber.decapsulate(bytes(module_kyber.ciphertext_bytes), s) != shared_key
+      print(f"{params}: public key {len(pk_bytes)} bytes (was {2 * k * kyber.n + SEED_BYTES}), "
+            f"ciphertext {len(ciphertext)} bytes (was {2 * (k + 1) * kyber.n}), "
+            f"shared keys match: {matches}/100")
+
+   # Everything is reproducible from the session seed
+   first, second = ModuleKyber(seed=bytes(32)), ModuleKyber(seed=bytes(32))
+   pk, s = first.keygen()
+   assert first.encode_public_key(pk) == second.encode_public_key(second.keygen()[0])
+   assert first.encapsulate(pk) == second.encapsulate(pk)
+   print(f"Seeded sessions reproducible, shared key {first.encapsulate(pk)[1].hex()[:16]}...")
 
+   # Repeated encapsulation to a few recipients: prepared keys against rebuilding every time
+   module_kyber = ModuleKyber()
+   recipients = [module_kyber.encode_public_key(module_kyber.keygen()[0]) for _ in range(4)]
+   rounds = 400
+   def rebuild(pk):
+      expand_matrix.cache_clear()
+      return RecipientKey(pk, module_kyber.params)
+   for name, prepare in (("uncached", rebuild),
+                         ("cached", module_kyber.recipient)):
+      recipient_cache.clear()
+      start = time.perf_counter()
+      for i in range(rounds):
+         module_kyber.encapsulate(prepare(recipients[i % len(recipients)]))
+      print(f"{name:>9}: {rounds / (time.perf_counter() - start):8.1f} encapsulations/s")
+   stats = recipient_cache.stats()
+   print(f"recipient cache: hit rate {stats['hit_rate']:.1%}, {stats['size']} keys, {stats['bytes'] / 1024:.1f} KiB")
@@ -0,0 +1,128 @@
+# KYBER KEY AND CIPHERTEXT SERIALIZATION
+
+import numpy as np
+
+"""
+Bit-packed wire formats for Kyber polynomials, public keys and ciphertexts.
+
+- pack_bits / unpack_bits store every coefficient in exactly d bits (little-endian bit order,
+  as in Kyber's ByteEncode_d), so 12-bit coefficients take 1.5 bytes instead of 2.
+- compress / decompress map coefficients mod q to d bits and back (Kyber's Compress_q and
+  Decompress_q). Ciphertexts use d_u bits for u and d_v bits for v; the rounding error this
+  introduces is far below the q/4 decoding margin.
+
+Everything works on whole numpy arrays at once.
+"""
+
+Q = 3329
+
+
+def pack_bits(values, d):
+    """
+    Pack integers in [0, 2^d) into bytes, d bits each
+    """
+    values = np.asarray(values, dtype=np.int64).reshape(-1)
+    bits = ((values[:, np.newaxis] >> np.arange(d)) & 1).astype(np.uint8)
+    return np.packbits(bits.reshape(-1), bitorder='little').tobytes()
+
+
+def unpack_bits(data, d, count):
+    """
+    Unpack `count` d-bit integers from bytes
+    """
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=count * d, bitorder='little')
+    weights = np.int64(1) << np.arange(d, dtype=np.int64)
+    return bits.reshape(count, d).astype(np.int64) @ weights
+
+
+def compress(x, d, q=Q):
+    """
+    Compress_q: round(2^d / q * x) mod 2^d, in integer arithmetic
+    """
+    x = np.asarray(x, dtype=np.int64) % q
+    return (((x << d) + q // 2) // q) & ((1 << d) - 1)
+
+
+def decompress(y, d, q=Q):
+    """
+    Decompress_q: round(q / 2^d * y)
+    """
+    y = np.asarray(y, dtype=np.int64)
+    return (y * q + (1 << (d - 1))) >> d
+
+
+def encode_polys(polys, q=Q):
+    """
+    Serialize polynomials (any shape) at 12 bits per coefficient
+    """
+    return pack_bits(np.asarray(polys) % q, 12)
+
+
+def decode_polys(data, shape):
+    """
+    Inverse of `encode_polys`
+    """
+    return unpack_bits(data, 12, int(np.prod(shape))).reshape(shape)
+
+
+def encode_public_key(t_hat, seed):
+    """
+    Module-Kyber public key: 12-bit packed t_hat followed by the 32-byte matrix seed
+    """
+    return encode_polys(t_hat) + bytes(seed)
+
+
+def decode_public_key(data, k, n=256):
+    """
+    Split a public key back into (t_hat, seed)
+    """
+    split = k * n * 12 // 8
+    return decode_polys(data[:split], (k, n)), bytes(data[split:])
+
+
+def encode_ciphertext(u, v, du, dv):
+    """
+    Compress u with du bits and v with dv bits per coefficient and pack both
+    """
+    return pack_bits(compress(u, du), du) + pack_bits(compress(v, dv), dv)
+
+
+def decode_ciphertext(data, k, du, dv, n=256):
+    """
+    Unpack and decompress a ciphertext into (u, v); u has shape (k, n)
+    """
+    split = k * n * du // 8
+    u = decompress(unpack_bits(data[:split], du, k * n), du).reshape(k, n)
+    v = decompress(unpack_bits(data[split:], dv, n), dv)
+    return u, v
+
+
+"""
+TEST ROUND TRIPS
+"""
+if __name__ == "__main__":
+    rng = np.random.default_rng()
+
+    # Exact round trips for any bit width
+    for d in (1, 4, 5, 10, 11, 12):
+        values = rng.integers(0, 1 << d, 1000)
+        assert np.array_equal(unpack_bits(pack_bits(values, d), d, len(values)), values)
+
+    # 12-bit polynomials and public keys are lossless
+    t_hat = rng.integers(0, Q, (3, 256))
+    seed = bytes(range(32))
+    decoded_t, decoded_seed = decode_public_key(encode_public_key(t_hat, seed), 3)
+    assert np.array_equal(decoded_t, t_hat) and decoded_seed == seed
+
+    # Compression error is bounded by round(q / 2^(d+1))
+    for d in (4, 5, 10, 11):
+        x = np.arange(Q)
+        error = (decompress(compress(x, d), d) - x + Q // 2) % Q - Q // 2
+        assert np.abs(error).max() <= round(Q / (1 << (d + 1))), d
+
+    # Sizes against 16 bits per coefficient
+    for k, du, dv in ((2, 10, 4), (3, 10, 4), (4, 11, 5)):
+        pk_size = len(encode_public_key(np.zeros((k, 256)), seed))
+        ct_size = len(encode_ciphertext(np.zeros((k, 256)), np.zeros(256), du, dv))
+        print(f"k={k}: public key {pk_size} bytes (was {k * 512 + 32}), "
+              f"ciphertext {ct_size} bytes (was {(k + 1) * 512})")
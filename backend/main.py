@@ -1,80 +1,405 @@
 # Coordinates the encryption process:
-# - Takes DNA input
-# - Encodes DNA to bytes
-# - Kyber creates a round key for AES encryption
-# - AES encrypts the DNA sequence
-# - Simulates transmission of encrypted DNA + Kyber ciphertext
-# - Decrypts Kyber using secret key 
-# - Kyber Decryption gives AES key
-# - AES is decrypted using round key
-# - Decrypts DNA data and prints result
-# - Original and Decrypted DNA data are verified 
-
-from backend.kyber import Kyber
-from backend.aes import Encryption
+# - Streams DNA input (FASTA, FASTQ or one sequence per line, optionally gzip) in bounded chunks
+# - Packs DNA to 2-bit bytes, optionally compressed in blocks (--compress zlib|bz2|lzma);
+#   'N' runs, other IUPAC codes and soft-masked lowercase runs go to an encrypted side table
+# - A random data key encrypts the packed DNA with AES-CTR into a binary container
+#   (encrypted_output.dnav), optionally spread over a pool of worker processes (--workers N)
+# - The data key is wrapped under a Kyber-derived key for each recipient and stored in the
+#   container header, so recipients can be added later without re-encrypting (see envelope.py)
+# - Every ciphertext chunk is authenticated (HMAC tags in a Merkle tree, see integrity.py) and the
+#   container is verified on all cores without decrypting it
+# - --batch packs all records back to back as one batch, padded only at its end, for files
+#   of many short reads; records are still decrypted one by one
+# - --audit FRACTION decrypts a random sample of records and compares them with the input
+# - --region RECORD:START-END authenticates and decrypts only the bases of one locus
+# - AES runs on the fastest cipher backend that passes its known-answer self-test (system
+#   libcrypto, numpy or the reference class; --cipher or DNAVAULT_CIPHER overrides, see ciphers.py)
+# - --metrics / --prometheus / --profile / --tracemalloc report per-stage timings and counters
+#   (see instrument.py)
+
+import argparse
+import json
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.kyber import ModuleKyber, KYBER_PARAMS
+from backend.container import ContainerWriter, ContainerReader, encrypt_blocks
 from backend.dna_utils import dna_utils
+from backend.modes import CTRMode
+from backend import seqio
+from backend import compression
+from backend import ciphers
+from backend import envelope
+from backend import instrument
 import numpy as np
 
 # initialise
 dna_util = dna_utils()
-kyber = Kyber()
-
-# parsing input file 
-dna_sequences = []
-with open("human.txt", "r") as file:
-    for line in file:
-        dna_sequences.append(line.strip())
-    
-# Generate kyber key and AES key
-A,s,pk = kyber.keygen()
-(u, v), shared_key, m = kyber.encapsulate(pk, A)
-
-# Format Kyber shared key into 4x4 binary AES round key
-round_key_matrix = np.array([
-    [format(byte, '08b') for byte in shared_key[i:i+4]]
-    for i in range(0, 16, 4)
-])
-
-# Encrypt and Decrypt Each DNA Sequence
-with open("encrypted_output.txt", "w") as outfile:
-    for index, dna_seq in enumerate(dna_sequences):
-        if not dna_seq:
-            continue 
-
-        matrices = dna_util.encode(dna_seq)
-        encrypted_blocks = []
-        decrypted_blocks = []
-
-        for mat in matrices:
-            plaintext_matrix = np.array([[format(int(cell, 2), '08b') for cell in row] for row in mat])
-
-            # AES Encryption
-            enc = Encryption(plaintext_matrix)
-            enc.round_key = round_key_matrix
-            enc.list_of_round_keys = [round_key_matrix]
-            for i in range(10): 
-             enc.key_expansion(counter=i)
-            ciphertext = enc.encrypt()
-
-            # AES Decryption
-            dec = Encryption(plaintext_matrix)
-            dec.round_key = round_key_matrix
-            dec.list_of_round_keys = [round_key_matrix]
-            for i in range(10):
-             dec.key_expansion(counter=i)
-            decrypted_matrix = dec.decrypt(ciphertext)
-
-            # Store output
-            encrypted_blocks.append(ciphertext)
-            decrypted_blocks.append(decrypted_matrix)
-
-        # Decode back to DNA
-        encrypted_dna = dna_util.decode([[[cell[-2:] for cell in row] for row in block] for block in encrypted_blocks], len(dna_seq))
-        decrypted_dna = dna_util.decode([[[cell[-2:] for cell in row] for row in block] for block in decrypted_blocks], len(dna_seq))
-
-        # Write to output
-        outfile.write(f"DNA {index+1}:\n")
-        outfile.write(f"Original:  {dna_seq}\n")
-        outfile.write(f"Encrypted: {encrypted_dna}\n")
-        outfile.write(f"Decrypted: {decrypted_dna}\n")
-        outfile.write(f"Match:     {dna_seq == decrypted_dna}\n\n")
\ No newline at end of file
+
+# Cipher context and compression settings (codec, block bytes) of a worker process,
+# set once by `_init_worker`
+_worker_ctr = None
+_worker_codec = (0, compression.BLOCK_BYTES)
+
+
+def _init_worker(key, nonce, codec=0, block_bytes=compression.BLOCK_BYTES, cipher=None):
+    """
+    Expand the AES key once per worker process, with the `cipher` backend chosen by the parent
+    """
+    global _worker_ctr, _worker_codec
+    if cipher is not None:
+        ciphers.select(cipher)
+    _worker_ctr = CTRMode(key, nonce)
+    _worker_codec = (codec, block_bytes)
+
+
+def _encrypt_task(offset, bases, pieces):
+    """
+    Pack (and compress) and encrypt a run of consecutive record pieces.
+    `bases` holds the ASCII bases of all pieces back to back and `pieces` their
+    (record, start, length); every piece is packed on its own (so records stay byte aligned) and
+    the packed run is encrypted at packed `offset`.
+    With compression every piece is cut into blocks, which works because pieces start at
+    multiples of the block size within their record (see `encrypt_file`).
+    Returns (ciphertext, block entries, packed size, side table runs [(record, start,
+    exceptions, lowercase)], worker pid, (pack seconds, compress seconds, encrypt seconds)).
+    """
+    started = time.perf_counter()
+    packed, side = [], []
+    position = 0
+    for record, start, length in pieces:
+        piece, exceptions, lowercase = dna_util.pack_with_side_table(bases[position:position + length])
+        packed.append(piece)
+        if len(exceptions) or len(lowercase):
+            side.append((record, start, exceptions, lowercase))
+        position += length
+    packed_size = sum(len(piece) for piece in packed)
+    packed_at = time.perf_counter()
+
+    codec, block_bytes = _worker_codec
+    if not codec:
+        ciphertext = _worker_ctr.process(np.concatenate(packed), offset).tobytes()
+        return ciphertext, (), packed_size, side, os.getpid(), (packed_at - started, 0.0, time.perf_counter() - packed_at)
+
+    ciphertext, entries, compress_time = [], [], 0.0
+    for piece in packed:
+        before = time.perf_counter()
+        blocks = compression.compress_blocks(codec, piece, block_bytes)
+        compress_time += time.perf_counter() - before
+        piece_ciphertext, piece_entries = encrypt_blocks(_worker_ctr, blocks, offset, block_bytes)
+        ciphertext.append(piece_ciphertext)
+        entries += piece_entries
+        offset += len(piece)
+    encrypt_time = time.perf_counter() - packed_at - compress_time
+    return b''.join(ciphertext), entries, packed_size, side, os.getpid(), (packed_at - started, compress_time, encrypt_time)
+
+
+def _iter_tasks(input_path, writer, chunk_bases):
+    """
+    Group record pieces into tasks of about `chunk_bases` bases, registering records with the
+    writer as they are seen. Yields (offset, bases, pieces) with precomputed CTR offsets.
+    """
+    offset = writer.offset
+    bases, pieces = bytearray(), []
+    task_offset = offset
+    for chunk in seqio.iter_chunks(input_path, chunk_bases):
+        if chunk.start == 0:
+            writer.begin_record(chunk.name, offset)
+        bases += chunk.bases
+        pieces.append((chunk.record, chunk.start, len(chunk.bases)))
+        offset += (len(chunk.bases) + 3) // 4 # Packed size of the piece
+        instrument.count('bases', len(chunk.bases))
+        if chunk.last:
+            writer.end_record(chunk.start + len(chunk.bases), offset)
+            instrument.count('records')
+        if len(bases) >= chunk_bases:
+            yield task_offset, bytes(bases), pieces
+            bases, pieces = bytearray(), []
+            task_offset = offset
+    if pieces:
+        yield task_offset, bytes(bases), pieces
+
+
+def _iter_batch_tasks(input_path, writer, chunk_bases):
+    """
+    Concatenate all records into one batch (see ContainerWriter.begin_batch) and cut it into
+    tasks of exactly `chunk_bases` bases, so short reads are packed back to back and padded
+    only at the end. Yields (offset, bases, pieces) like `_iter_tasks`.
+    """
+    offset = writer.offset
+    writer.begin_batch(offset)
+    bases, position = bytearray(), 0
+    for chunk in seqio.iter_chunks(input_path, chunk_bases):
+        bases += chunk.bases
+        instrument.count('bases', len(chunk.bases))
+        if chunk.last:
+            writer.add_to_batch(chunk.name, chunk.start + len(chunk.bases))
+            instrument.count('records')
+        while len(bases) >= chunk_bases:
+            yield offset, bytes(bases[:chunk_bases]), [(0, position, chunk_bases)]
+            del bases[:chunk_bases]
+            offset += chunk_bases // 4
+            position += chunk_bases
+    if bases:
+        yield offset, bytes(bases), [(0, position, len(bases))]
+        offset += (len(bases) + 3) // 4
+    writer.end_batch(offset)
+
+
+def encrypt_file(input_path, output_path, key, sections=None, workers=1, chunk_bases=seqio.CHUNK_BASES, codec='none',
+                 batch=False):
+    """
+    Encrypt every record of `input_path` into a container at `output_path`, with the extra
+    header `sections` (the key envelope), optionally compressing the packed data with `codec`.
+    With `batch` all records are packed back to back as one batch (for many short reads).
+    Tasks run on `workers` processes; results are written strictly in input order.
+    Returns per-worker statistics {pid: [bytes, busy seconds]} and the wall-clock time.
+    """
+    stats = {}
+    started = time.perf_counter()
+    # Pieces are rounded up to whole packed bytes (4 bases), and when compressing to whole
+    # blocks, since blocks must not straddle pieces (shrinking them would compress poorly)
+    block_bytes = compression.BLOCK_BYTES
+    granule = 4 * block_bytes if compression.codec_id(codec) else 4
+    chunk_bases = -(-chunk_bases // granule) * granule
+    with ContainerWriter(output_path, key, sections=sections, codec=codec, block_bytes=block_bytes) as writer:
+        iter_tasks = _iter_batch_tasks if batch else _iter_tasks
+        tasks = instrument.timed_iter(iter_tasks(input_path, writer, chunk_bases), 'parse')
+        init_args = (key, writer.ctr.nonce, writer.codec, block_bytes)
+
+        def collect(result):
+            ciphertext, entries, packed_size, side, pid, (pack_time, compress_time, encrypt_time) = result
+            writer.write_encrypted(ciphertext, entries, packed_size)
+            for runs in side:
+                writer.side.add(*runs)
+            worker = stats.setdefault(pid, [0, 0.0])
+            worker[0] += len(ciphertext)
+            worker[1] += pack_time + compress_time + encrypt_time
+            # Worker time is summed over processes, so it can exceed the wall-clock time
+            instrument.add_time('pack', pack_time)
+            if writer.codec:
+                instrument.add_time('compress', compress_time)
+                instrument.count('packed_bytes', packed_size)
+            instrument.add_time('encrypt', encrypt_time)
+            instrument.count('tasks')
+            instrument.count('bytes', len(ciphertext))
+            instrument.count('blocks', (len(ciphertext) + 15) // 16)
+
+        if workers <= 1:
+            _init_worker(*init_args)
+            for task in tasks:
+                collect(_encrypt_task(*task))
+        else:
+            worker_args = init_args + (ciphers.selection()['backend'],)
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=worker_args) as pool:
+                pending = deque() # Futures in submission order, bounded so memory stays flat
+                for task in tasks:
+                    pending.append(pool.submit(_encrypt_task, *task))
+                    if len(pending) >= 2 * workers:
+                        collect(pending.popleft().result())
+                while pending:
+                    collect(pending.popleft().result())
+    return stats, time.perf_counter() - started
+
+
+def verify_integrity(output_path, key, workers=None):
+    """
+    Check every chunk tag of the container in parallel.
+    Returns (corrupted chunk indices, records, ciphertext bytes, seconds).
+    """
+    with ContainerReader(output_path) as reader:
+        started = time.perf_counter()
+        corrupted = reader.verify(key, workers)
+        return corrupted, len(reader), len(reader.payload), time.perf_counter() - started
+
+
+def audit_file(input_path, output_path, key, fraction=1.0):
+    """
+    Decrypt a random `fraction` of the records and compare them with a fresh pass over the input.
+    Returns (matches, records checked).
+    """
+    matches = checked = 0
+    with ContainerReader(output_path) as reader:
+        for index, (name, dna_seq) in enumerate(seqio.read_records(input_path)):
+            if random.random() >= fraction:
+                continue
+            matches += dna_seq == reader.read_region(index, 0, None, key)
+            checked += 1
+    return matches, checked
+
+
+def read_region(output_path, region, key):
+    """
+    Decrypt one locus given as RECORD:START-END (record ID, full name or index, 0-based
+    half-open range). KeyError if no record matches.
+    """
+    record, span = region.rsplit(':', 1)
+    start, end = (int(value) for value in span.split('-'))
+    with ContainerReader(output_path) as reader:
+        try:
+            record = reader.record_id(record)
+        except KeyError:
+            if not record.lstrip('-').isdigit(): # Names take precedence over indices
+                raise
+            record = int(record)
+        started = time.perf_counter()
+        bases = reader.read_region(record, start, end, key, verify=True)
+        return bases, time.perf_counter() - started
+
+
+def report_workers(stats, elapsed):
+    """
+    Print the throughput of every worker process and of the whole run
+    """
+    total = sum(size for size, _ in stats.values())
+    for pid, (size, busy) in sorted(stats.items()):
+        print(f"Worker {pid}: {size / 1e6:.2f} MB in {busy:.2f} s ({size / 1e6 / max(busy, 1e-9):.2f} MB/s)")
+    print(f"Total:   {total / 1e6:.2f} MB in {elapsed:.2f} s ({total / 1e6 / max(elapsed, 1e-9):.2f} MB/s)")
+
+
+def measure_scaling(input_path, output_path, key, sections, max_workers, chunk_bases, codec='none', batch=False):
+    """
+    Time the encryption with 1, 2, 4, ... up to `max_workers` processes and print the
+    speedup and parallel efficiency (speedup / workers) of each run
+    """
+    counts = sorted({1 << i for i in range(max_workers.bit_length())} | {max_workers})
+    baseline = None
+    for count in counts:
+        _, elapsed = encrypt_file(input_path, output_path, key, sections, count, chunk_bases, codec, batch)
+        baseline = baseline or elapsed
+        speedup = baseline / elapsed
+        print(f"workers={count:3d}  time={elapsed:.2f} s  speedup={speedup:.2f}x  efficiency={speedup / count:.0%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encrypt DNA sequences with Kyber + AES")
+    parser.add_argument('--input', default="human.txt", help="FASTA, FASTQ or one sequence per line (gzip ok)")
+    parser.add_argument('--output', default="encrypted_output.dnav", help="container file to write")
+    parser.add_argument('--workers', type=int, default=1, help="number of encryption processes")
+    parser.add_argument('--chunk-bases', type=int, default=seqio.CHUNK_BASES,
+                        help="bases per worker task (rounded up to a multiple of 4, or to whole blocks with --compress)")
+    parser.add_argument('--compress', default='none', choices=list(compression.CODECS),
+                        help="compress the packed DNA before encryption")
+    parser.add_argument('--batch', action='store_true',
+                        help="pack all records back to back in one batch (many short reads)")
+    parser.add_argument('--cipher', choices=list(ciphers.BACKENDS),
+                        help="AES backend (default: $DNAVAULT_CIPHER or the fastest that passes its self-test)")
+    parser.add_argument('--kyber', default='kyber768', choices=sorted(KYBER_PARAMS), help="Kyber parameter set")
+    parser.add_argument('--region', help="also decrypt one locus, RECORD:START-END (record ID, name or index)")
+    parser.add_argument('--audit', type=float, default=0.0, metavar='FRACTION',
+                        help="decrypt this fraction of the records and compare them with the input (1 = all)")
+    parser.add_argument('--scaling', action='store_true',
+                        help="measure scaling efficiency from 1 up to --workers processes (default: all cores)")
+    parser.add_argument('--metrics', metavar='PATH', help="write a JSON summary of stage timings and counters ('-' for stdout)")
+    parser.add_argument('--prometheus', metavar='PATH', help="write the metrics in Prometheus text format")
+    parser.add_argument('--prometheus-port', type=int, metavar='PORT', help="serve /metrics on this port during the run")
+    parser.add_argument('--profile', action='store_true', help="capture a cProfile report into the metrics")
+    parser.add_argument('--tracemalloc', action='store_true', help="record the peak traced memory into the metrics")
+    args = parser.parse_args(argv)
+    if args.chunk_bases < 1:
+        parser.error("--chunk-bases must be positive")
+
+    # Instrumentation stays disabled (no-op hooks) unless one of its outputs is requested
+    metrics = None
+    if args.metrics or args.prometheus or args.prometheus_port or args.profile or args.tracemalloc:
+        metrics = instrument.enable()
+    server = instrument.serve_prometheus(args.prometheus_port) if args.prometheus_port else None
+    try:
+        with instrument.profiling(cpu=args.profile, memory=args.tracemalloc):
+            run(args, parser)
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+        if metrics:
+            report_metrics(metrics, args)
+            instrument.disable()
+
+
+def report_metrics(metrics, args):
+    """
+    Print the stage breakdown and write the requested metric outputs
+    """
+    summary = metrics.summary()
+    for name, stage in sorted(summary['stages'].items(), key=lambda item: -item[1]['seconds']):
+        print(f"Stage {name:<10} {stage['seconds'] * 1e3:10.2f} ms  ({stage['calls']} calls)")
+    print("Counters: " + ', '.join(f"{name}={value}" for name, value in summary['counters'].items()))
+    if 'memory_peak_bytes' in summary:
+        print(f"Peak traced memory: {summary['memory_peak_bytes'] / 1e6:.2f} MB")
+    if args.profile:
+        print(summary['profile'])
+    if args.metrics == '-':
+        print(json.dumps(summary, indent=2))
+    elif args.metrics:
+        metrics.write_json(args.metrics)
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
+
+
+def run(args, parser):
+    with instrument.stage('cipher_select'):
+        ciphers.select(args.cipher)
+    print(f"Cipher backend: {ciphers.describe()}")
+
+    # Generate the owner's kyber key pair and a random AES data key wrapped for the owner
+    with instrument.stage('kem'):
+        kyber = ModuleKyber(args.kyber)
+        pk, s = kyber.keygen()
+        public_key = kyber.encode_public_key(pk)
+        key = envelope.new_data_key()
+        recipients = [envelope.add_recipient(key, public_key, args.kyber)]
+        sections = {envelope.WRAP_SECTION: envelope.encode_recipients(recipients)}
+
+    if args.scaling:
+        max_workers = args.workers if args.workers > 1 else os.cpu_count()
+        measure_scaling(args.input, args.output, key, sections, max_workers, args.chunk_bases, args.compress, args.batch)
+        return
+
+    # Encrypt each DNA sequence into the container, one bounded chunk at a time
+    stats, elapsed = encrypt_file(args.input, args.output, key, sections, args.workers, args.chunk_bases, args.compress,
+                                  args.batch)
+    report_workers(stats, elapsed)
+    if args.compress != 'none':
+        with ContainerReader(args.output) as reader:
+            packed, stored = int(reader.streams['size'].sum()), len(reader.payload)
+        print(f"Compression ({args.compress}): {packed} packed bytes -> {stored} bytes (ratio {packed / max(stored, 1):.2f})")
+
+    # Share the container with a second recipient: only the header is rewritten
+    lab_pk, lab_s = kyber.keygen()
+    lab_public_key = kyber.encode_public_key(lab_pk)
+    started = time.perf_counter()
+    with instrument.stage('grant'):
+        envelope.grant(args.output, key, lab_public_key, args.kyber)
+    print(f"Added a recipient in {(time.perf_counter() - started) * 1e3:.2f} ms (header append only, payload untouched)")
+
+    # The new recipient unwraps the data key from the container header with their own secret
+    recovered_key = envelope.recover_key(envelope.read_recipients(args.output), lab_public_key, lab_s, args.kyber)
+    print(f"Data key recovered by the new recipient: {recovered_key == key}")
+
+    # Authenticate the whole payload from its chunk tags, without decrypting it
+    with instrument.stage('integrity'):
+        corrupted, records, size, elapsed = verify_integrity(args.output, recovered_key)
+    print(f"Records: {records}")
+    print(f"Ciphertext bytes: {size}")
+    print(f"Integrity: {'ok' if not corrupted else f'{len(corrupted)} corrupted chunks'} ({elapsed * 1e3:.2f} ms)")
+
+    # Optional sampled round trip: decrypt records and compare them with the input
+    if args.audit > 0:
+        with instrument.stage('audit'):
+            matches, checked = audit_file(args.input, args.output, recovered_key, args.audit)
+        print(f"Audit:   {matches}/{checked} sampled records match")
+
+    if args.region:
+        try:
+            bases, elapsed = read_region(args.output, args.region, recovered_key)
+        except (KeyError, IndexError) as error:
+            parser.error(f"--region: {error.args[0]}")
+        preview = bases[:60].decode() + ('...' if len(bases) > 60 else '')
+        print(f"Region {args.region}: {len(bases)} bases in {elapsed * 1e3:.2f} ms: {preview}")
+
+
+if __name__ == "__main__":
+    main()
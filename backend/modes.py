@@ -0,0 +1,69 @@
+# AES MODES OF OPERATION
+
+import os
+
+import numpy as np
+
+from backend import ciphers
+
+"""
+Counter (CTR) mode on top of the selected AES backend (see ciphers.py).
+
+Each 16-byte counter block is an 8-byte nonce followed by the 64-bit big-endian block index.
+The keystream for any range of blocks is generated in one `encrypt_blocks` call and XORed
+with the data, so:
+- no padding is needed (the last partial block just uses part of the keystream)
+- any byte range can be encrypted or decrypted on its own, in any order or in parallel
+- encryption and decryption are the same operation
+"""
+class CTRMode:
+    NONCE_SIZE = 8
+
+    def __init__(self, key, nonce=None):
+        # Accept an already-expanded cipher context or a key (looked up in the shared context cache)
+        self.engine = key if hasattr(key, 'encrypt_blocks') else ciphers.get_context(key)
+        self.nonce = os.urandom(self.NONCE_SIZE) if nonce is None else bytes(nonce)
+        if len(self.nonce) != self.NONCE_SIZE:
+            raise ValueError(f"CTR nonce must be {self.NONCE_SIZE} bytes, got {len(self.nonce)}")
+
+    def keystream(self, first_block, n_blocks):
+        """
+        Generate the keystream for blocks [first_block, first_block + n_blocks) as a flat uint8 array
+        """
+        if first_block < 0 or first_block + n_blocks > 1 << 64:
+            raise ValueError("CTR block index out of range")
+        counters = np.empty((n_blocks, 16), dtype=np.uint8)
+        counters[:, :8] = np.frombuffer(self.nonce, dtype=np.uint8)
+        index = np.arange(n_blocks, dtype=np.uint64) + np.uint64(first_block)
+        counters[:, 8:] = index.astype('>u8').view(np.uint8).reshape(-1, 8)
+        return self.engine.encrypt_blocks(counters).reshape(-1)
+
+    def process(self, data, offset=0):
+        """
+        Encrypt or decrypt `data` (bytes, memoryview or uint8 array) located at byte `offset`
+        of the stream. Returns a uint8 array of the same length.
+        """
+        data = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data.reshape(-1)
+        if len(data) == 0:
+            return data.copy()
+        first_block, skip = divmod(offset, 16)
+        n_blocks = (skip + len(data) + 15) // 16
+        if hasattr(self.engine, 'ctr_process'): # Backend with native CTR mode (see ciphers.py)
+            if first_block + n_blocks > 1 << 64:
+                raise ValueError("CTR block index out of range")
+            return self.engine.ctr_process(self.nonce + first_block.to_bytes(8, 'big'), skip, data)
+        return data ^ self.keystream(first_block, n_blocks)[skip:skip + len(data)]
+
+    # CTR decryption is the same XOR as encryption
+    encrypt = process
+    decrypt = process
+
+    def process_stream(self, chunks, offset=0):
+        """
+        Encrypt or decrypt an iterable of chunks lazily, so the whole stream never has to be
+        in memory. Chunks may have any length; stream positions continue across chunks.
+        """
+        for chunk in chunks:
+            out = self.process(chunk, offset)
+            offset += len(out)
+            yield out
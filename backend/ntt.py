@@ -0,0 +1,123 @@
+# NUMBER-THEORETIC TRANSFORM FOR KYBER POLYNOMIALS
+
+import numpy as np
+
+"""
+Number-theoretic transform over Z_q[x]/(x^256 + 1) with q = 3329, as used by Kyber.
+
+17 is a primitive 256th root of unity mod 3329, so x^256 + 1 splits into 128 quadratic factors
+(x^2 - zeta^(2*bitrev7(i) + 1)). The forward NTT maps a polynomial to its 128 residues of
+degree 1; multiplication then becomes 128 independent degree-1 products (`basemul`).
+
+Every function works on arrays of shape (..., 256), so a batch of polynomials is transformed
+with the same numpy calls as a single one. Each of the 7 butterfly layers is one vectorized step,
+giving O(n log n) work instead of the O(n^2) of a convolution.
+"""
+
+Q = 3329
+N = 256
+ZETA = 17 # Primitive 256th root of unity mod Q
+N_INV = 3303 # 128^-1 mod Q (the inverse transform has 7 layers of 2 coefficients each)
+
+
+def _bitrev7(value):
+    return int(f'{value:07b}'[::-1], 2)
+
+
+# Twiddle factors in the order the butterflies consume them
+ZETAS = np.array([pow(ZETA, _bitrev7(i), Q) for i in range(128)], dtype=np.int64)
+
+# Roots of the 128 quadratic factors x^2 - gamma_i
+GAMMAS = np.array([pow(ZETA, 2 * _bitrev7(i) + 1, Q) for i in range(128)], dtype=np.int64)
+
+# Per-layer twiddles for the vectorized transforms: (length, zetas of that layer)
+_FORWARD_LAYERS = []
+_INVERSE_LAYERS = []
+_index = 1
+for _length in (128, 64, 32, 16, 8, 4, 2):
+    _blocks = N // (2 * _length)
+    _FORWARD_LAYERS.append((_length, ZETAS[_index:_index + _blocks, np.newaxis, np.newaxis]))
+    _index += _blocks
+_index = 127
+for _length in (2, 4, 8, 16, 32, 64, 128):
+    _blocks = N // (2 * _length)
+    _INVERSE_LAYERS.append((_length, ZETAS[_index - _blocks + 1:_index + 1][::-1, np.newaxis, np.newaxis]))
+    _index -= _blocks
+
+for _table in (ZETAS, GAMMAS):
+    _table.setflags(write=False)
+
+
+def ntt(f):
+    """
+    Forward NTT of one or more polynomials (..., 256) with coefficients in any integer range
+    """
+    f = np.asarray(f, dtype=np.int64)
+    lead = f.shape[:-1]
+    # Work on a (256, batch) copy so every butterfly runs over long contiguous rows
+    work = (f.reshape(-1, N).T % Q).copy()
+    for length, zetas in _FORWARD_LAYERS:
+        pairs = work.reshape(N // (2 * length), 2, length, -1)
+        low, high = pairs[:, 0], pairs[:, 1]
+        t = zetas * high
+        t %= Q
+        np.subtract(low, t, out=high) # Butterfly: (low, high) -> (low + t, low - t)
+        low += t
+    # Only the twiddle products are reduced inside the loop; |values| stay below 8q
+    work %= Q
+    return work.T.reshape(lead + (N,))
+
+
+def intt(f_hat):
+    """
+    Inverse NTT, returning coefficients in [0, q)
+    """
+    f = np.asarray(f_hat, dtype=np.int64)
+    lead = f.shape[:-1]
+    work = f.reshape(-1, N).T.copy()
+    for length, zetas in _INVERSE_LAYERS:
+        pairs = work.reshape(N // (2 * length), 2, length, -1)
+        low, high = pairs[:, 0], pairs[:, 1]
+        t = low.copy()
+        low += high # Butterfly: (low, high) -> (low + high, zeta * (high - low))
+        high -= t
+        high *= zetas
+        high %= Q
+    work %= Q
+    work *= N_INV
+    work %= Q
+    return work.T.reshape(lead + (N,))
+
+
+def basemul(a_hat, b_hat):
+    """
+    Pointwise product in the NTT domain: 128 products of degree-1 polynomials mod (x^2 - gamma_i)
+    """
+    a = np.asarray(a_hat, dtype=np.int64)
+    b = np.asarray(b_hat, dtype=np.int64)
+    shape = np.broadcast_shapes(a.shape, b.shape)
+    a0, a1 = a[..., 0::2], a[..., 1::2]
+    b0, b1 = b[..., 0::2], b[..., 1::2]
+    result = np.empty(shape, dtype=np.int64)
+    result[..., 0::2] = (a0 * b0 + (a1 * b1) % Q * GAMMAS) % Q
+    result[..., 1::2] = (a0 * b1 + a1 * b0) % Q
+    return result
+
+
+def poly_mul(a, b):
+    """
+    Multiply polynomials in Z_q[x]/(x^256 + 1) through the NTT
+    """
+    return intt(basemul(ntt(a), ntt(b)))
+
+
+def negacyclic_convolve(a, b, q=Q):
+    """
+    Reference O(n^2) product in Z_q[x]/(x^n + 1): full convolution, then fold the upper half
+    back with a minus sign because x^n = -1
+    """
+    n = len(a)
+    full = np.convolve(np.asarray(a, dtype=np.int64) % q, np.asarray(b, dtype=np.int64) % q)
+    result = full[:n].copy()
+    result[:len(full) - n] -= full[n:]
+    return result % q
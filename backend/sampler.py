@@ -0,0 +1,124 @@
+# SEEDED SAMPLING FOR KYBER
+
+import hashlib
+import itertools
+import os
+
+import numpy as np
+
+"""
+Deterministic samplers for Kyber polynomials, driven by a per-session seed.
+
+Every draw expands SHAKE-256(seed || nonce) with one bulk `digest` call and turns the bytes into
+coefficients with integer numpy operations only:
+- `cbd(eta, shape)`: centred binomial noise, a - b where a and b each count the set bits of eta
+  random bits (values in [-eta, eta])
+- `uniform(shape, q)`: coefficients uniform mod q by rejection sampling 12-bit candidates
+- `random_bytes(count)`: raw stream bytes (messages, seeds)
+
+The nonce is a per-sampler counter, so the same seed always reproduces the same sequence of
+draws (known-answer vectors, tests), and each sampler owns its state, so threads never share a
+global RNG.
+"""
+
+SEED_BYTES = 32
+
+
+def xof(seed, nonce, length):
+    """
+    `length` bytes of SHAKE-256(seed || nonce), nonce as 8 little-endian bytes
+    """
+    return hashlib.shake_256(seed + nonce.to_bytes(8, 'little')).digest(length)
+
+
+def cbd(stream, eta, count):
+    """
+    Centred binomial samples from a byte stream of at least count * 2 * eta / 8 bytes
+    """
+    bits = np.unpackbits(np.frombuffer(stream, dtype=np.uint8), count=count * 2 * eta, bitorder='little')
+    counts = bits.reshape(count, 2, eta).sum(axis=2, dtype=np.int64)
+    return counts[:, 0] - counts[:, 1]
+
+
+def uniform_candidates(stream):
+    """
+    Split every 3 stream bytes into two 12-bit candidates (Kyber's Parse)
+    """
+    stream = np.frombuffer(stream, dtype=np.uint8)
+    stream = stream[:len(stream) - len(stream) % 3].astype(np.int64).reshape(-1, 3)
+    d1 = stream[:, 0] | ((stream[:, 1] & 0x0F) << 8)
+    d2 = (stream[:, 1] >> 4) | (stream[:, 2] << 4)
+    return np.stack([d1, d2], axis=1).reshape(-1)
+
+
+class Sampler:
+    """
+    Reproducible sampler for one session. Without a seed a fresh random one is drawn.
+    """
+    def __init__(self, seed=None):
+        self.seed = os.urandom(SEED_BYTES) if seed is None else bytes(seed)
+        self._nonces = itertools.count()
+
+    def _draw(self, length):
+        return xof(self.seed, next(self._nonces), length)
+
+    def random_bytes(self, count):
+        """
+        `count` bytes from the next nonce of the stream
+        """
+        return self._draw(count)
+
+    def cbd(self, eta, shape):
+        """
+        Array of CBD(eta) noise of the given shape
+        """
+        count = int(np.prod(shape))
+        return cbd(self._draw((count * 2 * eta + 7) // 8), eta, count).reshape(shape)
+
+    def uniform(self, shape, q=3329):
+        """
+        Array of coefficients uniform in [0, q) of the given shape
+        """
+        count = int(np.prod(shape))
+        nonce = next(self._nonces)
+        # 12-bit candidates are accepted with probability q / 4096; draw ~30% extra up front and
+        # extend the (prefix-stable) stream in the rare case that is not enough
+        length = 3 * ((count * 4096 // q * 13 // 10 + 32) // 2 + 1)
+        while True:
+            candidates = uniform_candidates(xof(self.seed, nonce, length))
+            accepted = candidates[candidates < q]
+            if len(accepted) >= count:
+                return accepted[:count].reshape(shape)
+            length *= 2
+
+
+"""
+TEST REPRODUCIBILITY AND DISTRIBUTIONS
+"""
+if __name__ == "__main__":
+    import time
+
+    seed = bytes(32)
+    a, b = Sampler(seed), Sampler(seed)
+    assert np.array_equal(a.cbd(2, (3, 256)), b.cbd(2, (3, 256)))
+    assert np.array_equal(a.uniform((3, 256)), b.uniform((3, 256)))
+    assert a.random_bytes(32) == b.random_bytes(32)
+    print(f"Known answer (seed 0, nonce 0, CBD(2)): {Sampler(seed).cbd(2, 16).tolist()}")
+
+    for eta in (2, 3):
+        noise = Sampler().cbd(eta, 1 << 20)
+        assert noise.min() >= -eta and noise.max() <= eta
+        print(f"CBD({eta}): mean {noise.mean():+.4f}, variance {noise.var():.4f} (expected {eta / 2})")
+    values = Sampler().uniform(1 << 20)
+    assert values.min() >= 0 and values.max() < 3329
+    print(f"uniform: mean {values.mean():.1f} (expected {3328 / 2})")
+
+    sampler = Sampler()
+    for name, draw in (("cbd(2) 3x256", lambda: sampler.cbd(2, (3, 256))),
+                       ("uniform 3x256", lambda: sampler.uniform((3, 256))),
+                       ("np.random.normal 3x256", lambda: np.clip(np.round(np.random.normal(0, 1, (3, 256))), -2, 2))):
+        rounds = 5000
+        start = time.perf_counter()
+        for _ in range(rounds):
+            draw()
+        print(f"{name:>24}: {(time.perf_counter() - start) / rounds * 1e6:6.1f} us")
@@ -0,0 +1,183 @@
+# STREAMING SEQUENCE FILE READERS
+
+import gzip
+import io
+from collections import namedtuple
+
+"""
+Generator-based readers for FASTA, FASTQ and plain one-sequence-per-line files (like human.txt).
+
+Files are read in large buffered chunks and gzip input is detected from its magic bytes, so
+peak memory is set by the chunk size and not by the file size:
+- `iter_chunks` yields fixed-size pieces of every record (bounded memory even for whole chromosomes)
+- `read_records` yields whole (name, sequence) records (memory bounded by the largest record)
+
+FASTQ quality lines are skipped: only the bases are passed on to the encryption stage.
+"""
+
+READ_SIZE = 1 << 22 # Bytes read from the file per call
+CHUNK_BASES = 1 << 20 # Bases per chunk yielded by iter_chunks (multiple of 4 so chunks pack to whole bytes)
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Bytes removed from sequence data (line breaks and stray whitespace)
+_WHITESPACE = b'\r\n \t'
+
+# One piece of a record: `start` is the base offset of `bases` in the record, `last` marks its final piece
+SequenceChunk = namedtuple('SequenceChunk', ['record', 'name', 'start', 'bases', 'last'])
+
+
+def open_sequence_file(source):
+    """
+    Open a path or binary stream for buffered reading, transparently decompressing gzip
+    """
+    stream = open(source, 'rb') if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__') else source
+    stream = io.BufferedReader(stream, READ_SIZE) if not hasattr(stream, 'peek') else stream
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        stream = io.BufferedReader(gzip.GzipFile(fileobj=stream), READ_SIZE)
+    return stream
+
+
+def detect_format(stream):
+    """
+    Guess the file format from its first non-blank byte: 'fasta', 'fastq' or 'lines'
+    """
+    head = stream.peek(READ_SIZE).lstrip()
+    if head.startswith(b'>'):
+        return 'fasta'
+    if head.startswith(b'@'):
+        return 'fastq'
+    return 'lines'
+
+
+def iter_events(source, fmt=None):
+    """
+    Parse a sequence file into a flat stream of events:
+    (name, None) when a record starts, (None, bases) for each piece of its sequence
+    """
+    stream = open_sequence_file(source)
+    try:
+        fmt = fmt or detect_format(stream)
+        parser = {'fasta': _fasta_events, 'fastq': _fastq_events, 'lines': _line_events}[fmt]
+        yield from parser(stream)
+    finally:
+        stream.close()
+
+
+def _fasta_events(stream):
+    # Chunk-level parser: sequence lines are passed on as soon as they are read, so even a
+    # single-line chromosome never has to be held in memory
+    at_line_start = True
+    header = None # Pieces of a header line split across chunks
+    while True:
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            break
+        position = 0
+        while position < len(chunk):
+            if header is not None or (at_line_start and chunk[position:position + 1] == b'>'):
+                if header is None:
+                    header = []
+                    position += 1
+                end = chunk.find(b'\n', position)
+                if end == -1:
+                    header.append(chunk[position:])
+                    break
+                header.append(chunk[position:end])
+                yield b''.join(header).strip().decode('utf-8', 'replace'), None
+                header = None
+                at_line_start = True
+                position = end + 1
+                continue
+
+            # Sequence data runs until the next line starting with '>'
+            end = chunk.find(b'\n>', position)
+            if end == -1:
+                bases = chunk[position:]
+                at_line_start = chunk.endswith(b'\n')
+                position = len(chunk)
+            else:
+                bases = chunk[position:end]
+                at_line_start = True
+                position = end + 1
+            bases = bases.translate(None, _WHITESPACE)
+            if bases:
+                yield None, bases
+
+    if header is not None:
+        yield b''.join(header).strip().decode('utf-8', 'replace'), None
+
+
+def _fastq_events(stream):
+    # Four lines per record: @name, bases, +, qualities
+    while True:
+        title = stream.readline()
+        if not title:
+            break
+        if not title.strip():
+            continue
+        if not title.startswith(b'@'):
+            raise ValueError(f"malformed FASTQ record header: {title[:40]!r}")
+        bases = stream.readline().translate(None, _WHITESPACE)
+        stream.readline() # '+' separator
+        stream.readline() # quality string (not encrypted)
+        yield title[1:].strip().decode('utf-8', 'replace'), None
+        if bases:
+            yield None, bases
+
+
+def _line_events(stream):
+    # One sequence per non-empty line, named by its line number
+    for number, line in enumerate(stream, start=1):
+        bases = line.translate(None, _WHITESPACE)
+        if bases:
+            yield str(number), None
+            yield None, bases
+
+
+def iter_chunks(source, chunk_bases=CHUNK_BASES, fmt=None):
+    """
+    Yield every record as SequenceChunk pieces of `chunk_bases` bases (the last piece of a
+    record may be shorter or empty). Peak memory is about one chunk plus one read buffer.
+    """
+    if chunk_bases % 4:
+        raise ValueError("chunk_bases must be a multiple of 4")
+
+    record, name = -1, None
+    pending = bytearray()
+    start = 0
+    for event_name, bases in iter_events(source, fmt):
+        if event_name is not None:
+            if record >= 0:
+                yield SequenceChunk(record, name, start, bytes(pending), True)
+            record, name = record + 1, event_name
+            pending.clear()
+            start = 0
+            continue
+        if record < 0:
+            continue # Data before the first header does not belong to a record
+
+        pending += bases
+        while len(pending) >= chunk_bases:
+            yield SequenceChunk(record, name, start, bytes(pending[:chunk_bases]), False)
+            del pending[:chunk_bases]
+            start += chunk_bases
+
+    if record >= 0:
+        yield SequenceChunk(record, name, start, bytes(pending), True)
+
+
+def read_records(source, fmt=None):
+    """
+    Yield (name, sequence bytes) for every record in the file
+    """
+    name, pieces = None, []
+    for event_name, bases in iter_events(source, fmt):
+        if event_name is not None:
+            if name is not None:
+                yield name, b''.join(pieces)
+            name, pieces = event_name, []
+        else:
+            pieces.append(bases)
+    if name is not None:
+        yield name, b''.join(pieces)
@@ -0,0 +1,493 @@
+# HTTP ENCRYPTION SERVICE
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import signal
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from backend import ciphers
+from backend import instrument
+from backend import integrity
+from backend.dna_utils import UNPACK_ASCII, dna_utils
+from backend.kyber import ModuleKyber, KYBER_PARAMS
+from backend.modes import CTRMode
+from backend.sidetable import SideTable
+
+import numpy as np
+
+"""
+Long-running asyncio HTTP/1.1 service for Kyber key exchange and DNA encryption (stdlib only).
+
+Endpoints (JSON bodies, binary fields base64 encoded):
+    GET  /health          status, cipher backend and open sessions
+    GET  /kem/public-key  the server's Kyber public key and parameter set
+    POST /kem/session     {"ciphertext"}: decapsulate a client's encapsulation to the server key
+                          and open a session keyed by the shared secret -> {"session"}
+    POST /encrypt         {"session", "sequence"} -> {"nonce", "offset", "length", "ciphertext", "tag"}
+    POST /decrypt         the /encrypt response fields plus "session" -> {"sequence"}
+    GET  /metrics         request and batch counters in the Prometheus text format
+
+A sealed sequence is the 2-bit packed bases followed by its encoded side table (IUPAC codes,
+soft-masking, see sidetable.py), AES-CTR encrypted at (nonce, offset) under the session key, and
+an HMAC-SHA256 tag over (nonce || offset || length || ciphertext) with the MAC key of
+integrity.py.
+
+Crypto never runs on the event loop. Requests of one kind that arrive within `window` seconds
+(or until `max_batch` of them wait) form a micro-batch, handed to a worker pool as one call
+(see MicroBatcher). An encrypt batch packs every sequence and encrypts all sequences of a
+session in a single CTR call: they share a fresh nonce and take consecutive offsets of its
+keystream, so the per-call cost of the cipher backend is paid once per batch.
+"""
+
+SESSION_INFO = b'DNAVault session v1'
+MAX_BODY = 64 << 20 # Largest accepted request body
+SEALED = struct.Struct('<QQ') # offset, length (bases); authenticated with the nonce and ciphertext
+
+STATUS_TEXT = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    """
+    Error answered to the client with `status` and a JSON {"error": message} body
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ===================== WORKER SIDE =====================
+
+# Kyber instance and secret of the server key, set once by `_init_worker`
+_worker_kyber = None
+_worker_secret = None
+
+
+def _init_worker(params, secret, cipher=None):
+    """
+    Prepare a pool worker: the server's Kyber secret and the cipher backend chosen by the parent
+    """
+    global _worker_kyber, _worker_secret
+    if cipher is not None:
+        ciphers.select(cipher)
+    _worker_kyber = ModuleKyber(params)
+    _worker_secret = secret
+
+
+def session_key(shared_key):
+    """
+    AES-128 session key from a Kyber shared secret (domain-separated SHA-256)
+    """
+    return hashlib.sha256(SESSION_INFO + shared_key).digest()[:16]
+
+
+def seal_tag(key, nonce, offset, length, ciphertext):
+    tag = hmac.new(integrity.derive_mac_key(key), nonce + SEALED.pack(offset, length), hashlib.sha256)
+    tag.update(ciphertext)
+    return tag.digest()
+
+
+def decapsulate_batch(ciphertexts):
+    """
+    Session keys for a batch of KEM ciphertexts (a ValueError in place of a malformed one)
+    """
+    results = []
+    for ciphertext in ciphertexts:
+        try:
+            results.append(session_key(_worker_kyber.decapsulate(ciphertext, _worker_secret)))
+        except ValueError as error:
+            results.append(error)
+    return results
+
+
+def encrypt_batch(items):
+    """
+    Seal a batch of (key, sequence) items. All items of one key are encrypted in one CTR call
+    under a fresh nonce, each at its own offset. Returns (nonce, offset, length, ciphertext,
+    tag) per item, or a ValueError for a sequence with characters that are not IUPAC codes.
+    """
+    util = dna_utils()
+    results = [None] * len(items)
+    groups = {} # key -> indices of its items
+    plaintexts = {}
+    for index, (key, sequence) in enumerate(items):
+        try:
+            packed, exceptions, lowercase = util.pack_with_side_table(sequence)
+        except KeyError as error:
+            results[index] = ValueError(f"invalid base {error}")
+            continue
+        except UnicodeEncodeError as error: # Non-ASCII character: report it like any other base
+            results[index] = ValueError(f"invalid base {error.object[error.start]!r}")
+            continue
+        side = SideTable()
+        side.add(0, 0, exceptions, lowercase)
+        plaintexts[index] = packed.tobytes() + (side.encode() if len(side) else b'')
+        groups.setdefault(key, []).append(index)
+
+    for key, indices in groups.items():
+        ctr = CTRMode(key)
+        stream = b''.join(plaintexts[index] for index in indices)
+        ciphertext = ctr.process(stream, 0).tobytes()
+        offset = 0
+        for index in indices:
+            size = len(plaintexts[index])
+            sealed = ciphertext[offset:offset + size]
+            length = len(items[index][1])
+            results[index] = (ctr.nonce, offset, length, sealed, seal_tag(key, ctr.nonce, offset, length, sealed))
+            offset += size
+    return results
+
+
+def decrypt_batch(items):
+    """
+    Open a batch of (key, nonce, offset, length, ciphertext, tag) items. Returns the sequence
+    per item, or a ValueError when the tag does not match or the data is malformed.
+    """
+    results = []
+    for key, nonce, offset, length, ciphertext, tag in items:
+        try:
+            if not hmac.compare_digest(seal_tag(key, nonce, offset, length, ciphertext), tag):
+                raise ValueError("authentication failed")
+            plaintext = CTRMode(key, nonce).process(ciphertext, offset)
+            packed_size = (length + 3) // 4
+            if len(plaintext) < packed_size:
+                raise ValueError("ciphertext shorter than the sequence")
+            bases = UNPACK_ASCII[plaintext[:packed_size]].view(np.uint8)[:length].copy()
+            if len(plaintext) > packed_size:
+                SideTable.decode(plaintext[packed_size:].tobytes()).restore(0, 0, bases)
+            results.append(bases.tobytes().decode('ascii'))
+        except Exception as error: # Authenticated but malformed (e.g. a broken side table)
+            results.append(error if isinstance(error, ValueError) else ValueError(f"malformed sealed sequence: {error}"))
+    return results
+
+
+# ===================== EVENT LOOP SIDE =====================
+
+class MicroBatcher:
+    """
+    Collect items submitted from the event loop into batches: a batch is sent when `max_batch`
+    items wait or `window` seconds after its first item, as one `function(items)` call on
+    `executor`. The call returns one result per item; an exception instance fails that item only.
+    """
+    def __init__(self, name, function, executor, window=0.002, max_batch=64):
+        self.name = name
+        self.function = function
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self._items = []
+        self._futures = []
+        self._timer = None
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self._items.append(item)
+        self._futures.append(future)
+        if len(self._items) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, futures = self._items, self._futures
+        self._items, self._futures = [], []
+        if items:
+            asyncio.ensure_future(self._run(items, futures))
+
+    async def _run(self, items, futures):
+        instrument.count(f'{self.name}_batches')
+        instrument.count(f'{self.name}_items', len(items))
+        started = time.perf_counter()
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self.function, items)
+        except Exception as error: # The whole batch failed (e.g. a worker process died)
+            results = [error] * len(items)
+        instrument.add_time(f'batch.{self.name}', time.perf_counter() - started)
+        for future, result in zip(futures, results):
+            if future.done(): # The client went away
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class SessionStore:
+    """
+    Session keys by session id, evicted least recently used beyond `maxsize` and expiring `ttl`
+    seconds after they were opened
+    """
+    def __init__(self, maxsize=100_000, ttl=3600.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._sessions = OrderedDict() # session id -> (key, expiry time)
+        self._lock = threading.Lock()
+
+    def open(self, key):
+        session = os.urandom(16).hex()
+        with self._lock:
+            self._sessions[session] = (key, self.clock() + self.ttl)
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session):
+        with self._lock:
+            entry = self._sessions.get(session)
+            if entry is None or entry[1] <= self.clock():
+                self._sessions.pop(session, None)
+                raise HTTPError(404, "unknown or expired session")
+            self._sessions.move_to_end(session)
+            return entry[0]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class EncryptionService:
+    """
+    The HTTP front end: routes requests to the batchers and answers in JSON.
+    `executor` runs the batch functions; its workers must be set up with `_init_worker`.
+    """
+    def __init__(self, kyber, public_key, executor, window=0.002, max_batch=64, sessions=None):
+        self.kyber = kyber
+        self.public_key = public_key
+        self.sessions = SessionStore() if sessions is None else sessions
+        self.batchers = {name: MicroBatcher(name, function, executor, window, max_batch)
+                         for name, function in (('kem', decapsulate_batch), ('encrypt', encrypt_batch),
+                                                ('decrypt', decrypt_batch))}
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/kem/public-key'): self.get_public_key,
+            ('POST', '/kem/session'): self.open_session,
+            ('POST', '/encrypt'): self.encrypt,
+            ('POST', '/decrypt'): self.decrypt,
+            ('GET', '/metrics'): self.metrics,
+        }
+
+    async def health(self, body):
+        return {'status': 'ok', 'cipher': ciphers.selection()['backend'], 'sessions': len(self.sessions)}
+
+    async def get_public_key(self, body):
+        return {'params': self.kyber.params, 'public_key': _encode(self.public_key)}
+
+    async def open_session(self, body):
+        request = _parse(body)
+        key = await self._batched('kem', _field(request, 'ciphertext'))
+        return {'session': self.sessions.open(key)}
+
+    async def encrypt(self, body):
+        request = _parse(body)
+        key = self.sessions.get(_text(request, 'session'))
+        nonce, offset, length, ciphertext, tag = await self._batched('encrypt', (key, _text(request, 'sequence')))
+        return {'nonce': _encode(nonce), 'offset': offset, 'length': length,
+                'ciphertext': _encode(ciphertext), 'tag': _encode(tag)}
+
+    async def decrypt(self, body):
+        request = _parse(body)
+        key = self.sessions.get(_text(request, 'session'))
+        item = (key, _field(request, 'nonce'), _integer(request, 'offset'), _integer(request, 'length'),
+                _field(request, 'ciphertext'), _field(request, 'tag'))
+        return {'sequence': await self._batched('decrypt', item)}
+
+    async def metrics(self, body):
+        active = instrument.active()
+        if active is None:
+            raise HTTPError(404, "metrics are disabled")
+        return active.prometheus_text()
+
+    async def _batched(self, name, item):
+        try:
+            return await self.batchers[name].submit(item)
+        except ValueError as error:
+            raise HTTPError(400, str(error))
+
+    async def handle(self, reader, writer):
+        """
+        Serve the requests of one connection (HTTP/1.1 keep-alive)
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = await self._respond(request_line, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request_line, reader, writer):
+        # Read one request and write its response; returns False when the connection should close
+        started = time.perf_counter()
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            writer.write(_response(400, {'error': "malformed request line"}, False))
+            return False
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+        length = headers.get('content-length', '') or '0'
+        if not (length.isascii() and length.isdigit()):
+            # Without a valid length the body cannot be framed, so the connection is closed
+            writer.write(_response(400, {'error': "invalid Content-Length"}, False))
+            return False
+        length = int(length)
+        if length > MAX_BODY:
+            writer.write(_response(413, {'error': f"request body over {MAX_BODY} bytes"}, False))
+            return False
+        body = await reader.readexactly(length) if length else b''
+
+        path = target.split('?', 1)[0]
+        if method == 'OPTIONS': # CORS preflight from the web frontend
+            writer.write(_response(204, None, keep_alive))
+            return keep_alive
+        handler = self.routes.get((method, path))
+        try:
+            if handler is None:
+                status = 405 if any(route[1] == path for route in self.routes) else 404
+                raise HTTPError(status, f"no route for {method} {path}")
+            status, payload = 200, await handler(body)
+        except HTTPError as error:
+            status, payload = error.status, {'error': str(error)}
+        except Exception as error: # Keep serving; report the failure to the client
+            status, payload = 500, {'error': f"{type(error).__name__}: {error}"}
+        writer.write(_response(status, payload, keep_alive))
+        instrument.count('requests')
+        instrument.count(f'responses_{status}')
+        instrument.add_time(f'request.{path.strip("/").replace("/", ".") or "root"}', time.perf_counter() - started)
+        return keep_alive
+
+
+def _response(status, payload, keep_alive):
+    # Serialize a response with a JSON (or, for a str payload, plain text) body
+    if payload is None:
+        body, content_type = b'', 'application/json'
+    elif isinstance(payload, str):
+        body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+    else:
+        body, content_type = json.dumps(payload).encode(), 'application/json'
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            "Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+            "Access-Control-Allow-Headers: Content-Type\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + body
+
+
+def _parse(body):
+    try:
+        request = json.loads(body)
+    except ValueError:
+        raise HTTPError(400, "request body is not valid JSON")
+    if not isinstance(request, dict):
+        raise HTTPError(400, "request body must be a JSON object")
+    return request
+
+
+def _text(request, name):
+    value = request.get(name)
+    if not isinstance(value, str):
+        raise HTTPError(400, f"missing string field {name!r}")
+    return value
+
+
+def _integer(request, name):
+    value = request.get(name)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise HTTPError(400, f"missing non-negative integer field {name!r}")
+    return value
+
+
+def _field(request, name):
+    # Base64 field as bytes
+    try:
+        return base64.b64decode(_text(request, name), validate=True)
+    except ValueError:
+        raise HTTPError(400, f"field {name!r} is not valid base64")
+
+
+def _encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+async def serve(host='127.0.0.1', port=8080, workers=None, threads=False, window=0.002, max_batch=64,
+                params='kyber768', ready=None):
+    """
+    Generate the server key pair, start the worker pool and serve until cancelled or SIGTERM,
+    then shut the pool down. `ready` (an asyncio.Event or threading.Event) is set once the
+    socket listens.
+    """
+    ciphers.selection() # Choose the cipher backend before the workers start
+    kyber = ModuleKyber(params)
+    pk, secret = kyber.keygen()
+    # Threads share the selection of this process; processes repeat it without the timing run
+    init_args = (params, secret, None if threads else ciphers.selection()['backend'])
+    pool = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    with pool(workers or os.cpu_count(), initializer=_init_worker, initargs=init_args) as executor:
+        service = EncryptionService(kyber, kyber.encode_public_key(pk), executor, window, max_batch)
+        server = await asyncio.start_server(service.handle, host, port)
+        stop = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        except (NotImplementedError, RuntimeError): # No signal handlers on this platform or off the main thread
+            pass
+        async with server:
+            if ready is not None:
+                ready.set()
+            await stop.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DNAVault HTTP encryption service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, help="worker pool size (default: CPU count)")
+    parser.add_argument('--threads', action='store_true', help="use a thread pool instead of processes")
+    parser.add_argument('--window-ms', type=float, default=2.0, help="micro-batch collection window")
+    parser.add_argument('--max-batch', type=int, default=64, help="largest micro-batch")
+    parser.add_argument('--kyber', default='kyber768', choices=sorted(KYBER_PARAMS), help="Kyber parameter set")
+    parser.add_argument('--cipher', choices=list(ciphers.BACKENDS),
+                        help="AES backend (default: $DNAVAULT_CIPHER or the fastest that passes its self-test)")
+    args = parser.parse_args(argv)
+
+    instrument.enable()
+    ciphers.select(args.cipher)
+    print(f"Cipher backend: {ciphers.describe()}")
+    print(f"Serving on http://{args.host}:{args.port} "
+          f"(window {args.window_ms} ms, max batch {args.max_batch})", flush=True)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.threads, args.window_ms / 1e3,
+                          args.max_batch, args.kyber))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# SIDE TABLE FOR NON-ACGT BASES
+
+import struct
+import zlib
+
+import numpy as np
+
+from backend.dna_utils import restore_runs
+
+"""
+Run-length table of the bases the 2-bit stream cannot represent, for a whole container.
+
+Every record keeps one 2-bit code per base (exceptions are packed as 'A'), so base positions
+and random access do not change. The table lists, per record:
+- exception runs: start, length and IUPAC code of each run of one ambiguity code ('N' gaps)
+- lowercase runs: start and length of each soft-masked run
+
+A megabase 'N' gap or a soft-masked repeat is a single row, so assemblies stay at about
+2 bits per base. Runs are sorted by record and position.
+
+Serialized form: run counts (u64 each), then the zlib-compressed columns of both tables as
+u64 arrays, with records and starts delta coded (record step, gap since the end of the
+previous run of the same record), which takes a few bytes per run.
+The container encrypts it at the end of the payload CTR stream, where the chunk MACs cover it,
+and points to it from the b'SIDE' header section (POINTER).
+"""
+
+SIDE_SECTION = b'SIDE'
+POINTER = struct.Struct('<QQQ') # CTR stream offset, payload offset, size of the encrypted table
+COUNTS = struct.Struct('<QQ')
+
+EXCEPTION_DTYPE = np.dtype([('record', '<u4'), ('start', '<u8'), ('length', '<u8'), ('base', 'u1')])
+MASK_DTYPE = np.dtype([('record', '<u4'), ('start', '<u8'), ('length', '<u8')])
+
+
+class SideTable:
+    """
+    Exception and lowercase runs of every record, filled piece by piece while encrypting
+    """
+    def __init__(self, exceptions=None, lowercase=None):
+        self._exceptions = [] if exceptions is None else [exceptions]
+        self._lowercase = [] if lowercase is None else [lowercase]
+
+    def add(self, record, start, exceptions, lowercase):
+        """
+        Add the runs returned by `dna_utils.pack_with_side_table` for the bases of `record`
+        starting at `start`. Pieces must be added in order; a run that continues across
+        pieces is merged into one row.
+        """
+        _append(self._exceptions, EXCEPTION_DTYPE, record, start, exceptions)
+        _append(self._lowercase, MASK_DTYPE, record, start, lowercase)
+
+    @property
+    def exceptions(self):
+        return _collapse(self._exceptions, EXCEPTION_DTYPE)
+
+    @property
+    def lowercase(self):
+        return _collapse(self._lowercase, MASK_DTYPE)
+
+    def __len__(self):
+        return sum(len(part) for part in self._exceptions + self._lowercase)
+
+    def encode(self):
+        exceptions, lowercase = self.exceptions, self.lowercase
+        columns = _delta_columns(exceptions) + _delta_columns(lowercase)
+        return COUNTS.pack(len(exceptions), len(lowercase)) + zlib.compress(b''.join(columns))
+
+    @classmethod
+    def decode(cls, data):
+        counts = COUNTS.unpack_from(data, 0)
+        columns = np.frombuffer(zlib.decompress(data[COUNTS.size:]), dtype='<u8').astype(np.int64)
+        tables = []
+        for dtype, count in zip((EXCEPTION_DTYPE, MASK_DTYPE), counts):
+            tables.append(_from_delta_columns(dtype, columns[:count * len(dtype.names)].reshape(len(dtype.names), count)))
+            columns = columns[count * len(dtype.names):]
+        return cls(*tables)
+
+    def restore(self, record, start, bases):
+        """
+        Apply the runs of `record` to `bases`, a writable uint8 array of the unpacked ASCII
+        bases [start, start + len(bases)) of the record
+        """
+        end = start + len(bases)
+        exceptions, lowercase = (_overlapping(table, record, start, end) for table in (self.exceptions, self.lowercase))
+        if len(exceptions) or len(lowercase):
+            restore_runs(bases, start, exceptions, lowercase)
+        return bases
+
+
+def _append(parts, dtype, record, start, runs):
+    # Add relative runs as absolute rows, merging the first one into the previous row if it continues it
+    if not len(runs):
+        return
+    table = np.zeros(len(runs), dtype=dtype)
+    table['record'] = record
+    table['start'] = runs['start'] + np.uint64(start)
+    table['length'] = runs['length']
+    if 'base' in dtype.names:
+        table['base'] = runs['base']
+    if parts and len(parts[-1]):
+        previous = parts[-1]
+        if (previous['record'][-1] == record and previous['start'][-1] + previous['length'][-1] == table['start'][0]
+                and ('base' not in dtype.names or previous['base'][-1] == table['base'][0])):
+            previous['length'][-1] += table['length'][0]
+            table = table[1:]
+    if len(table):
+        parts.append(table)
+
+
+def _collapse(parts, dtype):
+    # Concatenate the added pieces once and keep the result
+    if len(parts) != 1:
+        parts[:] = [np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)]
+    return parts[0]
+
+
+def _delta_columns(table):
+    # Columns of a run table as u64 bytes; records as steps and starts as gaps after the previous run
+    records = table['record'].astype(np.int64)
+    starts = table['start'].astype(np.int64)
+    previous_end = np.concatenate(([0], (starts + table['length'])[:-1])).astype(np.int64)
+    previous_end[_record_heads(records)] = 0
+    columns = [np.diff(records, prepend=0), starts - previous_end] + [table[name] for name in table.dtype.names[2:]]
+    return [np.asarray(column).astype('<u8').tobytes() for column in columns]
+
+
+def _from_delta_columns(dtype, columns):
+    records = np.cumsum(columns[0])
+    gaps, lengths = columns[1], columns[2]
+    heads = _record_heads(records)
+    # start[i] = start[i - 1] + length[i - 1] + gap[i] within a record, gap[i] on its first run
+    steps = gaps + np.concatenate(([0], lengths[:-1])) * ~heads
+    totals = np.cumsum(steps)
+    head = np.maximum.accumulate(np.where(heads, np.arange(len(records)), 0))
+    table = np.zeros(len(records), dtype=dtype)
+    table['record'], table['start'], table['length'] = records, totals - (totals - steps)[head], lengths
+    for name, column in zip(dtype.names[3:], columns[3:]):
+        table[name] = column
+    return table
+
+
+def _record_heads(records):
+    # True on the first run of every record
+    return np.concatenate(([True], records[1:] != records[:-1])) if len(records) else np.zeros(0, dtype=bool)
+
+
+def _overlapping(table, record, start, end):
+    # Rows of `record` that overlap the bases [start, end)
+    low, high = np.searchsorted(table['record'], [record, record + 1])
+    rows = table[low:high]
+    first = np.searchsorted(rows['start'] + rows['length'], start, side='right')
+    last = np.searchsorted(rows['start'], end, side='left')
+    return rows[first:last]
@@ -0,0 +1,6 @@
+# DNAVault benchmark suite: microbenchmarks (bench.micro) and end-to-end runs (bench.e2e).
+# Run with `python -m bench run`; see bench/__main__.py for the commands.
+# bench/load.py is the load generator for the HTTP service (`python -m bench.load`).
+
+from bench.core import BENCHMARKS, benchmark, measure, run, compare
+from bench import micro, e2e # Register the benchmarks
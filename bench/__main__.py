@@ -0,0 +1,54 @@
+# Command line for the benchmark suite:
+#   python -m bench run [--filter NAME ...] [--length N] [--records N] [--output results.json]
+#   python -m bench compare baseline.json current.json [--threshold 0.10]
+#   python -m bench list
+
+import argparse
+import sys
+
+from bench import core
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description="DNAVault benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="run benchmarks and write a JSON result file")
+    run.add_argument('--filter', nargs='*', help="only benchmarks whose name contains one of these")
+    run.add_argument('--length', type=int, default=core.DEFAULT_CONFIG['length'], help="bases per synthetic sequence")
+    run.add_argument('--records', type=int, default=core.DEFAULT_CONFIG['records'], help="synthetic sequences per run")
+    run.add_argument('--min-time', type=float, default=core.DEFAULT_CONFIG['min_time'], help="seconds per benchmark")
+    run.add_argument('--output', default='bench_results.json', help="result file")
+
+    compare = commands.add_parser('compare', help="compare two result files and flag regressions")
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=0.10, help="allowed ops/s drop (fraction)")
+
+    commands.add_parser('list', help="list the registered benchmarks")
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for name in core.select():
+            print(f"{core.BENCHMARKS[name][0]:<6} {name}")
+        return 0
+
+    if args.command == 'run':
+        names = core.select(args.filter)
+        config = {'length': args.length, 'records': args.records, 'min_time': args.min_time}
+        document = core.run(names, config)
+        core.save(document, args.output)
+        print(f"Wrote {len(names)} results to {args.output}")
+        return 0
+
+    rows = core.compare(core.load(args.baseline), core.load(args.current), args.threshold)
+    for name, before, after, change, regressed in rows:
+        flag = 'REGRESSION' if regressed else ''
+        print(f"{name:<40} {before:12.1f} -> {after:12.1f} ops/s  {change:+8.1%}  {flag}")
+    regressions = sum(row[4] for row in rows)
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+# BENCHMARK HARNESS
+
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+"""
+Timing harness, registry and result files for the benchmark suite.
+
+A benchmark is a setup function registered with `@benchmark(name, group)`. It receives the run
+configuration and returns (operation, bytes per operation); the harness then times single
+calls of the operation until `min_time` has passed and reports ops/s, MB/s (when the
+operation processes data), mean and p50/p99 latency. A setup may return a third item, a
+function called after timing that returns extra result fields (e.g. the compression 'ratio').
+A setup raises OSError when what it measures is not available here (e.g. no libcrypto); the
+benchmark is then skipped.
+"""
+
+BENCHMARKS = {} # name -> (group, setup function)
+
+DEFAULT_CONFIG = {
+    'length': 1 << 20, # Bases per synthetic sequence in end-to-end runs
+    'records': 4, # Synthetic sequences per end-to-end run
+    'min_time': 0.5, # Seconds spent timing each benchmark
+    'min_rounds': 5,
+}
+
+
+def benchmark(name, group):
+    """
+    Register a setup function: setup(config) -> (operation, bytes per operation[, extra fields])
+    """
+    def register(setup):
+        BENCHMARKS[name] = (group, setup)
+        return setup
+    return register
+
+
+def measure(operation, nbytes=0, min_time=0.5, min_rounds=5, max_rounds=1_000_000):
+    """
+    Time repeated calls of `operation` and summarize their latencies
+    """
+    operation() # Warm-up (caches, lazy tables)
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_rounds:
+        before = time.perf_counter()
+        operation()
+        after = time.perf_counter()
+        latencies.append(after - before)
+        if after - started >= min_time and len(latencies) >= min_rounds:
+            break
+
+    latencies = np.array(latencies)
+    total = latencies.sum()
+    result = {
+        'rounds': len(latencies),
+        'ops_per_s': len(latencies) / total,
+        'mean_us': latencies.mean() * 1e6,
+        'p50_us': np.percentile(latencies, 50) * 1e6,
+        'p99_us': np.percentile(latencies, 99) * 1e6,
+    }
+    if nbytes:
+        result['mb_per_s'] = nbytes * len(latencies) / total / 1e6
+    return result
+
+
+def select(patterns=None):
+    """
+    Names of the registered benchmarks matching any of the substrings in `patterns` (all by default)
+    """
+    return [name for name in BENCHMARKS if not patterns or any(pattern in name for pattern in patterns)]
+
+
+def run(names, config=None, report=print):
+    """
+    Run the named benchmarks and return the result document
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    results = {}
+    for name in names:
+        group, setup = BENCHMARKS[name]
+        try:
+            operation, nbytes, *extra = setup(config)
+        except OSError as error:
+            if report:
+                report(f"{name:<40} skipped: {error}")
+            continue
+        result = measure(operation, nbytes, config['min_time'], config['min_rounds'])
+        results[name] = {'group': group, **result, **(extra[0]() if extra else {})}
+        if report:
+            report(format_result(name, results[name]))
+    return {'meta': environment(config), 'results': results}
+
+
+def environment(config):
+    """
+    Machine and run description stored with every result file
+    """
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': config,
+    }
+
+
+def format_result(name, result):
+    throughput = f"{result['mb_per_s']:10.3f} MB/s" if 'mb_per_s' in result else ' ' * 15
+    ratio = f"  ratio {result['ratio']:6.2f}" if 'ratio' in result else ''
+    return (f"{name:<40} {result['ops_per_s']:12.1f} ops/s {throughput}{ratio}"
+            f"  p50 {result['p50_us']:10.1f} us  p99 {result['p99_us']:10.1f} us")
+
+
+def save(document, path):
+    with open(path, 'w') as file:
+        json.dump(document, file, indent=2)
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    Compare two result documents. A benchmark regresses when its ops/s drops by more than
+    `threshold` (a fraction) against the baseline. Returns a list of
+    (name, baseline ops/s, current ops/s, change, regressed) for benchmarks present in both.
+    """
+    rows = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['ops_per_s']
+        after = result['ops_per_s']
+        change = after / before - 1
+        rows.append((name, before, after, change, change < -threshold))
+    return rows
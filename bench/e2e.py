@@ -0,0 +1,140 @@
+# END-TO-END BENCHMARKS
+
+import atexit
+import os
+import shutil
+import tempfile
+
+from bench.core import benchmark
+from bench.micro import KEY, synthetic_dna, repetitive_dna
+
+"""
+End-to-end benchmarks over synthetic sequences: `records` sequences of `length` bases each
+(see DEFAULT_CONFIG, or --length / --records on the command line). Throughput is reported in
+bases processed (1 byte per base). The e2e.encrypt.<codec> runs compress a repetitive input and
+report the compression ratio (packed bytes / stored payload bytes). The e2e.encrypt.reads runs
+cut the same number of bases into 150-base FASTQ reads and store them as single records or as
+one batch, recording the container size.
+"""
+
+READ_LENGTH = 150
+
+
+def _temp_directory():
+    # Temporary directory that lives as long as the process and is removed at exit
+    directory = tempfile.mkdtemp(prefix='dnavault-bench-')
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    return directory
+
+
+def _write_fasta(config, generator=synthetic_dna):
+    # Synthetic FASTA input in a temporary directory (see `_temp_directory`)
+    directory = _temp_directory()
+    path = os.path.join(directory, 'input.fa')
+    with open(path, 'wb') as file:
+        for record in range(config['records']):
+            file.write(b'>seq%d\n' % record)
+            sequence = generator(config['length'], seed=record)
+            for i in range(0, len(sequence), 80):
+                file.write(sequence[i:i + 80] + b'\n')
+    return directory, path, config['records'] * config['length']
+
+
+def _write_fastq(config):
+    # The synthetic bases of `_write_fasta` as short FASTQ reads
+    directory = _temp_directory()
+    path = os.path.join(directory, 'input.fq')
+    quality = b'I' * READ_LENGTH
+    with open(path, 'wb') as file:
+        for record in range(config['records']):
+            sequence = synthetic_dna(config['length'], seed=record)
+            for i in range(0, len(sequence), READ_LENGTH):
+                read = sequence[i:i + READ_LENGTH]
+                file.write(b'@seq%d.%d\n%s\n+\n%s\n' % (record, i, read, quality[:len(read)]))
+    return directory, path, config['records'] * config['length']
+
+
+def _encrypt_reads(batch):
+    @benchmark('e2e.encrypt.reads' + ('.batch' if batch else ''), 'e2e')
+    def _(config):
+        from backend.main import encrypt_file
+        directory, path, bases = _write_fastq(config)
+        output = os.path.join(directory, 'output.dnav')
+        return (lambda: encrypt_file(path, output, KEY, batch=batch), bases,
+                lambda: {'container_bytes': os.path.getsize(output)})
+
+
+for _batch in (False, True):
+    _encrypt_reads(_batch)
+
+
+@benchmark('e2e.encrypt', 'e2e')
+def _(config):
+    from backend.main import encrypt_file
+    directory, path, bases = _write_fasta(config)
+    output = os.path.join(directory, 'output.dnav')
+    return lambda: encrypt_file(path, output, KEY), bases
+
+
+def _encrypt_compressed(codec):
+    @benchmark(f'e2e.encrypt.{codec}', 'e2e')
+    def _(config):
+        from backend.main import encrypt_file
+        from backend.container import ContainerReader
+        directory, path, bases = _write_fasta(config, repetitive_dna)
+        output = os.path.join(directory, 'output.dnav')
+
+        def ratio():
+            with ContainerReader(output) as reader:
+                return {'ratio': int(reader.streams['size'].sum()) / len(reader.payload)}
+        return lambda: encrypt_file(path, output, KEY, codec=codec), bases, ratio
+
+
+for _codec in ('none', 'zlib', 'lzma'):
+    _encrypt_compressed(_codec)
+
+
+@benchmark('e2e.verify', 'e2e')
+def _(config):
+    from backend.main import encrypt_file
+    from backend.container import ContainerReader
+    directory, path, bases = _write_fasta(config)
+    output = os.path.join(directory, 'output.dnav')
+    encrypt_file(path, output, KEY)
+
+    def verify():
+        with ContainerReader(output) as reader:
+            return reader.verify(KEY)
+    return verify, bases
+
+
+@benchmark('e2e.decrypt', 'e2e')
+def _(config):
+    from backend.main import encrypt_file
+    from backend.container import ContainerReader
+    from backend.dna_utils import dna_utils
+    util = dna_utils()
+    directory, path, bases = _write_fasta(config)
+    output = os.path.join(directory, 'output.dnav')
+    encrypt_file(path, output, KEY)
+
+    def decrypt():
+        with ContainerReader(output) as reader:
+            for index in range(len(reader)):
+                util.unpack(reader.decrypt_record(index, KEY), int(reader.records[index]['length']))
+    return decrypt, bases
+
+
+@benchmark('e2e.read_region', 'e2e')
+def _(config):
+    from backend.main import encrypt_file
+    from backend.container import ContainerReader
+    directory, path, _ = _write_fasta(config)
+    output = os.path.join(directory, 'output.dnav')
+    encrypt_file(path, output, KEY)
+    middle = config['length'] // 2
+
+    def read_region():
+        with ContainerReader(output) as reader:
+            return reader.read_region(0, middle, middle + 1000, KEY, verify=True)
+    return read_region, 1000
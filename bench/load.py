@@ -0,0 +1,207 @@
+# LOAD GENERATOR FOR THE HTTP SERVICE
+#   python -m bench.load [--url http://127.0.0.1:8080] [--connections 64] [--duration 10]
+#                        [--operation encrypt|roundtrip|session] [--bases 1000] [--spawn]
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from bench.micro import synthetic_dna
+
+"""
+Closed-loop load generator for backend/service.py (stdlib asyncio, keep-alive connections).
+
+Every connection opens its own session (Kyber encapsulation to the server's public key, then
+POST /kem/session) and then sends requests back to back for `duration` seconds:
+- encrypt: POST /encrypt of a random sequence of `bases` bases
+- roundtrip: /encrypt followed by /decrypt of the result, checked against the input
+- session: the key exchange alone
+
+Reports requests/s and the p50 / p99 / max latency of every request; with --output the
+numbers are also written as JSON. --spawn starts a local service for the run.
+"""
+
+
+class Connection:
+    """
+    One keep-alive HTTP/1.1 connection sending JSON requests
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = b'' if payload is None else json.dumps(payload).encode()
+        self.writer.write((f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                           f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode() + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        data = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, json.loads(data) if data and 'json' in headers.get('content-type', '') else data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def open_session(connection, kyber):
+    # Key exchange: encapsulate to the server key and register the ciphertext
+    status, reply = await connection.request('GET', '/kem/public-key')
+    _check(status, reply)
+    ciphertext, _, _ = kyber.encapsulate(base64.b64decode(reply['public_key']))
+    status, reply = await connection.request('POST', '/kem/session', {'ciphertext': base64.b64encode(ciphertext).decode()})
+    _check(status, reply)
+    return reply['session']
+
+
+def _check(status, reply):
+    if status != 200:
+        raise RuntimeError(f"HTTP {status}: {reply}")
+
+
+async def _client(host, port, operation, sequences, deadline, latencies, errors, kyber):
+    connection = Connection(host, port)
+    try:
+        session = await open_session(connection, kyber)
+        turn = 0
+        while time.perf_counter() < deadline:
+            sequence = sequences[turn % len(sequences)]
+            turn += 1
+            try:
+                if operation == 'session':
+                    started = time.perf_counter()
+                    await open_session(connection, kyber)
+                    latencies.append(time.perf_counter() - started)
+                    continue
+                started = time.perf_counter()
+                status, sealed = await connection.request('POST', '/encrypt', {'session': session, 'sequence': sequence})
+                latencies.append(time.perf_counter() - started)
+                _check(status, sealed)
+                if operation == 'roundtrip':
+                    started = time.perf_counter()
+                    status, reply = await connection.request('POST', '/decrypt', {'session': session, **sealed})
+                    latencies.append(time.perf_counter() - started)
+                    _check(status, reply)
+                    if reply['sequence'] != sequence:
+                        raise RuntimeError("decrypted sequence differs from the input")
+            except (RuntimeError, ConnectionError, asyncio.IncompleteReadError) as error:
+                errors.append(str(error))
+                connection.close()
+    finally:
+        connection.close()
+
+
+async def run_load(url, connections=64, duration=10.0, operation='encrypt', bases=1000, params='kyber768'):
+    """
+    Drive the service at `url` with `connections` concurrent clients for `duration` seconds.
+    Returns the summary dictionary.
+    """
+    from backend.kyber import ModuleKyber
+    parts = urlsplit(url)
+    host, port = parts.hostname or '127.0.0.1', parts.port or 80
+    kyber = ModuleKyber(params)
+    sequences = [synthetic_dna(bases, seed=seed).decode() for seed in range(16)]
+    latencies, errors = [], []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(_client(host, port, operation, sequences, deadline, latencies, errors, kyber)
+                           for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        'operation': operation,
+        'connections': connections,
+        'bases': bases,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': elapsed,
+        'requests_per_s': len(latencies) / elapsed,
+        'p50_ms': np.percentile(latencies, 50) * 1e3,
+        'p99_ms': np.percentile(latencies, 99) * 1e3,
+        'max_ms': latencies.max() * 1e3,
+        'first_error': errors[0] if errors else None,
+    }
+
+
+async def _wait_ready(host, port, timeout=60.0):
+    # Poll /health until the spawned service answers
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            connection = Connection(host, port)
+            status, _ = await connection.request('GET', '/health')
+            connection.close()
+            if status == 200:
+                return
+        except OSError:
+            pass
+        if time.perf_counter() > deadline:
+            raise RuntimeError("service did not start")
+        await asyncio.sleep(0.2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.load', description="Load test the DNAVault HTTP service")
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--connections', type=int, default=64, help="concurrent clients")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds")
+    parser.add_argument('--operation', default='encrypt', choices=['encrypt', 'roundtrip', 'session'])
+    parser.add_argument('--bases', type=int, default=1000, help="bases per sequence")
+    parser.add_argument('--kyber', default='kyber768')
+    parser.add_argument('--spawn', nargs=argparse.REMAINDER, metavar='SERVICE_ARGS',
+                        help="start `python -m backend.service` on the URL's port first (remaining arguments are passed on)")
+    parser.add_argument('--output', help="write the summary as JSON")
+    args = parser.parse_args(argv)
+
+    service = None
+    if args.spawn is not None:
+        parts = urlsplit(args.url)
+        service = subprocess.Popen([sys.executable, '-m', 'backend.service', '--host', parts.hostname,
+                                    '--port', str(parts.port), '--kyber', args.kyber, *args.spawn],
+                                   stdout=subprocess.DEVNULL,
+                                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        if service is not None:
+            parts = urlsplit(args.url)
+            asyncio.run(_wait_ready(parts.hostname, parts.port))
+        summary = asyncio.run(run_load(args.url, args.connections, args.duration, args.operation, args.bases, args.kyber))
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+
+    print(f"{summary['operation']}: {summary['requests']} requests in {summary['seconds']:.2f} s over "
+          f"{summary['connections']} connections ({summary['bases']} bases each)")
+    print(f"  {summary['requests_per_s']:.1f} req/s  p50 {summary['p50_ms']:.2f} ms  "
+          f"p99 {summary['p99_ms']:.2f} ms  max {summary['max_ms']:.2f} ms  errors {summary['errors']}")
+    if summary['first_error']:
+        print(f"  first error: {summary['first_error']}")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(summary, file, indent=2)
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
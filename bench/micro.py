@@ -0,0 +1,293 @@
+# MICROBENCHMARKS
+
+import numpy as np
+
+from bench.core import benchmark
+
+"""
+Microbenchmarks for the building blocks: the reference AES class, the integer engine, the
+cipher backends, Kyber and Module-Kyber, polynomial multiplication, the DNA codecs and payload
+compression.
+"""
+
+KEY = bytes(range(16))
+
+PLAINTEXT = np.array([
+    ['11101010', '00000100', '01100101', '10000101'],
+    ['10000011', '01000101', '01011101', '10010110'],
+    ['01011100', '00110011', '10011000', '10110000'],
+    ['11110000', '00101101', '10101101', '11000101']
+])
+
+
+def synthetic_dna(length, seed=0):
+    """
+    Random A/C/G/T bases as an ASCII bytes object
+    """
+    return np.frombuffer(b'ACGT', dtype=np.uint8)[np.random.default_rng(seed).integers(0, 4, length)].tobytes()
+
+
+def repetitive_dna(length, seed=0, unit=3000, mutation_rate=0.01):
+    """
+    Low-entropy stand-in for a real genome: a random `unit` of bases repeated with point
+    mutations at `mutation_rate`, as an ASCII bytes object
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.resize(rng.integers(0, 4, unit), length)
+    mutated = rng.random(length) < mutation_rate
+    codes[mutated] = rng.integers(0, 4, mutated.sum())
+    return np.frombuffer(b'ACGT', dtype=np.uint8)[codes].tobytes()
+
+
+# ===================== AES =====================
+
+def _fresh_import(name):
+    # Import `name` and the AES table module from scratch (already imported dependencies stay)
+    import importlib
+    import sys
+    for module in (name, 'backend.aes_tables'):
+        sys.modules.pop(module, None)
+    return importlib.import_module(name)
+
+
+@benchmark('aes.import', 'aes')
+def _(config):
+    return lambda: _fresh_import('backend.aes'), 0
+
+
+@benchmark('aes_tables.build', 'aes')
+def _(config):
+    from backend import aes_tables
+    return aes_tables.build_tables, 0
+
+
+@benchmark('aes.Encryption.construct', 'aes')
+def _(config):
+    from backend import aes
+    return lambda: aes.Encryption(PLAINTEXT), 0
+
+
+def _reference_aes():
+    from backend import aes
+    enc = aes.Encryption(PLAINTEXT)
+    initial_key = enc.list_of_round_keys[0]
+
+    def expand():
+        enc.list_of_round_keys = [initial_key]
+        for i in range(10):
+            enc.key_expansion(counter=i)
+    return enc, expand
+
+
+@benchmark('aes.Encryption.key_expansion', 'aes')
+def _(config):
+    _, expand = _reference_aes()
+    return expand, 0
+
+
+@benchmark('aes.Encryption.encrypt', 'aes')
+def _(config):
+    enc, expand = _reference_aes()
+
+    def encrypt():
+        expand()
+        return enc.encrypt()
+    return encrypt, 16
+
+
+@benchmark('aes.Encryption.decrypt', 'aes')
+def _(config):
+    enc, expand = _reference_aes()
+    expand()
+    ciphertext = enc.encrypt()
+    return lambda: enc.decrypt(ciphertext), 16
+
+
+@benchmark('aes_engine.key_expansion', 'aes')
+def _(config):
+    from backend.aes_engine import AESEngine
+    return lambda: AESEngine(KEY), 0
+
+
+@benchmark('aes_engine.encrypt_block', 'aes')
+def _(config):
+    from backend.aes_engine import AESEngine
+    engine = AESEngine(KEY)
+    return lambda: engine.encrypt_block(KEY), 16
+
+
+@benchmark('aes_engine.encrypt_blocks', 'aes')
+def _(config):
+    from backend.aes_engine import AESEngine
+    engine = AESEngine(KEY)
+    blocks = np.random.default_rng(0).integers(0, 256, (4096, 16), dtype=np.uint8)
+    return lambda: engine.encrypt_blocks(blocks), blocks.nbytes
+
+
+@benchmark('modes.ctr', 'aes')
+def _(config):
+    from backend.modes import CTRMode
+    ctr = CTRMode(KEY)
+    data = np.random.default_rng(0).integers(0, 256, 1 << 20, dtype=np.uint8)
+    return lambda: ctr.process(data), data.nbytes
+
+
+def _cipher_backend(name, blocks):
+    def context(config):
+        from backend import ciphers
+        return ciphers.BACKENDS[name]()(KEY) # OSError (benchmark skipped) when unavailable
+
+    @benchmark(f'ciphers.{name}.encrypt_blocks', 'aes')
+    def _(config):
+        cipher = context(config)
+        data = np.random.default_rng(0).integers(0, 256, (blocks, 16), dtype=np.uint8)
+        return lambda: cipher.encrypt_blocks(data), data.nbytes
+
+    if name != 'reference':
+        @benchmark(f'modes.ctr.{name}', 'aes')
+        def _(config):
+            from backend.modes import CTRMode
+            ctr = CTRMode(context(config))
+            data = np.random.default_rng(0).integers(0, 256, 1 << 20, dtype=np.uint8)
+            return lambda: ctr.process(data), data.nbytes
+
+
+for _name, _blocks in (('reference', 16), ('numpy', 4096), ('libcrypto', 4096)):
+    _cipher_backend(_name, _blocks)
+
+
+# ===================== KYBER =====================
+
+@benchmark('kyber.Kyber.keygen', 'kyber')
+def _(config):
+    from backend.kyber import Kyber
+    return Kyber().keygen, 0
+
+
+@benchmark('kyber.Kyber.encapsulate', 'kyber')
+def _(config):
+    from backend.kyber import Kyber
+    kyber = Kyber()
+    A, s, pk = kyber.keygen()
+    return lambda: kyber.encapsulate(pk, A), 0
+
+
+@benchmark('kyber.Kyber.decapsulate', 'kyber')
+def _(config):
+    from backend.kyber import Kyber
+    kyber = Kyber()
+    A, s, pk = kyber.keygen()
+    (u, v), _, _ = kyber.encapsulate(pk, A)
+    return lambda: kyber.decapsulate(u, v, s), 0
+
+
+@benchmark('kyber.Kyber.polyMul', 'kyber')
+def _(config):
+    from backend.kyber import Kyber
+    kyber = Kyber()
+    a, b = kyber.randomPoly(), kyber.randomPoly()
+    return lambda: kyber.polyMul(a, b), 0
+
+
+@benchmark('kyber.ntt.poly_mul', 'kyber')
+def _(config):
+    from backend import ntt
+    from backend.kyber import Kyber
+    kyber = Kyber()
+    a, b = kyber.randomPoly(), kyber.randomPoly()
+    return lambda: ntt.poly_mul(a, b), 0
+
+
+@benchmark('kyber.Kyber.polyMulConvolve', 'kyber')
+def _(config):
+    from backend.kyber import Kyber
+    kyber = Kyber()
+    a, b = kyber.randomPoly(), kyber.randomPoly()
+    return lambda: kyber.polyMulConvolve(a, b), 0
+
+
+@benchmark('kyber.ModuleKyber.keygen', 'kyber')
+def _(config):
+    from backend.kyber import ModuleKyber
+    return ModuleKyber().keygen, 0
+
+
+@benchmark('kyber.ModuleKyber.encapsulate', 'kyber')
+def _(config):
+    from backend.kyber import ModuleKyber
+    kyber = ModuleKyber()
+    public_key = kyber.encode_public_key(kyber.keygen()[0])
+    return lambda: kyber.encapsulate(public_key), 0
+
+
+@benchmark('kyber.ModuleKyber.decapsulate', 'kyber')
+def _(config):
+    from backend.kyber import ModuleKyber
+    kyber = ModuleKyber()
+    pk, s = kyber.keygen()
+    ciphertext, _, _ = kyber.encapsulate(pk)
+    return lambda: kyber.decapsulate(ciphertext, s), 0
+
+
+# ===================== DNA CODECS =====================
+
+@benchmark('dna_utils.encode', 'dna')
+def _(config):
+    from backend.dna_utils import dna_utils
+    util, sequence = dna_utils(), synthetic_dna(1 << 16)
+    return lambda: util.encode(sequence.decode()), len(sequence)
+
+
+@benchmark('dna_utils.decode', 'dna')
+def _(config):
+    from backend.dna_utils import dna_utils
+    util, sequence = dna_utils(), synthetic_dna(1 << 16)
+    matrices = util.encode(sequence.decode())
+    return lambda: util.decode(matrices, len(sequence)), len(sequence)
+
+
+@benchmark('dna_utils.pack', 'dna')
+def _(config):
+    from backend.dna_utils import dna_utils
+    util, sequence = dna_utils(), synthetic_dna(1 << 20)
+    return lambda: util.pack(sequence), len(sequence)
+
+
+@benchmark('dna_utils.pack_with_side_table', 'dna')
+def _(config):
+    from backend.dna_utils import dna_utils
+    util = dna_utils()
+    # Assembly-like input: a 100 kb 'N' gap and soft-masked runs every few kb
+    sequence = np.frombuffer(synthetic_dna(1 << 20), dtype=np.uint8).copy()
+    sequence[200_000:300_000] = ord('N')
+    for start in range(0, len(sequence), 4096):
+        sequence[start:start + 300] |= 0x20
+    sequence = sequence.tobytes()
+    return lambda: util.pack_with_side_table(sequence), len(sequence)
+
+
+@benchmark('dna_utils.unpack', 'dna')
+def _(config):
+    from backend.dna_utils import dna_utils
+    util, sequence = dna_utils(), synthetic_dna(1 << 20)
+    packed = util.pack(sequence)
+    return lambda: util.unpack(packed, len(sequence)), len(sequence)
+
+
+# ===================== COMPRESSION =====================
+
+def _compression(codec):
+    @benchmark(f'compression.{codec}', 'dna')
+    def _(config):
+        from backend import compression
+        from backend.dna_utils import dna_utils
+        packed = dna_utils().pack(repetitive_dna(1 << 20))
+        number = compression.CODECS[codec]
+        blocks = compression.compress_blocks(number, packed, compression.BLOCK_BYTES)
+        ratio = len(packed) / sum(len(data) for data, _ in blocks)
+        return (lambda: compression.compress_blocks(number, packed, compression.BLOCK_BYTES),
+                len(packed), lambda: {'ratio': ratio})
+
+
+for _codec in ('zlib', 'bz2', 'lzma'):
+    _compression(_codec)